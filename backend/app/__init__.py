@@ -4,4 +4,12 @@ __all__ = [
     "get_app",
 ]
 
-from .main import app as get_app  # re-export for convenience
+
+def __getattr__(name: str):
+    # The web app is built on first access, so importing the package for the
+    # CLI or an analytics worker process does not load FastAPI and the routers
+    if name == "get_app":
+        from .main import app
+
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
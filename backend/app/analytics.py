@@ -0,0 +1,508 @@
+"""Vectorized spending analytics.
+
+A user's transactions are loaded once into columnar NumPy arrays (day numbers,
+float64 amounts, integer category and merchant codes) and every insight is
+computed with whole-array operations: grouped sums, means and variances come
+from `np.bincount`, ordering from `np.lexsort`.
+
+Arrays and results are memoized per user in `insights_cache`, keyed by the
+user's transaction data version. Every `crud` mutation bumps that version
+inside its own transaction, so the next request after a committed change
+sees a new version and recomputes; nothing stale is ever served.
+
+`precompute_insights` fills the `UserInsights` table ahead of time for every
+user whose transactions changed since their stored result was computed,
+fanning the work out to a process pool. Requests use a stored result while
+its version is current and it was computed for the requested day. Insights
+are relative to that day, so a user whose data did not change is not
+recomputed when the date moves on; the date-relative figures are derived
+on demand by the first read for the new day instead.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from functools import partial
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+
+from . import archive, crud, database, search, sharding
+from .config import get_settings
+from .database import Database
+from .models import (
+    Category,
+    CategoryChange,
+    Insights,
+    RecurringMerchant,
+    RollingSpend,
+    SpendingAnomaly,
+    Transaction,
+    TransactionType,
+)
+
+settings = get_settings()
+
+ROLLING_WINDOWS = (7, 30)
+# A merchant is recurring when it was charged at least this often at a steady
+# cadence (low spread of the gaps) for a steady amount
+RECURRING_MIN_OCCURRENCES = 3
+RECURRING_MIN_CADENCE_DAYS = 5
+RECURRING_MAX_CADENCE_SPREAD = 0.35
+RECURRING_MAX_AMOUNT_SPREAD = 0.25
+# Expenses this many standard deviations above their category's log-amount
+# mean are anomalies; categories need enough history to have a norm
+ANOMALY_THRESHOLD = 3.0
+ANOMALY_MIN_CATEGORY_SIZE = 8
+ANOMALY_LOOKBACK_DAYS = 90
+
+# Label of transactions without a category (rows migrated from before the
+# category table can have none)
+UNCATEGORIZED = "Uncategorized"
+MAX_ANOMALIES = 20
+# Distinct as_of days kept per user
+RESULTS_PER_USER = 4
+
+_EPOCH = date(1970, 1, 1)
+
+
+@dataclass
+class TransactionArrays:
+    """One user's transactions as parallel arrays, oldest first."""
+
+    ids: np.ndarray  # int64
+    days: np.ndarray  # int64 days since 1970-01-01
+    months: np.ndarray  # int64 months since 1970-01
+    amounts: np.ndarray  # float64
+    expense: np.ndarray  # bool
+    category_codes: np.ndarray  # int64 index into `categories`
+    merchant_codes: np.ndarray  # int64 index into `merchants`
+    categories: np.ndarray  # str
+    merchants: np.ndarray  # str, normalized descriptions
+    descriptions: np.ndarray  # str
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def _day_number(day: date) -> int:
+    return (day - _EPOCH).days
+
+
+def _to_date(day_number) -> date:
+    return _EPOCH + timedelta(days=int(day_number))
+
+
+def _merchant_name(description: str) -> str:
+    """Description without numbers and punctuation: "Uber #1234" -> "uber"."""
+    return " ".join(word for word in search.words(description) if not word.isdigit())
+
+
+def _category_labels(names) -> np.ndarray:
+    return np.array([UNCATEGORIZED if name is None else name for name in names], dtype=str)
+
+
+def load_transactions(session: Session, user_id: int) -> TransactionArrays:
+    """A user's transactions as arrays, archived ones included."""
+    statement = (
+        select(
+            Transaction.id, Transaction.date, Transaction.amount,
+            Transaction.type == TransactionType.EXPENSE,
+            Category.name, Transaction.description,
+        )
+        .outerjoin(Category, Category.id == Transaction.category_id)
+        .where(Transaction.user_id == user_id)
+        .order_by(Transaction.date, Transaction.id)
+    )
+    rows = session.execute(statement).all()
+    ids, dates, amounts, expense, categories, descriptions = (
+        zip(*rows) if rows else ((),) * 6
+    )
+    ids = np.array(ids, dtype=np.int64)
+    day_values = np.array(dates, dtype="datetime64[D]")
+    amounts = np.array(amounts, dtype=np.float64)
+    expense = np.array(expense, dtype=bool)
+    categories = _category_labels(categories)
+    descriptions = np.array(descriptions, dtype=str)
+    entries = crud.archived_segments(session, user_id)
+    if entries:
+        archived = archive.analytics_columns(entries)
+        ids = np.concatenate([ids, archived["id"]])
+        day_values = np.concatenate([day_values, archived["date"].astype("datetime64[D]")])
+        amounts = np.concatenate([amounts, archived["amount"]])
+        expense = np.concatenate([expense, archived["type"] == archive.EXPENSE_CODE])
+        categories = np.concatenate([categories, _category_labels(archived["category"])])
+        descriptions = np.concatenate([descriptions, archived["description"].astype(str)])
+        order = np.lexsort((ids, day_values))
+        ids, day_values, amounts = ids[order], day_values[order], amounts[order]
+        expense, categories, descriptions = expense[order], categories[order], descriptions[order]
+    category_names, category_codes = np.unique(categories, return_inverse=True)
+    unique_descriptions, description_codes = np.unique(descriptions, return_inverse=True)
+    merchant_names, merchant_of_description = np.unique(
+        np.array([_merchant_name(text) for text in unique_descriptions], dtype=str),
+        return_inverse=True,
+    )
+    return TransactionArrays(
+        ids=ids,
+        days=day_values.astype(np.int64),
+        months=day_values.astype("datetime64[M]").astype(np.int64),
+        amounts=amounts,
+        expense=expense,
+        category_codes=category_codes.astype(np.int64),
+        merchant_codes=merchant_of_description[description_codes].astype(np.int64),
+        categories=category_names,
+        merchants=merchant_names,
+        descriptions=descriptions,
+    )
+
+
+def _grouped_mean_std(codes: np.ndarray, values: np.ndarray, groups: int):
+    """Per-group count, mean and population standard deviation."""
+    counts = np.bincount(codes, minlength=groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.bincount(codes, weights=values, minlength=groups) / counts
+        squares = np.bincount(codes, weights=values * values, minlength=groups) / counts
+    stds = np.sqrt(np.maximum(squares - means * means, 0.0))
+    return counts, means, stds
+
+
+def rolling_spend(data: TransactionArrays, today: int) -> List[RollingSpend]:
+    """Expense totals of each window ending today and of the window before it."""
+    longest = 2 * max(ROLLING_WINDOWS)
+    age = today - data.days
+    recent = data.expense & (age >= 0) & (age < longest)
+    daily = np.bincount(age[recent], weights=data.amounts[recent], minlength=longest)
+    return [
+        RollingSpend(
+            days=days,
+            total=round(float(daily[:days].sum()), 2),
+            previous_total=round(float(daily[days : 2 * days].sum()), 2),
+            daily_average=round(float(daily[:days].sum() / days), 2),
+        )
+        for days in ROLLING_WINDOWS
+    ]
+
+
+def category_changes(data: TransactionArrays, today: int, month: int) -> List[CategoryChange]:
+    """Expenses by category so far this month against the whole previous month."""
+    groups = len(data.categories)
+    current_mask = data.expense & (data.months == month) & (data.days <= today)
+    previous_mask = data.expense & (data.months == month - 1)
+    current = np.bincount(
+        data.category_codes[current_mask], weights=data.amounts[current_mask], minlength=groups
+    )
+    previous = np.bincount(
+        data.category_codes[previous_mask], weights=data.amounts[previous_mask], minlength=groups
+    )
+    change = current - previous
+    present = np.flatnonzero((current != 0) | (previous != 0))
+    present = present[np.argsort(-np.abs(change[present]), kind="stable")]
+    return [
+        CategoryChange(
+            category=str(data.categories[code]),
+            current=round(float(current[code]), 2),
+            previous=round(float(previous[code]), 2),
+            change=round(float(change[code]), 2),
+        )
+        for code in present
+    ]
+
+
+def recurring_merchants(data: TransactionArrays, today: int) -> List[RecurringMerchant]:
+    """Merchants charged at a steady cadence for a steady amount, still active."""
+    mask = data.expense & (data.days <= today)
+    merchants, days = data.merchant_codes[mask], data.days[mask]
+    amounts, category_codes = data.amounts[mask], data.category_codes[mask]
+    if len(merchants) < RECURRING_MIN_OCCURRENCES:
+        return []
+    groups = len(data.merchants)
+    order = np.lexsort((days, merchants))
+    merchants, days = merchants[order], days[order]
+    amounts, category_codes = amounts[order], category_codes[order]
+
+    same = merchants[1:] == merchants[:-1]
+    gaps = np.diff(days)[same].astype(np.float64)
+    _, gap_mean, gap_std = _grouped_mean_std(merchants[1:][same], gaps, groups)
+    count, amount_mean, amount_std = _grouped_mean_std(merchants, amounts, groups)
+    ends = np.flatnonzero(np.append(~same, True))  # last row of each merchant
+    last_index = np.full(groups, -1)
+    last_index[merchants[ends]] = ends
+    last_day = np.where(last_index >= 0, days[last_index], 0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        recurring = (
+            (count >= RECURRING_MIN_OCCURRENCES)
+            & (gap_mean >= RECURRING_MIN_CADENCE_DAYS)
+            & (gap_std / gap_mean <= RECURRING_MAX_CADENCE_SPREAD)
+            & (amount_std / amount_mean <= RECURRING_MAX_AMOUNT_SPREAD)
+            & (today - last_day <= 2 * gap_mean)
+        )
+    recurring &= np.char.str_len(data.merchants) > 0
+    found = np.flatnonzero(recurring)
+    found = found[np.argsort(-amount_mean[found], kind="stable")]
+    return [
+        RecurringMerchant(
+            merchant=str(data.merchants[code]),
+            category=str(data.categories[category_codes[last_index[code]]]),
+            occurrences=int(count[code]),
+            cadence_days=round(float(gap_mean[code]), 1),
+            average_amount=round(float(amount_mean[code]), 2),
+            last_date=_to_date(last_day[code]),
+            next_expected_date=_to_date(last_day[code] + round(gap_mean[code])),
+        )
+        for code in found
+    ]
+
+
+def anomalies(data: TransactionArrays, today: int) -> List[SpendingAnomaly]:
+    """Recent expenses far above what is usual for their category.
+
+    Amounts are compared in log space, where spending is roughly normal, so
+    a single large bill does not hide every other outlier in its category.
+    """
+    history = data.expense & (data.days <= today)
+    codes = data.category_codes[history]
+    log_amounts = np.log(data.amounts[history])
+    groups = len(data.categories)
+    count, mean, std = _grouped_mean_std(codes, log_amounts, groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores = (log_amounts - mean[codes]) / std[codes]
+    flagged = (
+        (count[codes] >= ANOMALY_MIN_CATEGORY_SIZE)
+        & (std[codes] > 0)
+        & (scores >= ANOMALY_THRESHOLD)
+        & (data.days[history] > today - ANOMALY_LOOKBACK_DAYS)
+    )
+    rows = np.flatnonzero(history)[flagged]
+    flagged_scores = scores[flagged]
+    top = np.argsort(-flagged_scores, kind="stable")[:MAX_ANOMALIES]
+    return [
+        SpendingAnomaly(
+            transaction_id=int(data.ids[rows[i]]),
+            date=_to_date(data.days[rows[i]]),
+            description=str(data.descriptions[rows[i]]),
+            category=str(data.categories[data.category_codes[rows[i]]]),
+            amount=float(data.amounts[rows[i]]),
+            typical_amount=round(float(np.exp(mean[data.category_codes[rows[i]]])), 2),
+            score=round(float(flagged_scores[i]), 2),
+        )
+        for i in top
+    ]
+
+
+def compute_insights(data: TransactionArrays, as_of: date) -> Insights:
+    today = _day_number(as_of)
+    month = int(np.datetime64(as_of, "M").astype(np.int64))
+    return Insights(
+        as_of=as_of,
+        rolling_spend=rolling_spend(data, today),
+        category_changes=category_changes(data, today, month),
+        recurring_merchants=recurring_merchants(data, today),
+        anomalies=anomalies(data, today),
+    )
+
+
+class _CacheEntry:
+    __slots__ = ("version", "data", "results")
+
+    def __init__(self, version: int, data: Optional[TransactionArrays]) -> None:
+        self.version = version
+        self.data = data
+        self.results: "OrderedDict[date, Insights]" = OrderedDict()
+
+
+class InsightsCache:
+    """Bounded LRU of each user's arrays and insights at one data version.
+
+    An entry is only used while its version matches the user's current one;
+    a newer version replaces it.
+    """
+
+    def __init__(self, max_users: int) -> None:
+        self.max_users = max_users
+        self._entries: "OrderedDict[int, _CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, user_id: int, version: int) -> Optional[_CacheEntry]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry.version != version:
+            return None
+        self._entries.move_to_end(user_id)
+        return entry
+
+    def get(
+        self, user_id: int, version: int, as_of: date
+    ) -> Tuple[Optional[TransactionArrays], Optional[Insights]]:
+        """Cached (arrays, insights) for a user at `version`, either may be None."""
+        with self._lock:
+            entry = self._entry(user_id, version)
+            if entry is None:
+                return None, None
+            return entry.data, entry.results.get(as_of)
+
+    def put(
+        self,
+        user_id: int,
+        version: int,
+        data: Optional[TransactionArrays],
+        as_of: date,
+        insights: Insights,
+    ) -> None:
+        if self.max_users <= 0:
+            return
+        with self._lock:
+            entry = self._entry(user_id, version)
+            if entry is None:
+                current = self._entries.get(user_id)
+                if current is not None and current.version > version:
+                    return
+                entry = self._entries[user_id] = _CacheEntry(version, data)
+                self._entries.move_to_end(user_id)
+            entry.data = entry.data if data is None else data
+            entry.results[as_of] = insights
+            while len(entry.results) > RESULTS_PER_USER:
+                entry.results.popitem(last=False)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+insights_cache = InsightsCache(settings.insights_cache_size)
+
+
+async def get_insights(db: Database, user_id: int, as_of: date) -> Insights:
+    """Insights for a user as of a day.
+
+    Served from the in-process cache, else from `UserInsights` when that was
+    computed for this day from the current data version, else computed now.
+    A stored result for an earlier day is not reused: every figure is
+    relative to `as_of`, so the first read for a new day recomputes them.
+    """
+    version = await db.run(crud.get_data_version, user_id, crud.TRANSACTIONS_SCOPE)
+    data, insights = insights_cache.get(user_id, version, as_of)
+    if insights is not None:
+        return insights
+    if data is None:
+        stored = await db.run(crud.get_user_insights, user_id)
+        if stored is not None and stored.version == version and stored.as_of == as_of:
+            insights = Insights.model_validate_json(stored.payload)
+            insights_cache.put(user_id, version, None, as_of, insights)
+            return insights
+        data = await db.run(load_transactions, user_id)
+    # The array work is CPU-bound; keep it off the event loop
+    insights = await run_in_threadpool(compute_insights, data, as_of)
+    insights_cache.put(user_id, version, data, as_of, insights)
+    return insights
+
+
+async def refresh_insights(user_id: int, shard: int = 0) -> None:
+    """Compute today's insights for a user and store them, unless they are current.
+
+    Run by the post-write work queue (`app.jobs`), so the user's next insights
+    read is served from the cache or from `UserInsights`. Stored insights
+    computed from the current data version count as current whatever day
+    they were computed for, as in `precompute_insights`.
+    """
+    as_of = date.today()
+    async with database.shard_database(shard) as db:
+        version = await db.run(crud.get_data_version, user_id, crud.TRANSACTIONS_SCOPE)
+        stored = await db.run(crud.get_user_insights, user_id)
+        if stored is not None and stored.version == version:
+            return
+        insights = await get_insights(db, user_id, as_of)
+        await db.run(crud.save_user_insights, [dict(
+            user_id=user_id,
+            as_of=as_of,
+            version=version,
+            computed_at=datetime.utcnow(),
+            payload=insights.model_dump_json(),
+        )])
+
+
+# Offline precomputation
+
+def _init_worker() -> None:
+    # Connections inherited from a forked parent must not be shared
+    for shard_engine in database.shard_engines:
+        shard_engine.dispose(close=False)
+
+
+def _compute_user(user_id: int, as_of: date, shard: int = 0) -> dict:
+    """Worker entry point: a `UserInsights` row for one user, as a dict."""
+    with Session(database.shard_engines[shard]) as session:
+        version = crud.get_data_version(session, user_id, crud.TRANSACTIONS_SCOPE)
+        data = load_transactions(session, user_id)
+    return dict(
+        user_id=user_id,
+        as_of=as_of,
+        version=version,
+        computed_at=datetime.utcnow(),
+        payload=compute_insights(data, as_of).model_dump_json(),
+    )
+
+
+def _stale_chunks(chunk_size: int, force: bool, shard: int) -> Iterator[Tuple[int, List[int]]]:
+    """Yield (users examined, stale user ids) for successive chunks of a shard's users.
+
+    Shards keep the user rows of users moved elsewhere; those are skipped.
+    """
+    after_id = 0
+    while True:
+        with Session(database.shard_engines[shard]) as session:
+            ids, stale = crud.users_needing_insights(session, after_id, chunk_size, force)
+        if not ids:
+            return
+        after_id = ids[-1]
+        if sharding.shard_router.shards > 1:
+            here = sharding.users_on_shard(ids, shard)
+            ids = [user_id for user_id in ids if user_id in here]
+            stale = [user_id for user_id in stale if user_id in here]
+        yield len(ids), stale
+
+
+def precompute_insights(
+    as_of: date,
+    workers: Optional[int] = None,
+    chunk_size: int = 500,
+    force: bool = False,
+    shard: int = 0,
+) -> Tuple[int, int]:
+    """Store insights as of `as_of` for every user of `shard` whose data changed.
+
+    A user is recomputed when their transactions changed since their stored
+    insights were computed, or they have none; `force` recomputes everyone.
+    Users are read in id order `chunk_size` at a time. Each chunk's stale
+    users are computed on a pool of `workers` processes (inline when 0),
+    which read from the database themselves; results are written back by
+    this process, one commit per chunk. Returns (users computed, users
+    skipped as current).
+    """
+    computed = skipped = 0
+    executor = (
+        ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+        if workers != 0 else None
+    )
+    try:
+        for examined, stale in _stale_chunks(chunk_size, force, shard):
+            skipped += examined - len(stale)
+            if not stale:
+                continue
+            job = partial(_compute_user, as_of=as_of, shard=shard)
+            rows = list(executor.map(job, stale, chunksize=8) if executor else map(job, stale))
+            with Session(database.shard_engines[shard]) as session:
+                crud.save_user_insights(session, rows)
+            computed += len(rows)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return computed, skipped
@@ -0,0 +1,634 @@
+"""Cold storage for old transactions in per-user, per-year segment files.
+
+`archive_user` moves a user's transactions dated before a horizon out of the
+transaction table into one segment file per calendar year, and records each
+segment in the `ArchiveSegment` manifest table. The hot table and its indexes
+then only hold recent rows.
+
+A segment is columnar. The columns readers filter and aggregate on (ids,
+day numbers, amounts, types, change sequence numbers) are stored as raw
+little-endian arrays of the narrowest fitting type and are memory-mapped,
+so readers slice them in place without copying or parsing. Descriptions and
+categories are dictionary-encoded: the columns hold uint32 codes and the
+distinct strings are stored once, zlib-compressed, and only inflated when a
+reader needs the text. Categories are stored by name, so segments do not
+depend on the ids of the database they came from. The timestamps are only
+needed when whole rows are decoded, so they are packed instead of mapped:
+`created_at` as the difference to the previous row and `updated_at` as the
+difference to `created_at`, mostly zeros, zlib-compressed and inflated on
+first use. Layout::
+
+    b"SSSEG002" | header length (uint64) | JSON header | padding | sections
+
+The header lists every mapped column's dtype and offset and every packed
+column's and dictionary's offset and length, relative to the first section;
+sections are 8-byte aligned. Rows are sorted newest first. Version 1
+segments, with every column mapped, are still read.
+
+Segment files are immutable. Changing one, to add rows or to take rows back
+out, writes the next generation under a new name and points the manifest row
+at it in the caller's database transaction, so readers always see a complete
+segment. Superseded and orphaned files are deleted by `collect_garbage` once
+they are old enough that no reader can still be opening them.
+
+Reads go through `crud`, which consults the manifest and only imports this
+module for users that have archived data. The manifest records each
+segment's date, id and change sequence ranges, so a lookup of a row that is
+not archived opens no segment at all. Editing or deleting an archived
+row moves it back to the transaction table first (`rehydrate`); rollups are
+untouched throughout, since the rows still exist.
+"""
+import json
+import os
+import secrets
+import time
+import zlib
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import and_, delete, func, insert, text, update
+from sqlmodel import Session, select
+
+from . import crud, search
+from .config import get_settings
+from .models import ArchiveSegment, Transaction, TransactionFilter, TransactionType
+
+settings = get_settings()
+
+MAGIC = b"SSSEG002"
+# Formats this module reads; version 1 maps the timestamp columns too
+_READABLE_MAGICS = (b"SSSEG001", MAGIC)
+SUFFIX = ".seg"
+# Files no manifest row points to are only deleted once this old, so readers
+# that looked at the manifest just before it changed can still open them
+GARBAGE_GRACE_SECONDS = 3600
+
+DEFAULT_BATCH_SIZE = 1000
+
+_ALIGNMENT = 8
+_EPOCH = date(1970, 1, 1)
+_EPOCH_DATETIME = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_TYPES = tuple(TransactionType)
+EXPENSE_CODE = _TYPES.index(TransactionType.EXPENSE)
+
+# Numeric columns in file order; "category" and "description" hold codes
+# into the dictionaries of the same name, and `_PACKED_COLUMNS` are stored
+# packed rather than mapped
+_COLUMNS = (
+    ("id", "<i8"),
+    ("date", "<i4"),
+    ("amount", "<f8"),
+    ("type", "u1"),
+    ("category", "<u4"),
+    ("description", "<u4"),
+    ("created_at", "<i8"),
+    ("updated_at", "<i8"),
+    ("change_seq", "<i8"),
+)
+_DICTIONARY_COLUMNS = ("category", "description")
+# Columns stored delta-encoded and compressed rather than mapped
+_PACKED_COLUMNS = ("created_at", "updated_at")
+
+# Decoded columns: the numeric arrays above, with strings in place of codes
+Columns = Dict[str, np.ndarray]
+
+
+def _padded(length: int) -> int:
+    return -(-length // _ALIGNMENT) * _ALIGNMENT
+
+
+def segment_path(entry: ArchiveSegment, root: Optional[str] = None) -> Path:
+    return Path(root or settings.archive_dir) / str(entry.user_id) / entry.file_name
+
+
+class Segment:
+    """Read-only view of one segment file through a memory map."""
+
+    def __init__(self, path: Path) -> None:
+        raw = np.memmap(path, dtype=np.uint8, mode="r")
+        if raw[:len(MAGIC)].tobytes() not in _READABLE_MAGICS:
+            raise ValueError(f"{path} is not a transaction segment")
+        header_length = int(raw[8:16].view("<u8")[0])
+        header = json.loads(raw[16:16 + header_length].tobytes())
+        data_start = 16 + _padded(header_length)
+        self.path = path
+        self.rows = header["rows"]
+        self._raw = raw
+        self.columns = _SegmentColumns(self)
+        for name, dtype, offset in header["columns"]:
+            dtype = np.dtype(dtype)
+            start = data_start + offset
+            self.columns[name] = raw[start:start + self.rows * dtype.itemsize].view(dtype)
+        self._packed_spans = {
+            name: (data_start + offset, length)
+            for name, offset, length in header.get("packed", ())
+        }
+        self._dictionary_spans = {
+            name: (data_start + offset, length)
+            for name, offset, length in header["dictionaries"]
+        }
+        self._dictionaries: Dict[str, np.ndarray] = {}
+
+    def _inflate(self, name: str) -> np.ndarray:
+        """A packed column, decompressed and delta-decoded."""
+        start, length = self._packed_spans[name]
+        deltas = np.frombuffer(zlib.decompress(self._raw[start:start + length].tobytes()), "<i8")
+        if name == "updated_at":
+            return self.columns["created_at"] + deltas
+        return np.cumsum(deltas)
+
+    def dictionary(self, name: str) -> np.ndarray:
+        """Distinct strings of a dictionary-encoded column, inflated on first use."""
+        values = self._dictionaries.get(name)
+        if values is None:
+            start, length = self._dictionary_spans[name]
+            strings = json.loads(zlib.decompress(self._raw[start:start + length].tobytes()))
+            values = self._dictionaries[name] = np.array(strings, dtype=object)
+        return values
+
+    def strings(self, name: str, mask=slice(None)) -> np.ndarray:
+        return self.dictionary(name)[self.columns[name][mask]]
+
+    def decode(self, mask=slice(None)) -> Columns:
+        """The selected rows as decoded columns, copied out of the map."""
+        columns = {name: np.array(self.columns[name][mask]) for name, _ in _COLUMNS}
+        for name in _DICTIONARY_COLUMNS:
+            columns[name] = self.strings(name, mask)
+        return columns
+
+
+class _SegmentColumns(dict):
+    """A segment's columns by name; packed columns are inflated on first access."""
+
+    def __init__(self, segment: Segment) -> None:
+        super().__init__()
+        self._segment = segment
+
+    def __missing__(self, name: str) -> np.ndarray:
+        values = self[name] = self._segment._inflate(name)
+        return values
+
+
+def _pack(name: str, columns: Columns, order: np.ndarray) -> bytes:
+    """A `_PACKED_COLUMNS` column in `order`, delta-encoded and compressed."""
+    values = np.asarray(columns[name][order], dtype="<i8")
+    if name == "updated_at":
+        deltas = values - np.asarray(columns["created_at"][order], dtype="<i8")
+    else:
+        deltas = np.diff(values, prepend=np.int64(0))
+    return zlib.compress(deltas.astype("<i8").tobytes(), 6)
+
+
+@lru_cache(maxsize=256)
+def _open(path: str) -> Segment:
+    # Every write uses a new file name and files are never modified, so a
+    # mapped segment stays valid for as long as it is cached
+    return Segment(Path(path))
+
+
+def open_segment(entry: ArchiveSegment) -> Segment:
+    return _open(str(segment_path(entry)))
+
+
+def _dictionary_encode(strings: np.ndarray) -> Tuple[list, np.ndarray]:
+    """Distinct values and per-row codes; None (a NULL category) becomes null."""
+    missing = np.equal(strings, None)
+    if not missing.any():
+        values, codes = np.unique(strings.astype(str), return_inverse=True)
+        return values.tolist(), codes
+    values, present = np.unique(strings[~missing].astype(str), return_inverse=True)
+    codes = np.full(len(strings), len(values), dtype=np.int64)
+    codes[~missing] = present
+    return [*values.tolist(), None], codes
+
+
+def write_segment(path: Path, columns: Columns) -> int:
+    """Write decoded columns as a segment, newest row first; returns its size."""
+    order = np.lexsort((-columns["id"], -columns["date"].astype(np.int64)))
+    sections: List[bytes] = []
+    header_columns, header_packed, header_dictionaries = [], [], []
+    offset = 0
+
+    def add(section: bytes) -> int:
+        nonlocal offset
+        start = offset
+        sections.append(section + b"\0" * (_padded(len(section)) - len(section)))
+        offset += _padded(len(section))
+        return start
+
+    dictionaries = {}
+    for name in _DICTIONARY_COLUMNS:
+        dictionaries[name] = _dictionary_encode(columns[name][order])
+    for name, dtype in _COLUMNS:
+        if name in _PACKED_COLUMNS:
+            blob = _pack(name, columns, order)
+            header_packed.append((name, add(blob), len(blob)))
+            continue
+        if name in dictionaries:
+            array = dictionaries[name][1].astype(dtype)
+        else:
+            array = np.ascontiguousarray(columns[name][order], dtype=dtype)
+        header_columns.append((name, dtype, add(array.tobytes())))
+    for name, (values, _codes) in dictionaries.items():
+        blob = zlib.compress(json.dumps(values, ensure_ascii=False).encode("utf-8"), 6)
+        header_dictionaries.append((name, add(blob), len(blob)))
+
+    header = json.dumps({
+        "rows": len(order), "columns": header_columns, "packed": header_packed,
+        "dictionaries": header_dictionaries,
+    }).encode("utf-8")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_suffix(".tmp")
+    with open(temporary, "wb") as handle:
+        handle.write(MAGIC)
+        handle.write(np.array([len(header)], dtype="<u8").tobytes())
+        handle.write(header + b"\0" * (_padded(len(header)) - len(header)))
+        for section in sections:
+            handle.write(section)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temporary, path)
+    return path.stat().st_size
+
+
+# Conversions between database rows and decoded columns
+
+# Segment columns as table rows; the table holds categories by id
+_SQL_COLUMNS = ("id", "date", "amount", "type", "category", "description",
+                "created_at", "updated_at", "change_seq")
+_TABLE_COLUMNS = tuple("category_id" if name == "category" else name for name in _SQL_COLUMNS)
+
+
+def _columns_from_rows(session: Session, rows: Sequence[tuple]) -> Columns:
+    """Columns of `_TABLE_COLUMNS` rows."""
+    ids, dates, amounts, types, category_ids, descriptions, created, updated, seqs = zip(*rows)
+    names = crud.category_names(session, category_ids)
+    categories = [names.get(category_id) for category_id in category_ids]
+    return {
+        "id": np.array(ids, dtype=np.int64),
+        "date": np.array([(day - _EPOCH).days for day in dates], dtype=np.int32),
+        "amount": np.array(amounts, dtype=np.float64),
+        "type": np.array([_TYPES.index(TransactionType(value)) for value in types], dtype=np.uint8),
+        "category": np.array(categories, dtype=object),
+        "description": np.array(descriptions, dtype=object),
+        "created_at": np.array(
+            [(value - _EPOCH_DATETIME) // _MICROSECOND for value in created], dtype=np.int64
+        ),
+        "updated_at": np.array(
+            [(value - _EPOCH_DATETIME) // _MICROSECOND for value in updated], dtype=np.int64
+        ),
+        "change_seq": np.array(seqs, dtype=np.int64),
+    }
+
+
+def _concat(parts: Sequence[Columns]) -> Columns:
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def _select(columns: Columns, mask: np.ndarray) -> Columns:
+    return {name: values[mask] for name, values in columns.items()}
+
+
+def _python_values(columns: Columns, name: str, user_id: int) -> list:
+    """One column as Python values shaped like the database returns them."""
+    if name == "user_id":
+        return [user_id] * len(columns["id"])
+    values = columns[name]
+    if name == "date":
+        ordinal = _EPOCH.toordinal()
+        return [date.fromordinal(ordinal + day) for day in values.tolist()]
+    if name in ("created_at", "updated_at"):
+        return [_EPOCH_DATETIME + value * _MICROSECOND for value in values.tolist()]
+    if name == "type":
+        return [_TYPES[index] for index in values.tolist()]
+    return values.tolist()
+
+
+def _row_dicts(session: Session, columns: Columns, user_id: int) -> List[dict]:
+    """Decoded columns as `_TABLE_COLUMNS` dicts, ready to insert."""
+    values = [_python_values(columns, name, user_id) for name in _SQL_COLUMNS]
+    names = set(values[_SQL_COLUMNS.index("category")]) - {None}
+    category_ids = crud.category_ids(session, user_id, names)
+    rows = [dict(zip(_TABLE_COLUMNS, row), user_id=user_id) for row in zip(*values)]
+    for row in rows:
+        row["category_id"] = category_ids.get(row["category_id"])
+    return rows
+
+
+@lru_cache(maxsize=32)
+def _row_type(columns: Tuple[str, ...]):
+    # rename=True tolerates a column requested twice, e.g. "id" as a tie-breaker
+    return namedtuple("ArchivedRow", columns, rename=True)
+
+
+def _rows(columns: Columns, names: Sequence[str], user_id: int) -> list:
+    """Decoded columns as tuples of `names`, attribute access included."""
+    row_type = _row_type(tuple(names))
+    values = [_python_values(columns, name, user_id) for name in names]
+    return [row_type(*row) for row in zip(*values)]
+
+
+# Filtering
+
+def _mask(
+    segment: Segment,
+    filters: Optional[TransactionFilter] = None,
+    ids: Optional[Sequence[int]] = None,
+) -> np.ndarray:
+    columns = segment.columns
+    mask = np.ones(segment.rows, dtype=bool)
+    if ids is not None:
+        mask &= np.isin(columns["id"], np.asarray(list(ids), dtype=np.int64))
+    if filters is None:
+        return mask
+    if filters.start_date is not None:
+        mask &= columns["date"] >= (filters.start_date - _EPOCH).days
+    if filters.end_date is not None:
+        mask &= columns["date"] <= (filters.end_date - _EPOCH).days
+    if filters.type is not None:
+        mask &= columns["type"] == _TYPES.index(TransactionType(filters.type))
+    if filters.category is not None:
+        codes = np.flatnonzero(segment.dictionary("category") == filters.category)
+        mask &= np.isin(columns["category"], codes)
+    if filters.min_amount is not None:
+        mask &= columns["amount"] >= filters.min_amount
+    if filters.max_amount is not None:
+        mask &= columns["amount"] <= filters.max_amount
+    return mask
+
+
+def _before(segment: Segment, position: Tuple[date, int]) -> np.ndarray:
+    day = (position[0] - _EPOCH).days
+    dates, ids = segment.columns["date"], segment.columns["id"]
+    return (dates < day) | ((dates == day) & (ids < position[1]))
+
+
+# Reads
+
+def iter_rows(
+    entries: Sequence[ArchiveSegment],
+    user_id: int,
+    names: Sequence[str],
+    filters: Optional[TransactionFilter] = None,
+    before: Optional[Tuple[date, int]] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Iterator[list]:
+    """Yield batches of a user's archived rows as `names` tuples, newest first.
+
+    `entries` must be newest year first. `before` is an exclusive (date, id)
+    position to resume after, as in keyset pagination.
+    """
+    for entry in entries:
+        segment = open_segment(entry)
+        mask = _mask(segment, filters)
+        if before is not None:
+            mask &= _before(segment, before)
+        selected = np.flatnonzero(mask)
+        for start in range(0, len(selected), batch_size):
+            chunk = selected[start:start + batch_size]
+            decoded = {name: segment.columns[name][chunk] for name, _ in _COLUMNS}
+            for name in _DICTIONARY_COLUMNS:
+                decoded[name] = segment.strings(name, chunk)
+            yield _rows(decoded, names, user_id)
+
+
+def rows_after_change(
+    entries: Sequence[ArchiveSegment],
+    user_id: int,
+    names: Sequence[str],
+    position: Tuple[int, int],
+    limit: int,
+) -> list:
+    """Up to `limit` archived rows after (change_seq, id), in that order."""
+    seq, row_id = position
+    parts = []
+    for entry in entries:
+        if entry.max_change_seq < seq:
+            continue
+        segment = open_segment(entry)
+        seqs, ids = segment.columns["change_seq"], segment.columns["id"]
+        mask = (seqs > seq) | ((seqs == seq) & (ids > row_id))
+        if mask.any():
+            parts.append(segment.decode(mask))
+    if not parts:
+        return []
+    columns = _concat(parts)
+    order = np.lexsort((columns["id"], columns["change_seq"]))[:limit]
+    return _rows(_select(columns, order), names, user_id)
+
+
+def expense_total(entries: Sequence[ArchiveSegment], start: date) -> float:
+    """Sum of archived expenses dated on or after `start`."""
+    day = (start - _EPOCH).days
+    total = 0.0
+    for entry in entries:
+        columns = open_segment(entry).columns
+        mask = (columns["date"] >= day) & (columns["type"] == EXPENSE_CODE)
+        total += float(columns["amount"][mask].sum())
+    return total
+
+
+def daily_totals(
+    entries: Sequence[ArchiveSegment],
+) -> Iterator[Tuple[date, str, TransactionType, float, int]]:
+    """(date, category, type, total, count) of archived rows, for rollup rebuilds."""
+    for entry in entries:
+        segment = open_segment(entry)
+        columns = segment.columns
+        keys = np.stack([columns["date"], columns["category"], columns["type"]], axis=1)
+        groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        totals = np.bincount(inverse, weights=columns["amount"], minlength=len(groups))
+        counts = np.bincount(inverse, minlength=len(groups))
+        categories = segment.dictionary("category")
+        for (day, category, type_index), total, count in zip(
+            groups.tolist(), totals.tolist(), counts.tolist()
+        ):
+            yield (
+                _EPOCH + timedelta(days=day), categories[category], _TYPES[type_index],
+                total, count,
+            )
+
+
+def analytics_columns(entries: Sequence[ArchiveSegment]) -> Optional[Columns]:
+    """Every archived row of the given segments as decoded columns."""
+    parts = [open_segment(entry).decode() for entry in entries]
+    return _concat(parts) if parts else None
+
+
+# Moving rows between the table and segments
+
+def _replace_segment(
+    session: Session, user_id: int, year: int, entry: Optional[ArchiveSegment],
+    columns: Optional[Columns],
+) -> None:
+    """Point the manifest for (user, year) at a new segment holding `columns`.
+
+    With no rows left the manifest entry is removed. The superseded file is
+    left for `collect_garbage`. The manifest update is conditional on the
+    generation `entry` was read at, so of two concurrent rewrites of a
+    segment only the first can commit.
+    """
+    table = ArchiveSegment.__table__
+    current = None
+    if entry is not None:
+        current = and_(
+            table.c.user_id == user_id, table.c.year == year,
+            table.c.generation == entry.generation,
+        )
+    if columns is None or len(columns["id"]) == 0:
+        if current is not None:
+            _expect_one(session.execute(delete(table).where(current)))
+        return
+    generation = 1 if entry is None else entry.generation + 1
+    # A fresh name per write, so a writer that loses the race above never
+    # replaces a file the winner's manifest row points to
+    file_name = f"{year}-{generation}-{secrets.token_hex(4)}{SUFFIX}"
+    size = write_segment(Path(settings.archive_dir) / str(user_id) / file_name, columns)
+    days = columns["date"]
+    values = dict(
+        generation=generation,
+        file_name=file_name,
+        row_count=len(days),
+        min_date=_EPOCH + timedelta(days=int(days.min())),
+        max_date=_EPOCH + timedelta(days=int(days.max())),
+        max_change_seq=int(columns["change_seq"].max()),
+        min_id=int(columns["id"].min()),
+        max_id=int(columns["id"].max()),
+        size_bytes=size,
+        updated_at=datetime.utcnow(),
+    )
+    if current is None:
+        session.execute(insert(table).values(user_id=user_id, year=year, **values))
+    else:
+        _expect_one(session.execute(update(table).where(current).values(**values)))
+
+
+def _expect_one(result) -> None:
+    if result.rowcount != 1:
+        raise RuntimeError("Archive segment was changed concurrently; retry the operation")
+
+
+def _manifest(session: Session, user_id: int) -> Dict[int, ArchiveSegment]:
+    entries = session.exec(select(ArchiveSegment).where(ArchiveSegment.user_id == user_id))
+    return {entry.year: entry for entry in entries}
+
+
+def _reuses_ids(session: Session) -> bool:
+    """Whether the transaction table can hand out the id of a deleted row again.
+
+    SQLite tables created before ids became AUTOINCREMENT give new rows one
+    past the largest remaining id; other dialects draw ids from sequences.
+    """
+    if session.get_bind().dialect.name != "sqlite":
+        return False
+    ddl = session.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": Transaction.__tablename__},
+    ).scalar()
+    return ddl is not None and "AUTOINCREMENT" not in ddl.upper()
+
+
+def archive_user(session: Session, user_id: int, before: date) -> int:
+    """Move a user's transactions dated before `before` into segments and commit.
+
+    Returns the number of rows moved. The rows are deleted with RETURNING, so
+    a concurrent edit either lands before and is archived, or finds the row
+    gone. In a table that reuses ids (`_reuses_ids`) the table's newest row
+    is never archived, so the next id handed out stays above every archived
+    one.
+    """
+    table = Transaction.__table__
+    clauses = [table.c.user_id == user_id, table.c.date < before]
+    if _reuses_ids(session):
+        clauses.append(table.c.id < select(func.max(table.c.id)).scalar_subquery())
+    selected = [table.c[name] for name in _TABLE_COLUMNS]
+    search.unindex_rows(session, *clauses)
+    if session.get_bind().dialect.delete_returning:
+        rows = session.execute(delete(table).where(*clauses).returning(*selected)).all()
+    else:
+        rows = session.execute(select(*selected).where(*clauses)).all()
+        if rows:
+            session.execute(delete(table).where(table.c.id.in_([row[0] for row in rows])))
+    if not rows:
+        session.rollback()
+        return 0
+    moved = _columns_from_rows(session, rows)
+    years = (moved["date"].astype("datetime64[D]").astype("datetime64[Y]").astype(int) + 1970)
+    manifest = _manifest(session, user_id)
+    for year in np.unique(years).tolist():
+        entry = manifest.get(year)
+        parts = [_select(moved, years == year)]
+        if entry is not None:
+            parts.append(open_segment(entry).decode())
+        _replace_segment(session, user_id, year, entry, _concat(parts))
+    session.commit()
+    return len(rows)
+
+
+def rehydrate(
+    session: Session,
+    user_id: int,
+    entries: Sequence[ArchiveSegment],
+    ids: Optional[Sequence[int]] = None,
+    filters: Optional[TransactionFilter] = None,
+) -> int:
+    """Move archived rows picked by `ids` and/or `filters` back into the table.
+
+    Runs in the caller's transaction and does not commit; rows keep their id,
+    timestamps and change sequence number. Returns the number of rows moved.
+    """
+    moved = 0
+    for entry in entries:
+        segment = open_segment(entry)
+        mask = _mask(segment, filters, ids)
+        count = int(mask.sum())
+        if not count:
+            continue
+        rows = _row_dicts(session, segment.decode(mask), user_id)
+        session.execute(insert(Transaction.__table__), rows)
+        search.index_rows(session, Transaction.id.in_([row["id"] for row in rows]))
+        kept = segment.decode(~mask) if count < segment.rows else None
+        _replace_segment(session, user_id, entry.year, entry, kept)
+        moved += count
+    if moved:
+        session.flush()
+    return moved
+
+
+def users_to_archive(session: Session, before: date) -> List[int]:
+    return list(session.exec(
+        select(Transaction.user_id).where(Transaction.date < before).distinct()
+    ))
+
+
+def collect_garbage(
+    sessions: Sequence[Session],
+    root: Optional[str] = None,
+    grace_seconds: float = GARBAGE_GRACE_SECONDS,
+) -> int:
+    """Delete segment files no manifest references; returns files removed.
+
+    Shards share the archive directory, so pass a session on every shard.
+    """
+    base = Path(root or settings.archive_dir)
+    if not base.exists():
+        return 0
+    referenced = {
+        segment_path(entry, root)
+        for session in sessions
+        for entry in session.exec(select(ArchiveSegment))
+    }
+    cutoff = time.time() - grace_seconds
+    removed = 0
+    for path in base.glob("*/*"):
+        if path in referenced or path.stat().st_mtime > cutoff:
+            continue
+        path.unlink()
+        removed += 1
+    return removed
@@ -1,24 +1,34 @@
+import asyncio
 import base64
 import binascii
 import hashlib
+import logging
 import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import AsyncGenerator, Callable, Dict, Optional, Set, Tuple, TypeVar
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
+from sqlalchemy import event
 from sqlmodel import Session, select
 
 from .config import get_settings
-from .database import get_session
-from .models import TokenData, User
+from .database import Database, get_db, shard_database
+from .jobs import after_writes
+from .metrics import KDF_SECONDS, KDF_SHED
+from .models import TokenData, User, UserPrincipal, UserShard
+from .sharding import shard_router, user_placement
 
+logger = logging.getLogger(__name__)
 settings = get_settings()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 # PBKDF2 configuration
-PBKDF2_ITERATIONS = 100000  # Number of iterations (higher = more secure but slower)
+PBKDF2_ITERATIONS = settings.password_hash_iterations  # Higher = more secure but slower
 PBKDF2_HASH_NAME = "sha256"  # Hash algorithm
 PBKDF2_SALT_LENGTH = 32  # Salt length in bytes
 PBKDF2_KEY_LENGTH = 32  # Derived key length in bytes
@@ -84,8 +94,63 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         return False
 
 
+def needs_rehash(hashed_password: str) -> bool:
+    """Whether a stored hash was derived with a different iteration count."""
+    try:
+        return int(hashed_password.split('$', 1)[0]) != PBKDF2_ITERATIONS
+    except ValueError:
+        return False
+
+
+# Key derivation runs on its own small pool rather than the shared AnyIO
+# threadpool, so login storms cannot starve ordinary requests. A thread pool
+# is enough: hashlib releases the GIL while deriving keys.
+_kdf_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers, thread_name_prefix="pbkdf2"
+)
+_kdf_slots = threading.BoundedSemaphore(
+    settings.password_hash_workers + settings.password_hash_max_pending
+)
+
+T = TypeVar("T")
+
+
+def _timed_kdf(func: Callable[..., T], *args) -> T:
+    started = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        KDF_SECONDS.labels().observe(time.perf_counter() - started)
+
+
+async def run_password_kdf(func: Callable[..., T], *args) -> T:
+    """Run a password hashing function on the key-derivation pool.
+
+    Fails fast with 503 when the pool already has its fill of running and
+    queued derivations instead of letting the backlog grow without bound.
+    """
+    if not _kdf_slots.acquire(blocking=False):
+        KDF_SHED.labels("pool_full").inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        future = _kdf_executor.submit(_timed_kdf, func, *args)
+    except BaseException:
+        _kdf_slots.release()
+        raise
+    future.add_done_callback(lambda _: _kdf_slots.release())
+    return await asyncio.wrap_future(future)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Create a JWT access token."""
+    # jose loads the cryptography backends, tens of milliseconds at import,
+    # so it is imported on first use rather than on every worker start
+    from jose import jwt
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -102,21 +167,132 @@ def get_user_by_email(session: Session, email: str) -> Optional[User]:
     return session.exec(statement).first()
 
 
-def authenticate_user(session: Session, email: str, password: str) -> Optional[User]:
-    """Authenticate a user by email and password."""
-    user = get_user_by_email(session, email)
+def get_user_by_id(session: Session, user_id: int) -> Optional[User]:
+    return session.get(User, user_id)
+
+
+def save_user(session: Session, user: User) -> None:
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+
+
+def save_new_user(session: Session, user: User) -> int:
+    """Insert a user and its shard placement in one commit; returns the shard."""
+    session.add(user)
+    session.flush()
+    shard = shard_router.new_user_shard(user.id)
+    if shard_router.shards > 1:
+        session.add(UserShard(user_id=user.id, shard=shard))
+    session.commit()
+    session.refresh(user)
+    return shard
+
+
+async def authenticate_user(db: Database, email: str, password: str) -> Optional[User]:
+    """Authenticate a user by email and password.
+
+    Hashes stored with an outdated iteration count are transparently
+    re-derived with the current one once the password has been verified.
+    """
+    user = await db.run(get_user_by_email, email)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await run_password_kdf(verify_password, password, user.hashed_password):
         return None
+    if needs_rehash(user.hashed_password):
+        user.hashed_password = await run_password_kdf(get_password_hash, password)
+        await db.run(save_user, user)
     return user
 
 
-def get_current_user(
+class PrincipalCache:
+    """Bounded LRU of verified tokens and the principal each one identifies.
+
+    An entry lives until the earlier of its token's `exp` and the configured
+    TTL. Entries for a user are dropped as soon as that user row is updated
+    or deleted in this process; the TTL bounds staleness across processes.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[UserPrincipal, float]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[UserPrincipal]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            principal, expires_at = entry
+            if expires_at <= time.time():
+                self._discard(token)
+                return None
+            self._entries.move_to_end(token)
+            return principal
+
+    def put(self, token: str, principal: UserPrincipal, token_exp: Optional[float]) -> None:
+        if self.max_size <= 0:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        with self._lock:
+            self._discard(token)
+            self._entries[token] = (principal, expires_at)
+            self._tokens_by_user.setdefault(principal.id, set()).add(token)
+            while len(self._entries) > self.max_size:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._discard(token)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def _discard(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[0].id
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+
+principal_cache = PrincipalCache(
+    settings.principal_cache_size, settings.principal_cache_ttl_seconds
+)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_principals(_mapper, _connection, target: User) -> None:
+    principal_cache.invalidate_user(target.id)
+
+
+async def get_current_principal(
     token: str = Depends(oauth2_scheme),
-    session: Session = Depends(get_session),
-) -> User:
-    """Get the current authenticated user from JWT token."""
+    db: Database = Depends(get_db),
+) -> UserPrincipal:
+    """Resolve the caller from a JWT, without touching the DB for cached tokens.
+
+    Only the first request with a given token verifies its signature and loads
+    the user; later ones are served from `principal_cache`.
+    """
+    principal = principal_cache.get(token)
+    if principal is not None:
+        return principal
+    from jose import JWTError, jwt
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -126,25 +302,73 @@ def get_current_user(
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
         user_id_raw = payload.get("sub")
         if user_id_raw is None:
-            print(f"DEBUG: Token payload missing 'sub': {payload}")
+            logger.debug("Token payload missing 'sub': %s", payload)
             raise credentials_exception
         
         # Convert to int if it's a string
         try:
             user_id = int(user_id_raw) if isinstance(user_id_raw, str) else user_id_raw
         except (ValueError, TypeError) as e:
-            print(f"DEBUG: Failed to convert user_id to int: {user_id_raw}, error: {e}")
+            logger.debug("Failed to convert user_id to int: %r, error: %s", user_id_raw, e)
             raise credentials_exception
         
-        user = session.get(User, user_id)
+        user = await db.run(get_user_by_id, user_id)
         if user is None:
-            print(f"DEBUG: User not found with id: {user_id}")
+            logger.debug("User not found with id: %s", user_id)
             raise credentials_exception
-        return user
+    except HTTPException:
+        raise
     except JWTError as e:
-        print(f"DEBUG: JWT decode error: {e}")
-        raise credentials_exception
+        logger.debug("JWT decode error: %s", e)
+        raise credentials_exception from e
     except Exception as e:
-        print(f"DEBUG: Unexpected error in get_current_user: {e}")
-        raise credentials_exception
+        logger.exception("Unexpected error in get_current_principal")
+        raise credentials_exception from e
+
+    principal = UserPrincipal(id=user.id, email=user.email)
+    principal_cache.put(token, principal, payload.get("exp"))
+    return principal
+
+
+async def get_current_user(
+    principal: UserPrincipal = Depends(get_current_principal),
+    db: Database = Depends(get_db),
+) -> User:
+    """Get the current authenticated user from JWT token, loaded from the DB."""
+    user = await db.run(get_user_by_id, principal.id)
+    if user is None:
+        principal_cache.invalidate_user(principal.id)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
 
+
+# Methods that never write; they are still served while a user's data is moved
+_READ_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+# Retry-After sent with writes refused during a move, in seconds
+MOVING_RETRY_AFTER = 30
+
+
+async def get_user_db(
+    request: Request,
+    principal: UserPrincipal = Depends(get_current_principal),
+) -> AsyncGenerator[Database, None]:
+    """Yield a `Database` bound to the shard holding the current user's data.
+
+    While the user is being moved to another shard, reads are served from
+    the old one and writes are refused with 503 until the move completes.
+    Once the route has finished, the work its writes call for is queued.
+    """
+    placement = await user_placement(principal.id)
+    if placement.moving and request.method not in _READ_METHODS:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Account data is being moved; retry shortly",
+            headers={"Retry-After": str(MOVING_RETRY_AFTER)},
+        )
+    async with shard_database(placement.shard) as db:
+        yield db
+        await after_writes(principal.id, db)
@@ -0,0 +1,295 @@
+"""Streaming bulk import and export of transactions as CSV or NDJSON.
+
+Imports consume the request body incrementally: records are parsed line by
+line, validated, and handed to `crud.bulk_create_transactions` in fixed-size
+chunks. Exports read the transaction table, merged with archived segments and
+recurring occurrences, in fixed-size batches and encode each batch as it
+arrives. Either way memory use is bounded by the chunk size rather than by
+the size of the file or of the user's history.
+"""
+import codecs
+import csv
+import io
+import itertools
+import json
+import zlib
+from datetime import date, datetime
+from typing import AsyncIterator, Iterator, List, Optional, Sequence, Tuple, Union
+
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session
+
+from . import crud
+from .database import Database, async_session, async_shard_engines, shard_engines
+from .models import ImportResult, ImportRowError, TransactionCreate, TransactionFilter
+
+IMPORT_FORMATS = ("csv", "ndjson")
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+_CONTENT_TYPE_FORMATS = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/x-jsonlines": "ndjson",
+}
+
+
+def format_from_content_type(content_type: Optional[str]) -> Optional[str]:
+    """Map a request Content-Type to an import format, if it names one."""
+    if not content_type:
+        return None
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return _CONTENT_TYPE_FORMATS.get(media_type)
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, str]]:
+    """Yield (line number, line) pairs from a byte stream, without line endings."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    line_no = 0
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            line_no += 1
+            yield line_no, line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield line_no + 1, pending.rstrip("\r")
+
+
+async def _iter_csv_records(lines: AsyncIterator[Tuple[int, str]]):
+    """Yield (line number, record dict or error message) from CSV lines.
+
+    The first line is the header. Quoted fields may span lines; physical lines
+    are joined until the quotes balance before the record is parsed.
+    """
+    header: Optional[List[str]] = None
+    record, start = "", 0
+    async for line_no, line in lines:
+        if not record:
+            start = line_no
+            record = line
+        else:
+            record += "\n" + line
+        if record.count('"') % 2:
+            continue
+        text, record = record, ""
+        if not text.strip():
+            continue
+        try:
+            values = next(csv.reader([text]))
+        except csv.Error as exc:
+            yield start, f"Malformed CSV: {exc}"
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield start, f"Expected {len(header)} fields, got {len(values)}"
+            continue
+        yield start, dict(zip(header, values))
+    if record:
+        yield start, "Unterminated quoted field"
+
+
+async def _iter_ndjson_records(lines: AsyncIterator[Tuple[int, str]]):
+    """Yield (line number, record dict or error message) from NDJSON lines."""
+    async for line_no, line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield line_no, f"Invalid JSON: {exc}"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, "Expected a JSON object"
+            continue
+        yield line_no, record
+
+
+def _describe_validation_error(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc']) or 'record'}: {error['msg']}"
+        for error in exc.errors()
+    )
+
+
+async def import_transactions(
+    db: Database,
+    user_id: int,
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+) -> ImportResult:
+    """Validate and insert every record of an upload, reporting per-row errors.
+
+    Invalid records are skipped and reported; valid ones are inserted a chunk
+    at a time with one INSERT and one commit each. A chunk the database
+    rejects is rolled back and all of its rows are reported as failed.
+    """
+    result = ImportResult()
+
+    def report(line: int, error: str) -> None:
+        result.failed += 1
+        if len(result.errors) < MAX_REPORTED_ERRORS:
+            result.errors.append(ImportRowError(line=line, error=error))
+        else:
+            result.errors_truncated = True
+
+    async def flush(batch: List[Tuple[int, TransactionCreate]]) -> None:
+        try:
+            result.inserted += await db.run(
+                crud.bulk_create_transactions, [payload for _, payload in batch], user_id
+            )
+        except SQLAlchemyError as exc:
+            await db.rollback()
+            for line, _ in batch:
+                report(line, f"Database error: {exc.__class__.__name__}")
+
+    parse = _iter_csv_records if fmt == "csv" else _iter_ndjson_records
+    batch: List[Tuple[int, TransactionCreate]] = []
+    async for line, record in parse(_iter_lines(chunks)):
+        if isinstance(record, str):
+            report(line, record)
+            continue
+        try:
+            batch.append((line, TransactionCreate.model_validate(record)))
+        except ValidationError as exc:
+            report(line, _describe_validation_error(exc))
+            continue
+        if len(batch) >= chunk_size:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+    return result
+
+
+# Export
+
+def _plain_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return getattr(value, "value", value)  # enums
+
+
+def _encode_csv(rows: Sequence[tuple], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(crud.EXPORT_COLUMNS)
+    writer.writerows([_plain_value(value) for value in row] for row in rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def _encode_ndjson(rows: Sequence[tuple]) -> bytes:
+    return "".join(
+        json.dumps(dict(zip(crud.EXPORT_COLUMNS, map(_plain_value, row)))) + "\n"
+        for row in rows
+    ).encode("utf-8")
+
+
+class _ExportEncoder:
+    """Encodes row batches as CSV or NDJSON, optionally through a gzip stream."""
+
+    def __init__(self, fmt: str, compress: bool) -> None:
+        self.fmt = fmt
+        # wbits=31 selects the gzip container
+        self.compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def _emit(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) if self.compressor else data
+
+    def start(self) -> bytes:
+        return self._emit(_encode_csv((), header=True)) if self.fmt == "csv" else b""
+
+    def encode(self, rows: Sequence[tuple]) -> bytes:
+        chunk = _encode_csv(rows, header=False) if self.fmt == "csv" else _encode_ndjson(rows)
+        return self._emit(chunk)
+
+    def finish(self) -> bytes:
+        return self.compressor.flush() if self.compressor else b""
+
+
+def _export_sync(user_id, encoder, filters, batch_size, shard) -> Iterator[bytes]:
+    yield encoder.start()
+    with Session(shard_engines[shard]) as session:
+        for rows in crud.iter_transaction_rows(session, user_id, filters, batch_size):
+            data = encoder.encode(rows)
+            if data:
+                yield data
+    yield encoder.finish()
+
+
+async def _merge_rows(
+    batches: AsyncIterator[Sequence[tuple]], extra: Iterator[tuple], batch_size: int
+) -> AsyncIterator[Sequence[tuple]]:
+    """Merge newest-first `extra` rows into newest-first row batches."""
+    pending = next(extra, None)
+    async for rows in batches:
+        if pending is None:
+            yield rows
+            continue
+        merged = []
+        for row in rows:
+            while pending is not None and (pending.date, pending.id) > (row.date, row.id):
+                merged.append(pending)
+                pending = next(extra, None)
+                if len(merged) >= batch_size:
+                    yield merged
+                    merged = []
+            merged.append(row)
+        yield merged
+    while pending is not None:
+        yield [pending, *itertools.islice(extra, batch_size - 1)]
+        pending = next(extra, None)
+
+
+async def _export_async(user_id, encoder, filters, batch_size, shard) -> AsyncIterator[bytes]:
+    yield encoder.start()
+    async with async_session(async_shard_engines[shard]) as session:
+        archived = await session.run_sync(
+            crud.archived_transaction_rows, user_id, crud.EXPORT_COLUMNS, filters, batch_size
+        )
+        occurrences = await session.run_sync(
+            crud.recurring_transaction_rows, user_id, crud.EXPORT_COLUMNS, filters
+        )
+        extra = crud.merge_newest_first(archived, occurrences)
+        statement = crud.transaction_rows_statement(user_id, filters)
+        result = await session.stream(statement.execution_options(yield_per=batch_size))
+        async for rows in _merge_rows(result.partitions(), extra, batch_size):
+            data = encoder.encode(rows)
+            if data:
+                yield data
+    yield encoder.finish()
+
+
+def export_transactions(
+    user_id: int,
+    fmt: str,
+    filters: Optional[TransactionFilter] = None,
+    compress: bool = False,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    shard: int = 0,
+) -> Union[Iterator[bytes], AsyncIterator[bytes]]:
+    """Return a stream of a user's transactions, newest first, batch by batch.
+
+    Opens its own session because the body is produced after the request's
+    dependencies have been torn down. The stream is an async iterator on the
+    async database path and a plain iterator otherwise; `StreamingResponse`
+    accepts either. With `compress` the output is built as a gzip stream.
+    `shard` is the shard holding the user's data.
+    """
+    encoder = _ExportEncoder(fmt, compress)
+    if async_shard_engines:
+        return _export_async(user_id, encoder, filters, batch_size, shard)
+    return _export_sync(user_id, encoder, filters, batch_size, shard)
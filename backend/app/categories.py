@@ -0,0 +1,133 @@
+"""Category names, stored once in the `Category` table and referenced by id.
+
+Transactions, goals and the monthly rollup hold a category id instead of
+repeating the name on every row. The API still takes and returns names:
+`crud` turns names into ids on the way in and joins the names back in on
+the way out.
+
+The defaults below mirror CATEGORIES in src/types/index.js. They are seeded
+with the schema and shared by every user. Any other name becomes a custom
+category of the user who first uses it, and a name resolves to a default
+before one of the user's own.
+
+Categories are never renamed or deleted, so a name keeps its id for good.
+Lookups go through an in-process cache per database that never needs
+invalidating, only bounding. A category created by a transaction that has
+not committed yet is only cached once it does, so a rollback cannot leave
+the cache pointing at a row that does not exist.
+"""
+import threading
+import weakref
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+DEFAULT_CATEGORIES = (
+    "Food & Dining",
+    "Transportation",
+    "Entertainment",
+    "Bills & Utilities",
+    "Shopping",
+    "Healthcare",
+    "Education",
+    "Travel",
+    "Income",
+    "Other",
+)
+
+# Names kept per database before the cache starts over; custom categories
+# make the number of names grow with the number of users
+MAX_CACHED_CATEGORIES = 100_000
+
+# `Session.info` key of the categories created in the session's transaction
+_PENDING_KEY = "spendshift_new_categories"
+
+CategoryKey = Tuple[Optional[int], str]
+
+
+class CategoryCache:
+    """Name to id and id to name lookups of one database's categories.
+
+    Keys are (owner, name) with owner None for the defaults. Safe to use from
+    any thread.
+    """
+
+    def __init__(self, max_entries: int = MAX_CACHED_CATEGORIES) -> None:
+        self.max_entries = max_entries
+        self._ids: Dict[CategoryKey, int] = {}
+        self._names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def id_of(self, user_id: int, name: str) -> Optional[int]:
+        """Id `name` resolves to for `user_id`, if cached."""
+        found = self._ids.get((None, name))
+        return found if found is not None else self._ids.get((user_id, name))
+
+    def name_of(self, category_id: int) -> Optional[str]:
+        return self._names.get(category_id)
+
+    def add(self, category_id: int, user_id: Optional[int], name: str) -> None:
+        with self._lock:
+            if len(self._names) >= self.max_entries:
+                self._ids.clear()
+                self._names.clear()
+            self._ids[(user_id, name)] = category_id
+            self._names[category_id] = name
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids.clear()
+            self._names.clear()
+
+
+_caches: "weakref.WeakKeyDictionary[Engine, CategoryCache]" = weakref.WeakKeyDictionary()
+_caches_lock = threading.Lock()
+
+
+def cache_for(bind) -> CategoryCache:
+    """The cache of the database behind an engine, connection or session."""
+    if isinstance(bind, Session):
+        bind = bind.get_bind()
+    engine = bind.engine
+    cache = _caches.get(engine)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.setdefault(engine, CategoryCache())
+    return cache
+
+
+def remember(
+    session: Session, rows: Iterable[Tuple[int, Optional[int], str]], created: bool = False
+) -> None:
+    """Cache (id, owner, name) rows read or, with `created`, inserted by `session`.
+
+    Created rows are held back until the session commits, and so are rows it
+    reads back before then.
+    """
+    pending: Dict[int, CategoryKey] = session.info.setdefault(_PENDING_KEY, {})
+    if created:
+        pending.update((category_id, (owner, name)) for category_id, owner, name in rows)
+        return
+    cache = cache_for(session)
+    for category_id, owner, name in rows:
+        if category_id not in pending:
+            cache.add(category_id, owner, name)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        cache = cache_for(session)
+        for category_id, (owner, name) in pending.items():
+            cache.add(category_id, owner, name)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,184 @@
+"""Maintenance commands for the SpendShift backend.
+
+Run from the ``backend/`` directory, e.g.::
+
+    python -m app.cli rebuild-rollups
+"""
+import argparse
+import time
+from datetime import date, timedelta
+from typing import List, Optional
+
+from sqlmodel import Session
+
+from . import crud, search, sharding
+from .config import get_settings
+from .database import init_db, shard_engines
+
+
+def _shards(user_id: Optional[int] = None) -> List[int]:
+    """Every shard, or only the one holding `user_id`."""
+    if user_id is not None:
+        return [sharding.user_placement_sync(user_id).shard]
+    return list(range(len(shard_engines)))
+
+
+def rebuild_rollups(args: argparse.Namespace) -> None:
+    written = 0
+    for shard in _shards(args.user_id):
+        with Session(shard_engines[shard]) as session:
+            written += crud.rebuild_rollups(session, args.user_id)
+    print(f"Rebuilt {written} rollup rows")
+
+
+def rebuild_search_index(_args: argparse.Namespace) -> None:
+    for shard in _shards():
+        search.rebuild(shard_engines[shard])
+    print(f"Rebuilt {search.FTS_TABLE}")
+
+
+def precompute_insights(args: argparse.Namespace) -> None:
+    from . import analytics
+
+    started = time.perf_counter()
+    computed = skipped = 0
+    for shard in _shards():
+        shard_computed, shard_skipped = analytics.precompute_insights(
+            args.as_of, args.workers, args.chunk_size, args.force, shard
+        )
+        computed += shard_computed
+        skipped += shard_skipped
+    print(
+        f"Computed insights for {computed} users, {skipped} already current "
+        f"({time.perf_counter() - started:.1f}s)"
+    )
+
+
+def archive_transactions(args: argparse.Namespace) -> None:
+    # NumPy is only loaded by processes that read or write segments
+    from . import archive
+
+    before = date.today() - timedelta(days=args.horizon_days)
+    started = time.perf_counter()
+    moved = users = 0
+    for shard in _shards(args.user_id):
+        with Session(shard_engines[shard]) as session:
+            if args.user_id is not None:
+                selected = [args.user_id]
+            else:
+                selected = archive.users_to_archive(session, before)
+            moved += sum(archive.archive_user(session, user_id, before) for user_id in selected)
+            users += len(selected)
+    sessions = [Session(shard_engines[shard]) for shard in _shards()]
+    try:
+        removed = archive.collect_garbage(sessions)
+    finally:
+        for session in sessions:
+            session.close()
+    print(
+        f"Archived {moved} transactions dated before {before} for {users} users, "
+        f"removed {removed} unused segment files ({time.perf_counter() - started:.1f}s)"
+    )
+
+
+def sync_schema(_args: argparse.Namespace) -> None:
+    init_db(force=True)
+    print("Schema is up to date")
+
+
+def move_user(args: argparse.Namespace) -> None:
+    moved = sharding.move_users([(args.user_id, args.shard)], args.settle_seconds)
+    for user_id, source, target, copied in moved:
+        print(f"Moved user {user_id} from shard {source} to shard {target} "
+              f"({copied} transactions)")
+    if not moved:
+        print(f"User {args.user_id} is already on shard {args.shard}")
+
+
+def rebalance_users(args: argparse.Namespace) -> None:
+    moves = sharding.plan_rebalance()
+    if args.dry_run:
+        for user_id, shard in moves:
+            print(f"Would move user {user_id} to shard {shard}")
+        print(f"{len(moves)} users to move")
+        return
+    started = time.perf_counter()
+    moved = 0
+    for start in range(0, len(moves), args.batch_size):
+        moved += len(sharding.move_users(moves[start:start + args.batch_size], args.settle_seconds))
+    print(f"Moved {moved} users ({time.perf_counter() - started:.1f}s)")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser(
+        "rebuild-rollups", help="Backfill the monthly rollup table from transactions"
+    )
+    rebuild.add_argument("--user-id", type=int, default=None, help="Only rebuild this user")
+    rebuild.set_defaults(handler=rebuild_rollups)
+
+    commands.add_parser(
+        "rebuild-search-index", help="Re-create the transaction full-text index (SQLite)"
+    ).set_defaults(handler=rebuild_search_index)
+
+    precompute = commands.add_parser(
+        "precompute-insights", help="Store insights for users whose transactions changed"
+    )
+    precompute.add_argument(
+        "--as-of", type=date.fromisoformat, default=date.today(), help="Day to compute for"
+    )
+    precompute.add_argument(
+        "--workers", type=int, default=None,
+        help="Worker processes (default: one per CPU; 0 computes inline)",
+    )
+    precompute.add_argument("--chunk-size", type=int, default=500, help="Users per batch")
+    precompute.add_argument(
+        "--force", action="store_true", help="Recompute users whose transactions did not change"
+    )
+    precompute.set_defaults(handler=precompute_insights)
+
+    archive = commands.add_parser(
+        "archive-transactions", help="Move old transactions to per-year segment files"
+    )
+    archive.add_argument(
+        "--horizon-days", type=int, default=get_settings().archive_horizon_days,
+        help="Archive transactions dated more than this many days ago",
+    )
+    archive.add_argument("--user-id", type=int, default=None, help="Only archive this user")
+    archive.set_defaults(handler=archive_transactions)
+
+    commands.add_parser(
+        "sync-schema", help="Run schema creation even if the stored fingerprint is current"
+    ).set_defaults(handler=sync_schema)
+
+    move = commands.add_parser("move-user", help="Move a user's data to another shard")
+    move.add_argument("--user-id", type=int, required=True)
+    move.add_argument("--shard", type=int, required=True, help="Shard to move the user to")
+    move.add_argument(
+        "--settle-seconds", type=float, default=None,
+        help="Pause between the steps of a move (default: the placement cache TTL plus 1s)",
+    )
+    move.set_defaults(handler=move_user)
+
+    rebalance = commands.add_parser(
+        "rebalance-users", help="Move users until every shard holds about as many"
+    )
+    rebalance.add_argument("--dry-run", action="store_true", help="Only list the moves")
+    rebalance.add_argument(
+        "--batch-size", type=int, default=100,
+        help="Users moved together; their writes are refused until the batch is copied",
+    )
+    rebalance.add_argument("--settle-seconds", type=float, default=None)
+    rebalance.set_defaults(handler=rebalance_users)
+
+    args = parser.parse_args(argv)
+    # sync-schema runs the schema update itself, unconditionally
+    if args.handler is not sync_schema:
+        init_db()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,10 +12,76 @@ class Settings(BaseSettings):
     app_name: str = "SpendShift API"
     environment: str = "development"
     database_url: str = "sqlite:///./spendshift.db"
+    # Serve requests through an AsyncSession (aiosqlite/asyncpg) instead of
+    # sync sessions on the threadpool
+    async_database: bool = False
+    # "tuned" applies the SQLite pragmas below on every new connection;
+    # "default" leaves SQLite's own defaults (rollback journal, no busy timeout)
+    database_profile: str = "tuned"
+    sqlite_journal_mode: str = "wal"
+    sqlite_synchronous: str = "normal"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_cache_size_kib: int = 64 * 1024
+    sqlite_mmap_size_bytes: int = 256 * 1024 * 1024
+    sqlite_foreign_keys: bool = True
+    # Databases users' data is spread across. Empty keeps everything in
+    # database_url, which always holds the user directory; list it first when
+    # sharding an existing deployment, since unplaced users live on shard 0
+    shard_database_urls: List[str] = []
+    # How long a process routes a user by its cached placement; moves between
+    # shards wait this long for every process to see them
+    shard_cache_ttl_seconds: float = 5
+    # Connection pool for server databases (PostgreSQL etc.)
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout_seconds: int = 30
+    db_pool_recycle_seconds: int = 1800
     cors_origins: List[AnyHttpUrl] | None = None
     secret_key: str = "your-secret-key-change-in-production"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    # Verified-token cache used by auth.get_current_principal; size 0 disables it
+    principal_cache_size: int = 10_000
+    principal_cache_ttl_seconds: int = 300
+    # PBKDF2 cost; stored hashes with a different count are upgraded on login
+    password_hash_iterations: int = 100_000
+    # Dedicated key-derivation pool; requests beyond workers + max_pending get 503
+    password_hash_workers: int = 4
+    password_hash_max_pending: int = 64
+    # Sliding-window limits on login/register attempts, checked before hashing.
+    # Backend "memory" is per process; "sqlite" shares counters between the
+    # workers on a host through auth_rate_limit_store_path
+    auth_rate_limit_enabled: bool = True
+    auth_rate_limit_window_seconds: int = 60
+    auth_rate_limit_per_ip: int = 30
+    auth_rate_limit_per_email: int = 10
+    auth_rate_limit_max_keys: int = 100_000
+    auth_rate_limit_backend: str = "memory"
+    auth_rate_limit_store_path: str = "./ratelimit.db"
+    # Encoded list responses kept per process, in bytes; 0 disables the cache.
+    # Larger responses (e.g. unpaginated lists) are not cached
+    response_cache_max_bytes: int = 64 * 1024 * 1024
+    response_cache_max_entry_bytes: int = 4 * 1024 * 1024
+    # Transactions dated more than archive_horizon_days ago are moved to
+    # per-user, per-year segment files under archive_dir by the
+    # archive-transactions command
+    archive_dir: str = "./archive"
+    archive_horizon_days: int = 730
+    # Users whose transaction arrays and insights are kept in memory
+    insights_cache_size: int = 1000
+    # In-process queue of work that follows writes (app.jobs); 0 workers turns
+    # it off. A user's repeated jobs within the coalesce window run once; a
+    # write waits at most the submit timeout for room in a full queue before
+    # its job is dropped; shutdown runs waiting jobs for up to the drain timeout
+    work_queue_workers: int = 2
+    work_queue_max_size: int = 10_000
+    work_queue_coalesce_seconds: float = 2.0
+    work_queue_submit_timeout_seconds: float = 0.05
+    work_queue_drain_timeout_seconds: float = 10.0
+    # Request/SQL instrumentation served on /metrics
+    metrics_enabled: bool = True
+    # Log requests slower than this, with their SQL statements; 0 disables
+    slow_request_ms: float = 0
 
     model_config = {
         "env_prefix": "SPENDSHIFT_",
@@ -1,38 +1,729 @@
-from typing import Iterable, Optional
+import base64
+import binascii
+import heapq
+import itertools
+from collections import defaultdict, namedtuple
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
+from sqlalchemy import and_, column, delete, func, insert, literal_column, or_, table, tuple_, update
 from sqlmodel import Session, select
 
+from . import categories, recurring, search
+from .response_cache import response_cache
 from .models import (
+    ArchiveSegment,
+    Category,
+    CategoryTotal,
+    DataVersion,
     Goal,
     GoalCreate,
+    GoalFilter,
+    GoalRead,
     GoalUpdate,
+    MonthlyRollup,
+    RecurringException,
+    RecurringRule,
+    RecurringRuleCreate,
+    RecurringRuleUpdate,
     Transaction,
     TransactionCreate,
+    TransactionFilter,
+    TransactionRead,
+    TransactionSummary,
+    TransactionType,
     TransactionUpdate,
+    Tombstone,
+    User,
+    UserInsights,
 )
 
+RollupKey = Tuple[date, int, TransactionType]
+
+
+def _upsert_insert(dialect_name: str):
+    """The dialect's INSERT with ON CONFLICT support, or None without one.
+
+    Dialect modules are imported on first use, so SQLite deployments never
+    load the PostgreSQL dialect.
+    """
+    if dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert
+
+
+# Column order of the read models, which the fast list path encodes directly
+TRANSACTION_READ_COLUMNS = tuple(TransactionRead.model_fields)
+GOAL_READ_COLUMNS = tuple(GoalRead.model_fields)
+
+TRANSACTIONS_SCOPE = "transactions"
+GOALS_SCOPE = "goals"
+CHANGES_SCOPE = "changes"
+
+TRANSACTION_ENTITY = "transaction"
+GOAL_ENTITY = "goal"
+
+# `Session.info` key of the scopes changed through the session, read by
+# `jobs.after_writes` to queue the work that follows them
+CHANGED_SCOPES_KEY = "spendshift_changed_scopes"
+
+
+# Change tracking
+
+def get_data_version(session: Session, user_id: int, scope: str) -> int:
+    """Current change counter of a user's collection; 0 if never changed."""
+    row = session.exec(
+        select(DataVersion.version)
+        .where(DataVersion.user_id == user_id)
+        .where(DataVersion.scope == scope)
+    ).first()
+    return row or 0
+
+
+def _bump_version(session: Session, user_id: int, scope: str) -> int:
+    """Increment one of a user's counters; returns the new value."""
+    dialect_insert = _upsert_insert(session.get_bind().dialect.name)
+    if dialect_insert is None:
+        row = session.get(DataVersion, (user_id, scope)) or DataVersion(
+            user_id=user_id, scope=scope
+        )
+        row.version += 1
+        session.add(row)
+        return row.version
+    table = DataVersion.__table__
+    statement = dialect_insert(table).values(user_id=user_id, scope=scope, version=1)
+    return session.execute(
+        statement.on_conflict_do_update(
+            index_elements=["user_id", "scope"], set_={"version": table.c.version + 1}
+        ).returning(table.c.version)
+    ).scalar_one()
+
+
+def _record_change(session: Session, user_id: int, scope: str) -> None:
+    """Note a change to a user's collection inside the caller's transaction.
+
+    Also drops the collection's cached list responses in this process; they
+    are keyed by version, so this only frees memory early.
+    """
+    _bump_version(session, user_id, scope)
+    response_cache.invalidate(scope, user_id)
+    session.info.setdefault(CHANGED_SCOPES_KEY, set()).add(scope)
 
-# Transaction helpers
 
-def list_transactions(session: Session, user_id: int) -> Iterable[Transaction]:
+def _next_change_seq(session: Session, user_id: int) -> int:
+    """Allocate the next number of a user's change sequence.
+
+    Every row a write touches is stamped with it, and deletes leave tombstones
+    carrying it. The counter row stays locked until the caller commits, so
+    one user's writes commit in sequence order and a sync reader never sees a
+    number appear behind one it has already passed. Numbers allocated by
+    writes that end up changing nothing leave harmless gaps.
+    """
+    return _bump_version(session, user_id, CHANGES_SCOPE)
+
+
+def _add_tombstones(
+    session: Session, user_id: int, entity: str, ids: Sequence[int], seq: int
+) -> None:
+    now = datetime.utcnow()
+    session.execute(insert(Tombstone.__table__), [
+        {"user_id": user_id, "entity": entity, "entity_id": entity_id, "seq": seq,
+         "deleted_at": now}
+        for entity_id in ids
+    ])
+
+
+def reissue_changes(session: Session, user_id: int, replaced: Dict[str, Sequence[int]]) -> int:
+    """Record that a user's rows are being re-created under new ids.
+
+    `replaced` maps an entity to the ids it had before. Those get tombstones,
+    and the returned change sequence number, which the caller stamps the new
+    rows with, sorts after them. A new row can get one of the old ids back;
+    `list_changes` then leaves its tombstone out of any page that holds the
+    row. Used when a user moves between shards.
+    """
+    seq = _next_change_seq(session, user_id)
+    for entity, ids in replaced.items():
+        if ids:
+            _add_tombstones(session, user_id, entity, ids, seq)
+    _record_change(session, user_id, TRANSACTIONS_SCOPE)
+    _record_change(session, user_id, GOALS_SCOPE)
+    return _next_change_seq(session, user_id)
+
+
+# Category helpers
+
+def category_ids(session: Session, user_id: int, names: Iterable[str]) -> Dict[str, int]:
+    """Ids of category names as `user_id` uses them.
+
+    Names that are neither a default nor one of the user's categories yet
+    are created as the user's, in the caller's transaction.
+    """
+    cache = categories.cache_for(session)
+    ids, missing = {}, set()
+    for name in set(names):
+        category_id = cache.id_of(user_id, name)
+        if category_id is None:
+            missing.add(name)
+        else:
+            ids[name] = category_id
+    if not missing:
+        return ids
+    ids.update(_load_category_ids(session, user_id, missing))
+    missing.difference_update(ids)
+    if missing:
+        _create_categories(session, user_id, missing)
+        ids.update(_load_category_ids(session, user_id, missing))
+    return ids
+
+
+def _load_category_ids(session: Session, user_id: int, names: set) -> Dict[str, int]:
     statement = (
-        select(Transaction)
-        .where(Transaction.user_id == user_id)
-        .order_by(Transaction.date.desc(), Transaction.id.desc())
+        select(Category.id, Category.user_id, Category.name)
+        .where(or_(Category.user_id.is_(None), Category.user_id == user_id))
+        .where(Category.name.in_(names))
+    )
+    rows = list(session.exec(statement))
+    categories.remember(session, rows)
+    ids = {}
+    # Defaults win over a custom category of the same name
+    for category_id, owner, name in sorted(rows, key=lambda row: row[1] is None):
+        ids[name] = category_id
+    return ids
+
+
+def _create_categories(session: Session, user_id: int, names: set) -> None:
+    """Insert custom categories, tolerating ones a concurrent writer just created."""
+    table = Category.__table__
+    rows = [{"user_id": user_id, "name": name} for name in sorted(names)]
+    dialect_insert = _upsert_insert(session.get_bind().dialect.name)
+    if dialect_insert is None:
+        session.add_all(Category(**row) for row in rows)
+        session.flush()
+    else:
+        session.execute(dialect_insert(table).on_conflict_do_nothing(), rows)
+    created = session.exec(
+        select(Category.id, Category.user_id, Category.name)
+        .where(Category.user_id == user_id)
+        .where(Category.name.in_(names))
     )
-    return session.exec(statement)
+    categories.remember(session, created, created=True)
+
+
+def category_names(session: Session, ids: Iterable[Optional[int]]) -> Dict[int, str]:
+    """Names of category ids; None ids are skipped."""
+    cache = categories.cache_for(session)
+    names, missing = {}, set()
+    for category_id in set(ids):
+        if category_id is None:
+            continue
+        name = cache.name_of(category_id)
+        if name is None:
+            missing.add(category_id)
+        else:
+            names[category_id] = name
+    if missing:
+        rows = list(session.exec(
+            select(Category.id, Category.user_id, Category.name).where(Category.id.in_(missing))
+        ))
+        categories.remember(session, rows)
+        names.update((category_id, name) for category_id, _owner, name in rows)
+    return names
+
+
+def _category_clause(model, name: str):
+    """Match `model` rows in the category called `name`.
+
+    A user's rows only point at the defaults and at the user's own
+    categories, so once rows are limited to one user the name alone is enough.
+    """
+    return model.category_id.in_(select(Category.id).where(Category.name == name))
+
+
+def _read_columns(model, names: Sequence[str]) -> list:
+    """Columns selecting read-model fields of `model`, the category as its name.
+
+    Statements selecting them go through `_join_category`.
+    """
+    return [
+        Category.name.label(name) if name == "category" else getattr(model, name)
+        for name in names
+    ]
+
+
+def _join_category(statement, model):
+    # An outer join leaves SQLite free to keep driving the query from `model`
+    return statement.outerjoin(Category, Category.id == model.category_id)
+
+
+def _category_values(session: Session, user_id: int, values: dict) -> dict:
+    """Column values with a "category" name replaced by its "category_id"."""
+    if "category" not in values:
+        return values
+    values = dict(values)
+    name = values.pop("category")
+    values["category_id"] = None if name is None else category_ids(session, user_id, [name])[name]
+    return values
+
+
+@lru_cache(maxsize=32)
+def _named_row_type(names: Tuple[str, ...]):
+    return namedtuple("Row", names)
+
+
+def _with_category_names(session: Session, rows: list, names: Sequence[str]) -> list:
+    """Rows whose "category" holds ids, as `names` tuples holding names instead."""
+    if "category" not in names:
+        return rows
+    position = names.index("category")
+    lookup = category_names(session, (row[position] for row in rows))
+    row_type = _named_row_type(tuple(names))
+    return [
+        row_type(*row[:position], lookup.get(row[position]), *row[position + 1:]) for row in rows
+    ]
+
+
+def _read_model(session: Session, instance, read_model):
+    """Build `read_model` from a table model instance, naming its category."""
+    values = {
+        name: getattr(instance, name) for name in read_model.model_fields if name != "category"
+    }
+    values["category"] = category_names(session, [instance.category_id]).get(
+        instance.category_id
+    )
+    return read_model(**values)
+
+
+# Archive helpers
+
+def archived_segments(
+    session: Session,
+    user_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    ids: Optional[Sequence[int]] = None,
+) -> List[ArchiveSegment]:
+    """Manifest entries of a user's archived transactions, newest year first.
+
+    `start` and `end` skip segments entirely outside that date range, and
+    `ids` those whose id range holds none of them. Callers only import
+    `app.archive` (and with it NumPy) when this is non-empty.
+    """
+    statement = (
+        select(ArchiveSegment)
+        .where(ArchiveSegment.user_id == user_id)
+        .order_by(ArchiveSegment.year.desc())
+    )
+    if start is not None:
+        statement = statement.where(ArchiveSegment.max_date >= start)
+    if end is not None:
+        statement = statement.where(ArchiveSegment.min_date <= end)
+    if ids is not None:
+        ids = [row_id for row_id in ids if row_id >= 0]
+        if not ids:
+            return []
+        statement = statement.where(or_(
+            ArchiveSegment.min_id.is_(None),
+            and_(ArchiveSegment.min_id <= max(ids), ArchiveSegment.max_id >= min(ids)),
+        ))
+    return list(session.exec(statement))
+
+
+def _filter_range(filters: Optional[TransactionFilter]) -> Tuple[Optional[date], Optional[date]]:
+    if filters is None:
+        return None, None
+    return filters.start_date, filters.end_date
+
+
+def _newest_first(row) -> Tuple[date, int]:
+    return row.date, row.id
+
+
+def merge_newest_first(*sources: Iterator[tuple]) -> Iterator[tuple]:
+    """Merge iterables of rows that are each newest first by (date, id)."""
+    return heapq.merge(*sources, key=_newest_first, reverse=True)
+
 
+def _take(rows: Iterator[tuple], limit: Optional[int]) -> list:
+    return list(rows if limit is None else itertools.islice(rows, limit))
 
-def create_transaction(session: Session, payload: TransactionCreate, user_id: int) -> Transaction:
-    transaction = Transaction(**payload.dict(), user_id=user_id)
+
+def _with_archived_rows(
+    session: Session,
+    user_id: int,
+    rows: list,
+    names: Sequence[str],
+    filters: Optional[TransactionFilter],
+    cursor: Optional[str],
+    limit: Optional[int],
+) -> list:
+    """Merge a user's archived rows into `rows`, a newest-first list of hot rows.
+
+    With `limit` the hot rows hold at most `limit` rows after `cursor` and so
+    does the result; segments older than a full hot page are not read.
+    """
+    start, end = _filter_range(filters)
+    if limit is not None and len(rows) >= limit:
+        end = rows[-1].date if end is None else min(end, rows[-1].date)
+    entries = archived_segments(session, user_id, start, end)
+    if not entries:
+        return rows
+    from . import archive
+
+    archived = itertools.chain.from_iterable(archive.iter_rows(
+        entries, user_id, names, filters,
+        before=None if cursor is None else decode_cursor(cursor),
+        batch_size=limit or archive.DEFAULT_BATCH_SIZE,
+    ))
+    return _take(merge_newest_first(rows, archived), limit)
+
+
+def _rehydrate_selection(
+    session: Session,
+    user_id: int,
+    ids: Optional[Sequence[int]],
+    filters: Optional[TransactionFilter],
+) -> None:
+    """Move archived rows picked by `ids` and `filters` back into the table."""
+    entries = archived_segments(session, user_id, *_filter_range(filters), ids=ids)
+    if entries:
+        from . import archive
+
+        archive.rehydrate(session, user_id, entries, ids, filters)
+
+
+# Transaction helpers
+
+def encode_cursor(transaction: Transaction) -> str:
+    """Encode the (date, id) sort key of a transaction or row as an opaque cursor."""
+    raw = f"{transaction.date.isoformat()}|{transaction.id}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[date, int]:
+    """Decode a cursor produced by `encode_cursor`. Raises ValueError if malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("ascii")
+        date_part, id_part = raw.split("|")
+        return date.fromisoformat(date_part), int(id_part)
+    except (binascii.Error, UnicodeError, ValueError) as exc:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from exc
+
+
+def _transaction_filter_clauses(filters: Optional[TransactionFilter]) -> list:
+    if filters is None:
+        return []
+    clauses = []
+    if filters.start_date is not None:
+        clauses.append(Transaction.date >= filters.start_date)
+    if filters.end_date is not None:
+        clauses.append(Transaction.date <= filters.end_date)
+    if filters.type is not None:
+        clauses.append(Transaction.type == filters.type)
+    if filters.category is not None:
+        clauses.append(_category_clause(Transaction, filters.category))
+    if filters.min_amount is not None:
+        clauses.append(Transaction.amount >= filters.min_amount)
+    if filters.max_amount is not None:
+        clauses.append(Transaction.amount <= filters.max_amount)
+    return clauses
+
+
+def _filter_transactions(statement, filters: Optional[TransactionFilter]):
+    clauses = _transaction_filter_clauses(filters)
+    return statement.where(*clauses) if clauses else statement
+
+
+def _transaction_list_statement(
+    statement,
+    user_id: int,
+    filters: Optional[TransactionFilter],
+    limit: Optional[int],
+    cursor: Optional[str],
+):
+    statement = _filter_transactions(statement.where(Transaction.user_id == user_id), filters)
+    if cursor is not None:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        statement = statement.where(
+            tuple_(Transaction.date, Transaction.id) < (cursor_date, cursor_id)
+        )
+    statement = statement.order_by(Transaction.date.desc(), Transaction.id.desc())
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement
+
+
+def list_transactions(
+    session: Session,
+    user_id: int,
+    filters: Optional[TransactionFilter] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> List[Transaction]:
+    """List a user's transactions newest first.
+
+    `cursor` resumes strictly after the (date, id) it encodes, so together with
+    `limit` the cost of a page is bounded by the page size via the
+    (user_id, date, id) index rather than by the length of the history.
+    Archived transactions are not included; `list_transaction_rows` merges
+    them in.
+    """
+    statement = _transaction_list_statement(
+        select(Transaction), user_id, filters, limit, cursor
+    )
+    return list(session.exec(statement))
+
+
+def _split_page(rows: list, limit: Optional[int]) -> Tuple[list, Optional[str]]:
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    return page, encode_cursor(page[-1])
+
+
+def list_transaction_page(
+    session: Session,
+    user_id: int,
+    limit: int,
+    filters: Optional[TransactionFilter] = None,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Transaction], Optional[str]]:
+    """Return one page of transactions and the cursor of the next page, if any."""
+    return _split_page(list_transactions(session, user_id, filters, limit + 1, cursor), limit)
+
+
+def list_transaction_rows(
+    session: Session,
+    user_id: int,
+    filters: Optional[TransactionFilter] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    as_of: Optional[date] = None,
+    occurrences: bool = True,
+) -> Tuple[list, Optional[str]]:
+    """Like `list_transaction_page`, as `TRANSACTION_READ_COLUMNS` rows.
+
+    Without `limit` every matching row is returned and the cursor is None.
+    Archived transactions are merged in, and so are occurrences of recurring
+    rules up to the filter's end date or, without one, `as_of` (today),
+    unless `occurrences` is false.
+    """
+    page_size = None if limit is None else limit + 1
+    statement = _transaction_list_statement(
+        _join_category(select(*_read_columns(Transaction, TRANSACTION_READ_COLUMNS)), Transaction),
+        user_id, filters, page_size, cursor,
+    )
+    rows = _with_archived_rows(
+        session, user_id, list(session.execute(statement)), TRANSACTION_READ_COLUMNS,
+        filters, cursor, page_size,
+    )
+    if occurrences:
+        rows = merge_newest_first(rows, recurring_transaction_rows(
+            session, user_id, TRANSACTION_READ_COLUMNS, filters, as_of,
+            before=None if cursor is None else decode_cursor(cursor),
+        ))
+    return _split_page(_take(rows, page_size), limit)
+
+
+def search_transaction_rows(
+    session: Session,
+    user_id: int,
+    query: str,
+    filters: Optional[TransactionFilter] = None,
+    limit: int = 50,
+    offset: int = 0,
+    sort: str = "relevance",
+) -> Tuple[list, Optional[int]]:
+    """Find a user's transactions whose description or category match `query`.
+
+    Every word of the query must match the start of a word in either column.
+    Returns one page of `TRANSACTION_READ_COLUMNS` rows and the offset of the
+    next page, if there is one. `sort="relevance"` ranks by bm25, with
+    description matches weighing more than category matches; `sort="date"`
+    lists newest first. Databases without the FTS index ignore relevance.
+    """
+    expression = search.match_expression(user_id, query)
+    if expression is None:
+        return [], None
+    columns = _read_columns(Transaction, TRANSACTION_READ_COLUMNS)
+    newest_first = (Transaction.date.desc(), Transaction.id.desc())
+    if session.get_bind().dialect.name == "sqlite":
+        fts = table(search.FTS_TABLE, column("rowid"))
+        statement = (
+            select(*columns)
+            .select_from(fts)
+            .join(Transaction, Transaction.id == fts.c.rowid)
+            .outerjoin(Category, Category.id == Transaction.category_id)
+            # Terms are scoped to their owner, so the match already restricts
+            # rows to the user. The owner is still checked, since a row
+            # written by another tool since the index was built can hold a
+            # rowid indexed for someone else; `+ 0` keeps SQLite from driving
+            # the join from the user's date index instead of the match.
+            .where(literal_column(search.FTS_TABLE).op("MATCH")(expression))
+            .where(Transaction.user_id + 0 == user_id)
+        )
+        if sort == "relevance":
+            rank = func.bm25(literal_column(search.FTS_TABLE), *search.RANK_WEIGHTS)
+            statement = statement.order_by(rank, *newest_first)
+        else:
+            statement = statement.order_by(*newest_first)
+    else:
+        statement = (
+            _join_category(select(*columns), Transaction)
+            .where(Transaction.user_id == user_id)
+            .where(and_(*(
+                or_(
+                    Transaction.description.icontains(word, autoescape=True),
+                    Category.name.icontains(word, autoescape=True),
+                )
+                for word in search.words(query)
+            )))
+            .order_by(*newest_first)
+        )
+    statement = _filter_transactions(statement, filters).limit(limit + 1).offset(offset)
+    rows = list(session.execute(statement))
+    if len(rows) <= limit:
+        return rows, None
+    return rows[:limit], offset + limit
+
+
+def create_transaction(
+    session: Session, payload: TransactionCreate, user_id: int
+) -> TransactionRead:
+    transaction = Transaction(
+        **_category_values(session, user_id, payload.dict()),
+        user_id=user_id,
+        change_seq=_next_change_seq(session, user_id),
+    )
     session.add(transaction)
+    session.flush()
+    search.index_rows(session, Transaction.id == transaction.id)
+    _apply_rollup_deltas(session, user_id, _rollup_contribution(transaction))
+    _record_change(session, user_id, TRANSACTIONS_SCOPE)
     session.commit()
     session.refresh(transaction)
-    return transaction
+    return _read_model(session, transaction, TransactionRead)
+
+
+EXPORT_COLUMNS = (
+    "id", "date", "description", "amount", "category", "type", "created_at", "updated_at",
+)
+
+
+def transaction_rows_statement(user_id: int, filters: Optional[TransactionFilter] = None):
+    """Select plain `EXPORT_COLUMNS` tuples of a user's transactions, newest first."""
+    return _filter_transactions(
+        _join_category(select(*_read_columns(Transaction, EXPORT_COLUMNS)), Transaction).where(
+            Transaction.user_id == user_id
+        ),
+        filters,
+    ).order_by(Transaction.date.desc(), Transaction.id.desc())
+
+
+def iter_transaction_rows(
+    session: Session,
+    user_id: int,
+    filters: Optional[TransactionFilter] = None,
+    batch_size: int = 1000,
+    as_of: Optional[date] = None,
+) -> Iterator[Sequence[tuple]]:
+    """Yield batches of `transaction_rows_statement` rows.
+
+    Rows are fetched from the cursor `batch_size` at a time and never turned
+    into ORM objects, so memory stays flat regardless of history length.
+    Archived transactions are merged in, read from their segments batch by
+    batch as well, and so are recurring occurrences as in
+    `list_transaction_rows`.
+    """
+    statement = transaction_rows_statement(user_id, filters)
+    result = session.execute(statement.execution_options(yield_per=batch_size))
+    merged = merge_newest_first(
+        itertools.chain.from_iterable(result.partitions()),
+        archived_transaction_rows(session, user_id, EXPORT_COLUMNS, filters, batch_size),
+        recurring_transaction_rows(session, user_id, EXPORT_COLUMNS, filters, as_of),
+    )
+    while True:
+        batch = list(itertools.islice(merged, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def archived_transaction_rows(
+    session: Session,
+    user_id: int,
+    names: Sequence[str],
+    filters: Optional[TransactionFilter] = None,
+    batch_size: int = 1000,
+) -> Iterator[tuple]:
+    """A user's archived transactions as `names` tuples, newest first.
+
+    The session is only used up front, to read the manifest; rows are read
+    from the segment files `batch_size` at a time as the iterator advances.
+    """
+    entries = archived_segments(session, user_id, *_filter_range(filters))
+    if not entries:
+        return iter(())
+    from . import archive
+
+    return itertools.chain.from_iterable(
+        archive.iter_rows(entries, user_id, names, filters, batch_size=batch_size)
+    )
+
+
+def bulk_create_transactions(
+    session: Session, payloads: Sequence[TransactionCreate], user_id: int
+) -> int:
+    """Insert many transactions with one multi-row INSERT and one commit.
+
+    Unlike `create_transaction` the new rows are not loaded back; returns the
+    number of rows inserted.
+    """
+    if not payloads:
+        return 0
+    now = datetime.utcnow()
+    ids = category_ids(session, user_id, (payload.category for payload in payloads))
+    seq = _next_change_seq(session, user_id)
+    deltas: Dict[RollupKey, list] = defaultdict(lambda: [0.0, 0])
+    rows = []
+    for payload in payloads:
+        row = payload.dict()
+        row["category_id"] = ids[row.pop("category")]
+        rows.append(
+            dict(row, user_id=user_id, created_at=now, updated_at=now, change_seq=seq)
+        )
+        key = (_month_start(row["date"]), row["category_id"], TransactionType(row["type"]))
+        bucket = deltas[key]
+        bucket[0] += row["amount"]
+        bucket[1] += 1
+    session.execute(insert(Transaction.__table__), rows)
+    search.index_rows(session, Transaction.user_id == user_id, Transaction.change_seq == seq)
+    _apply_rollup_deltas(session, user_id, deltas)
+    _record_change(session, user_id, TRANSACTIONS_SCOPE)
+    session.commit()
+    return len(rows)
 
 
 def get_transaction(session: Session, transaction_id: int, user_id: int) -> Optional[Transaction]:
+    """Load a user's transaction for editing, moving it out of the archive if need be.
+
+    An occurrence id of a recurring rule is materialized as a transaction of
+    its own. A rehydrated or materialized row is only written when the caller
+    commits.
+    """
+    if recurring.parse_occurrence_id(transaction_id) is not None:
+        selected = _selected_occurrences(session, user_id, [transaction_id], None)
+        return _materialize_occurrences(session, user_id, selected)[0] if selected else None
     transaction = session.get(Transaction, transaction_id)
+    if transaction is None:
+        _rehydrate_selection(session, user_id, [transaction_id], None)
+        transaction = session.get(Transaction, transaction_id)
     if transaction and transaction.user_id == user_id:
         return transaction
     return None
@@ -40,37 +731,679 @@ def get_transaction(session: Session, transaction_id: int, user_id: int) -> Opti
 
 def update_transaction(
     session: Session, transaction: Transaction, payload: TransactionUpdate
-) -> Transaction:
-    for field, value in payload.dict(exclude_unset=True).items():
+) -> TransactionRead:
+    deltas = _rollup_contribution(transaction, sign=-1)
+    # Resolved before the object changes so autoflush has nothing to write yet
+    values = _category_values(session, transaction.user_id, payload.dict(exclude_unset=True))
+    seq = _next_change_seq(session, transaction.user_id)
+    reindex = bool(search.INDEXED_COLUMNS & values.keys())
+    if reindex:
+        search.unindex_rows(session, Transaction.id == transaction.id)
+    for field, value in values.items():
         setattr(transaction, field, value)
+    transaction.updated_at = datetime.utcnow()
+    transaction.change_seq = seq
+    for key, (amount, count) in _rollup_contribution(transaction).items():
+        deltas[key][0] += amount
+        deltas[key][1] += count
     session.add(transaction)
+    if reindex:
+        session.flush()
+        search.index_rows(session, Transaction.id == transaction.id)
+    _apply_rollup_deltas(session, transaction.user_id, deltas)
+    _record_change(session, transaction.user_id, TRANSACTIONS_SCOPE)
     session.commit()
     session.refresh(transaction)
-    return transaction
+    return _read_model(session, transaction, TransactionRead)
 
 
 def delete_transaction(session: Session, transaction: Transaction) -> None:
+    _apply_rollup_deltas(
+        session, transaction.user_id, _rollup_contribution(transaction, sign=-1)
+    )
+    _record_change(session, transaction.user_id, TRANSACTIONS_SCOPE)
+    _add_tombstones(
+        session, transaction.user_id, TRANSACTION_ENTITY, [transaction.id],
+        _next_change_seq(session, transaction.user_id),
+    )
+    search.unindex_rows(session, Transaction.id == transaction.id)
     session.delete(transaction)
     session.commit()
 
 
+def _transaction_selection(
+    user_id: int, ids: Optional[Sequence[int]], filters: Optional[TransactionFilter]
+) -> list:
+    """WHERE clauses picking a user's transactions by id or by filter."""
+    clauses = [Transaction.user_id == user_id]
+    if ids is not None:
+        clauses.append(Transaction.id.in_(ids))
+    return clauses + _transaction_filter_clauses(filters)
+
+
+def _batch_rollup_deltas(
+    session: Session, clauses: list, patch: Optional[dict] = None
+) -> Dict[RollupKey, list]:
+    """Rollup deltas of deleting, or applying `patch` to, the selected rows.
+
+    One grouped query gives the current contribution of the selection per
+    day and bucket; the contribution after the patch follows from it without
+    reading individual rows, since the patch sets the same values on all.
+    """
+    deltas: Dict[RollupKey, list] = defaultdict(lambda: [0.0, 0])
+    statement = (
+        select(Transaction.date, Transaction.category_id, Transaction.type,
+               func.sum(Transaction.amount), func.count())
+        .where(*clauses)
+        .group_by(Transaction.date, Transaction.category_id, Transaction.type)
+    )
+    for day, category, type_, total, count in session.exec(statement):
+        old = deltas[(_month_start(day), category, TransactionType(type_))]
+        old[0] -= total
+        old[1] -= count
+        if patch is None:
+            continue
+        new = deltas[(
+            _month_start(patch.get("date", day)),
+            patch.get("category_id", category),
+            TransactionType(patch.get("type", type_)),
+        )]
+        new[0] += patch["amount"] * count if "amount" in patch else total
+        new[1] += count
+    return deltas
+
+
+def _bulk_update(
+    session: Session, model, clauses: list, values: dict, read_model=None
+) -> Tuple[int, Optional[list]]:
+    """Run one set-based UPDATE; returns (rowcount, updated rows as `read_model`).
+
+    Without `read_model` no rows are read back. Otherwise UPDATE ... RETURNING
+    is used where the dialect has it; elsewhere the ids are collected first
+    so the rows can be read back even when the update moves them out of a
+    filter's range. Rows are validated through `read_model` with the
+    category named, like `_read_model` does for single rows.
+    """
+    statement = (
+        update(model)
+        .values(**values, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    if read_model is None:
+        return session.execute(statement.where(*clauses)).rowcount, None
+    columns = tuple(read_model.model_fields)
+    selected = [
+        model.category_id if name == "category" else getattr(model, name) for name in columns
+    ]
+    if session.get_bind().dialect.update_returning:
+        rows = list(session.execute(statement.where(*clauses).returning(*selected)))
+    else:
+        ids = list(session.scalars(select(model.id).where(*clauses)))
+        if not ids:
+            return 0, []
+        session.execute(statement.where(model.id.in_(ids)))
+        rows = list(session.execute(select(*selected).where(model.id.in_(ids))))
+    rows = _with_category_names(session, rows, columns)
+    return len(rows), [read_model.model_validate(dict(zip(columns, row))) for row in rows]
+
+
+def _bulk_delete(session: Session, model, clauses: list) -> List[int]:
+    """Run one set-based DELETE; returns the ids of the deleted rows.
+
+    Uses DELETE ... RETURNING where the dialect has it and collects the ids
+    first elsewhere.
+    """
+    statement = delete(model).execution_options(synchronize_session=False)
+    if session.get_bind().dialect.delete_returning:
+        return list(session.scalars(statement.where(*clauses).returning(model.id)))
+    ids = list(session.scalars(select(model.id).where(*clauses)))
+    if ids:
+        session.execute(statement.where(model.id.in_(ids)))
+    return ids
+
+
+def update_transactions(
+    session: Session,
+    user_id: int,
+    patch: TransactionUpdate,
+    ids: Optional[Sequence[int]] = None,
+    filters: Optional[TransactionFilter] = None,
+    return_rows: bool = False,
+    as_of: Optional[date] = None,
+) -> Tuple[int, Optional[list]]:
+    """Apply one patch to many of a user's transactions in a single statement.
+
+    Rows are picked by `ids` or by `filters`; unknown ids and other users'
+    rows are ignored. The rollup is adjusted from grouped aggregates and
+    everything commits once. Returns the number of rows updated and, with
+    `return_rows`, the rows as `TransactionRead` models newest first.
+    Archived rows in the selection are moved back to the table first, and
+    selected occurrences of recurring rules (up to `as_of` when picked by
+    filter) are materialized.
+    """
+    values = _category_values(session, user_id, patch.dict(exclude_unset=True, exclude_none=True))
+    _rehydrate_selection(session, user_id, ids, filters)
+    materialized = _materialize_occurrences(
+        session, user_id, _selected_occurrences(session, user_id, ids, filters, as_of)
+    )
+    if ids is not None and materialized:
+        ids = [row_id for row_id in ids if row_id >= 0] + [row.id for row in materialized]
+    clauses = _transaction_selection(user_id, ids, filters)
+    deltas = _batch_rollup_deltas(session, clauses, values)
+    seq = _next_change_seq(session, user_id)
+    reindex = bool(search.INDEXED_COLUMNS & values.keys())
+    if reindex:
+        search.unindex_rows(session, *clauses)
+    affected, rows = _bulk_update(
+        session, Transaction, clauses, dict(values, change_seq=seq),
+        TransactionRead if return_rows else None,
+    )
+    if reindex and affected:
+        # The clauses may no longer match the updated rows; their seq does
+        search.index_rows(session, Transaction.user_id == user_id, Transaction.change_seq == seq)
+    if rows:
+        rows.sort(key=lambda row: (row.date, row.id), reverse=True)
+    if affected:
+        _apply_rollup_deltas(session, user_id, deltas)
+        _record_change(session, user_id, TRANSACTIONS_SCOPE)
+    session.commit()
+    return affected, rows
+
+
+def delete_transactions(
+    session: Session,
+    user_id: int,
+    ids: Optional[Sequence[int]] = None,
+    filters: Optional[TransactionFilter] = None,
+    as_of: Optional[date] = None,
+) -> int:
+    """Delete many of a user's transactions with one DELETE and one commit.
+
+    Selected occurrences of recurring rules (up to `as_of` when picked by
+    filter) are deleted by recording exceptions on their rules.
+    """
+    _rehydrate_selection(session, user_id, ids, filters)
+    skipped = _skip_occurrences(
+        session, _selected_occurrences(session, user_id, ids, filters, as_of)
+    )
+    clauses = _transaction_selection(user_id, ids, filters)
+    deltas = _batch_rollup_deltas(session, clauses)
+    search.unindex_rows(session, *clauses)
+    ids = _bulk_delete(session, Transaction, clauses)
+    if ids:
+        _apply_rollup_deltas(session, user_id, deltas)
+        seq = _next_change_seq(session, user_id)
+        _add_tombstones(session, user_id, TRANSACTION_ENTITY, ids, seq)
+    if ids or skipped:
+        _record_change(session, user_id, TRANSACTIONS_SCOPE)
+    session.commit()
+    return len(ids) + skipped
+
+
+# Summary helpers
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _rollup_contribution(transaction: Transaction, sign: int = 1) -> Dict[RollupKey, list]:
+    """Return the (amount, count) a transaction adds to its rollup bucket."""
+    deltas: Dict[RollupKey, list] = defaultdict(lambda: [0.0, 0])
+    key = (
+        _month_start(transaction.date), transaction.category_id, TransactionType(transaction.type)
+    )
+    deltas[key] = [sign * transaction.amount, sign]
+    return deltas
+
+
+def _apply_rollup_deltas(session: Session, user_id: int, deltas: Dict[RollupKey, list]) -> None:
+    """Fold (amount, count) deltas into the user's rollup rows.
+
+    Runs inside the caller's transaction so the rollup commits or rolls back
+    together with the change that produced the deltas. On SQLite and
+    PostgreSQL all buckets are folded with a single executemany upsert.
+    """
+    rows = [
+        dict(user_id=user_id, month=month, category_id=category, type=type_, total=amount,
+             count=count)
+        for (month, category, type_), (amount, count) in deltas.items()
+        if amount or count
+    ]
+    if not rows:
+        return
+    dialect_insert = _upsert_insert(session.get_bind().dialect.name)
+    if dialect_insert is None:
+        _apply_rollup_rows_orm(session, rows)
+        return
+    table = MonthlyRollup.__table__
+    statement = dialect_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[column.name for column in table.primary_key.columns],
+        set_={
+            "total": table.c.total + statement.excluded.total,
+            "count": table.c.count + statement.excluded.count,
+        },
+    )
+    session.execute(statement, rows)
+    if any(row["count"] < 0 for row in rows):
+        session.execute(
+            delete(MonthlyRollup)
+            .where(MonthlyRollup.user_id == user_id)
+            .where(MonthlyRollup.count <= 0)
+        )
+
+
+def _apply_rollup_rows_orm(session: Session, rows: List[dict]) -> None:
+    """Portable fallback for databases without INSERT ... ON CONFLICT."""
+    for delta in rows:
+        key = (delta["user_id"], delta["month"], delta["category_id"], delta["type"])
+        row = session.get(MonthlyRollup, key)
+        if row is None:
+            row = MonthlyRollup(**dict(delta, total=0.0, count=0))
+        row.total += delta["total"]
+        row.count += delta["count"]
+        if row.count <= 0:
+            if row in session:
+                session.delete(row)
+        else:
+            session.add(row)
+
+
+def rebuild_rollups(session: Session, user_id: Optional[int] = None) -> int:
+    """Recompute rollup rows from the transaction table. Returns rows written.
+
+    Used to backfill databases that predate the rollup table or to repair it.
+    Transactions are pre-aggregated per day in SQL and folded into months here,
+    which keeps the query portable across database backends. Archived
+    transactions are aggregated from their segments.
+    """
+    clear = delete(MonthlyRollup)
+    segments = select(ArchiveSegment)
+    statement = select(
+        Transaction.user_id,
+        Transaction.date,
+        Transaction.category_id,
+        Transaction.type,
+        func.sum(Transaction.amount),
+        func.count(),
+    ).group_by(Transaction.user_id, Transaction.date, Transaction.category_id, Transaction.type)
+    if user_id is not None:
+        clear = clear.where(MonthlyRollup.user_id == user_id)
+        statement = statement.where(Transaction.user_id == user_id)
+        segments = segments.where(ArchiveSegment.user_id == user_id)
+    session.exec(clear)
+
+    daily = list(session.exec(statement))
+    entries = list(session.exec(segments))
+    if entries:
+        from . import archive
+
+        for entry in entries:
+            totals = list(archive.daily_totals([entry]))
+            ids = category_ids(
+                session, entry.user_id, (row[1] for row in totals if row[1] is not None)
+            )
+            daily.extend(
+                (entry.user_id, day, ids.get(category), type_, total, count)
+                for day, category, type_, total, count in totals
+            )
+    buckets: Dict[tuple, list] = defaultdict(lambda: [0.0, 0])
+    for owner, day, category, type_, total, count in daily:
+        bucket = buckets[(owner, _month_start(day), category, TransactionType(type_))]
+        bucket[0] += total
+        bucket[1] += count
+    session.add_all(
+        MonthlyRollup(
+            user_id=owner, month=month, category_id=category, type=type_, total=total,
+            count=count,
+        )
+        for (owner, month, category, type_), (total, count) in buckets.items()
+    )
+    session.commit()
+    return len(buckets)
+
+
+def get_transaction_summary(
+    session: Session, user_id: int, as_of: date, days: int = 30
+) -> TransactionSummary:
+    """Dashboard figures for a user, mirroring the helpers in src/utils/helpers.js.
+
+    Totals come from the rollup table; the average daily spend needs day
+    precision and is a range scan over the (user_id, date, id) index, plus
+    the archived segments that reach into the range. Occurrences of
+    recurring rules up to `as_of` are added to every figure.
+    """
+    by_type = {
+        TransactionType(type_): total
+        for type_, total in session.exec(
+            select(MonthlyRollup.type, func.sum(MonthlyRollup.total))
+            .where(MonthlyRollup.user_id == user_id)
+            .group_by(MonthlyRollup.type)
+        )
+    }
+    monthly = {
+        TransactionType(type_): total
+        for type_, total in session.exec(
+            select(MonthlyRollup.type, func.sum(MonthlyRollup.total))
+            .where(MonthlyRollup.user_id == user_id)
+            .where(MonthlyRollup.month == _month_start(as_of))
+            .group_by(MonthlyRollup.type)
+        )
+    }
+    category_total = func.sum(MonthlyRollup.total)
+    by_category = (
+        select(Category.name, category_total)
+        .join(Category, Category.id == MonthlyRollup.category_id)
+        .where(MonthlyRollup.user_id == user_id)
+        .where(MonthlyRollup.type == TransactionType.EXPENSE)
+        .group_by(MonthlyRollup.category_id, Category.name)
+        .order_by(category_total.desc())
+    )
+    rules, skipped = _recurring_schedules(session, user_id)
+    if not rules:
+        top = session.exec(by_category.limit(1)).first()
+    recent_start = as_of - timedelta(days=days)
+    recent_spend = session.exec(
+        select(func.coalesce(func.sum(Transaction.amount), 0.0))
+        .where(Transaction.user_id == user_id)
+        .where(Transaction.type == TransactionType.EXPENSE)
+        .where(Transaction.date >= recent_start)
+    ).one()
+    entries = archived_segments(session, user_id, start=recent_start)
+    if entries:
+        from . import archive
+
+        recent_spend += archive.expense_total(entries, recent_start)
+    if rules:
+        category_totals = defaultdict(float, session.exec(by_category).all())
+        month_start = _month_start(as_of)
+        for rule in rules:
+            count = recurring.count_occurrences(rule, None, as_of, skipped[rule.id])
+            if not count:
+                continue
+            type_ = TransactionType(rule.type)
+            by_type[type_] = by_type.get(type_, 0.0) + rule.amount * count
+            monthly[type_] = monthly.get(type_, 0.0) + rule.amount * recurring.count_occurrences(
+                rule, month_start, as_of, skipped[rule.id]
+            )
+            if type_ == TransactionType.EXPENSE:
+                category_totals[rule.category] += rule.amount * count
+                recent_spend += rule.amount * recurring.count_occurrences(
+                    rule, recent_start, as_of, skipped[rule.id]
+                )
+        top = max(category_totals.items(), key=lambda item: item[1], default=None)
+    return TransactionSummary(
+        total_income=by_type.get(TransactionType.INCOME, 0.0),
+        total_expenses=by_type.get(TransactionType.EXPENSE, 0.0),
+        monthly_income=monthly.get(TransactionType.INCOME, 0.0),
+        monthly_expenses=monthly.get(TransactionType.EXPENSE, 0.0),
+        top_spending_category=CategoryTotal(category=top[0], amount=top[1]) if top else None,
+        average_daily_spend=recent_spend / days,
+    )
+
+
+# Recurring rule helpers
+
+def list_recurring_rules(session: Session, user_id: int) -> List[RecurringRule]:
+    return list(session.exec(
+        select(RecurringRule).where(RecurringRule.user_id == user_id).order_by(RecurringRule.id)
+    ))
+
+
+def _recurring_schedules(
+    session: Session, user_id: int
+) -> Tuple[List[RecurringRule], Dict[int, set]]:
+    """A user's rules and, per rule id, the dates of their exceptions."""
+    rules = list_recurring_rules(session, user_id)
+    skipped: Dict[int, set] = defaultdict(set)
+    if rules:
+        statement = select(RecurringException.rule_id, RecurringException.occurrence_date).where(
+            RecurringException.rule_id.in_([rule.id for rule in rules])
+        )
+        for rule_id, day in session.exec(statement):
+            skipped[rule_id].add(day)
+    return rules, skipped
+
+
+def recurring_transaction_rows(
+    session: Session,
+    user_id: int,
+    names: Sequence[str],
+    filters: Optional[TransactionFilter] = None,
+    as_of: Optional[date] = None,
+    before: Optional[Tuple[date, int]] = None,
+) -> Iterator[tuple]:
+    """Occurrences of a user's recurring rules as `names` tuples, newest first.
+
+    Occurrences run up to the filter's end date, or `as_of` (today) without
+    one. `before` is an exclusive (date, id) position to resume after. The
+    session is only used up front.
+    """
+    rules, skipped = _recurring_schedules(session, user_id)
+    if not rules:
+        return iter(())
+    end = _filter_range(filters)[1] or as_of or date.today()
+    return recurring.iter_rows(rules, skipped, names, filters, end, before)
+
+
+def _selected_occurrences(
+    session: Session,
+    user_id: int,
+    ids: Optional[Sequence[int]],
+    filters: Optional[TransactionFilter],
+    as_of: Optional[date] = None,
+) -> List[Tuple[RecurringRule, int, date]]:
+    """(rule, number, date) of the occurrences a batch selection picks.
+
+    With `ids`, the occurrence ids among them that exist and pass `filters`;
+    otherwise every occurrence matching `filters`, up to their end date or
+    `as_of` (today), as the list endpoint shows them.
+    """
+    wanted = None
+    if ids is not None:
+        wanted = [recurring.parse_occurrence_id(row_id) for row_id in ids if row_id < 0]
+        if not wanted:
+            return []
+    rules, skipped = _recurring_schedules(session, user_id)
+    if not rules:
+        return []
+    start, end = _filter_range(filters)
+    if wanted is None:
+        return [
+            (rule, index, day)
+            for rule in rules if recurring.matches(rule, filters)
+            for index, day in recurring.occurrences(
+                rule, start, end or as_of or date.today(), skipped[rule.id]
+            )
+        ]
+    by_id = {rule.id: rule for rule in rules}
+    selected = []
+    for rule_id, index in dict.fromkeys(wanted):
+        rule = by_id.get(rule_id)
+        day = None if rule is None else recurring.occurrence_date(rule, index)
+        if day is None or day in skipped[rule_id] or not recurring.matches(rule, filters):
+            continue
+        if (start is None or day >= start) and (end is None or day <= end):
+            selected.append((rule, index, day))
+    return selected
+
+
+def _materialize_occurrences(
+    session: Session, user_id: int, selected: Sequence[Tuple[RecurringRule, int, date]]
+) -> List[Transaction]:
+    """Store occurrences as transactions and stop their rules generating them.
+
+    Flushes so the new rows have ids; the caller commits.
+    """
+    if not selected:
+        return []
+    ids = category_ids(session, user_id, (rule.category for rule, _index, _day in selected))
+    seq = _next_change_seq(session, user_id)
+    deltas: Dict[RollupKey, list] = defaultdict(lambda: [0.0, 0])
+    transactions = []
+    for rule, _index, day in selected:
+        transaction = Transaction(
+            description=rule.description, amount=rule.amount, category_id=ids[rule.category],
+            type=rule.type, date=day, user_id=user_id, change_seq=seq,
+        )
+        for key, (amount, count) in _rollup_contribution(transaction).items():
+            deltas[key][0] += amount
+            deltas[key][1] += count
+        transactions.append(transaction)
+        session.add(RecurringException(rule_id=rule.id, occurrence_date=day))
+    session.add_all(transactions)
+    _apply_rollup_deltas(session, user_id, deltas)
+    _record_change(session, user_id, TRANSACTIONS_SCOPE)
+    session.flush()
+    search.index_rows(session, Transaction.user_id == user_id, Transaction.change_seq == seq)
+    return transactions
+
+
+def _skip_occurrences(
+    session: Session, selected: Sequence[Tuple[RecurringRule, int, date]]
+) -> int:
+    session.add_all(
+        RecurringException(rule_id=rule.id, occurrence_date=day) for rule, _index, day in selected
+    )
+    return len(selected)
+
+
+def create_recurring_rule(
+    session: Session, payload: RecurringRuleCreate, user_id: int
+) -> RecurringRule:
+    rule = RecurringRule(**payload.dict(), user_id=user_id)
+    session.add(rule)
+    _record_change(session, user_id, TRANSACTIONS_SCOPE)
+    session.commit()
+    session.refresh(rule)
+    return rule
+
+
+def get_recurring_rule(session: Session, rule_id: int, user_id: int) -> Optional[RecurringRule]:
+    rule = session.get(RecurringRule, rule_id)
+    if rule and rule.user_id == user_id:
+        return rule
+    return None
+
+
+def update_recurring_rule(
+    session: Session, rule: RecurringRule, payload: RecurringRuleUpdate
+) -> RecurringRule:
+    """Change a rule; its occurrences, past ones included, follow the new values.
+
+    Only `until` and `count` can be cleared with null. Raises ValueError if
+    the rule would end before it starts.
+    """
+    for field, value in payload.dict(exclude_unset=True).items():
+        if value is not None or field in ("until", "count"):
+            setattr(rule, field, value)
+    if rule.until is not None and rule.until < rule.start_date:
+        session.rollback()
+        raise ValueError("until must not be before start_date")
+    rule.updated_at = datetime.utcnow()
+    session.add(rule)
+    _record_change(session, rule.user_id, TRANSACTIONS_SCOPE)
+    session.commit()
+    session.refresh(rule)
+    return rule
+
+
+def delete_recurring_rule(session: Session, rule: RecurringRule) -> None:
+    """Delete a rule and all its occurrences; materialized ones are kept."""
+    session.exec(delete(RecurringException).where(RecurringException.rule_id == rule.id))
+    _record_change(session, rule.user_id, TRANSACTIONS_SCOPE)
+    session.delete(rule)
+    session.commit()
+
+
+# Precomputed insights
+
+def get_user_insights(session: Session, user_id: int) -> Optional[UserInsights]:
+    return session.get(UserInsights, user_id)
+
+
+def users_needing_insights(
+    session: Session, after_id: int, limit: int, force: bool = False
+) -> Tuple[List[int], List[int]]:
+    """The next `limit` user ids after `after_id`, and those with stale insights.
+
+    Stored insights are stale when the user's transactions data version has
+    moved on since they were computed, or when there are none. The day they
+    were computed for does not matter: results for another day are derived
+    on demand when read. Both lists are empty once every user has been seen.
+    """
+    ids = list(session.exec(
+        select(User.id).where(User.id > after_id).order_by(User.id).limit(limit)
+    ))
+    if not ids or force:
+        return ids, ids
+    current_version = func.coalesce(DataVersion.version, 0)
+    fresh = set(session.exec(
+        select(UserInsights.user_id)
+        .outerjoin(
+            DataVersion,
+            and_(
+                DataVersion.user_id == UserInsights.user_id,
+                DataVersion.scope == TRANSACTIONS_SCOPE,
+            ),
+        )
+        .where(UserInsights.user_id.in_(ids))
+        .where(UserInsights.version == current_version)
+    ))
+    return ids, [user_id for user_id in ids if user_id not in fresh]
+
+
+def save_user_insights(session: Session, rows: Sequence[dict]) -> None:
+    """Insert or replace `UserInsights` rows given as column dicts, in one commit."""
+    if not rows:
+        return
+    dialect_insert = _upsert_insert(session.get_bind().dialect.name)
+    if dialect_insert is None:
+        for row in rows:
+            session.merge(UserInsights(**row))
+    else:
+        statement = dialect_insert(UserInsights.__table__)
+        replaced = ("as_of", "version", "computed_at", "payload")
+        statement = statement.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={name: statement.excluded[name] for name in replaced},
+        )
+        session.execute(statement, list(rows))
+    session.commit()
+
+
 # Goal helpers
 
-def list_goals(session: Session, user_id: int) -> Iterable[Goal]:
+def list_goals(session: Session, user_id: int) -> List[Goal]:
     statement = (
         select(Goal)
         .where(Goal.user_id == user_id)
         .order_by(Goal.deadline.asc(), Goal.id.asc())
     )
-    return session.exec(statement)
+    return list(session.exec(statement))
+
+
+def list_goal_rows(session: Session, user_id: int) -> list:
+    """Like `list_goals`, as `GOAL_READ_COLUMNS` rows."""
+    statement = (
+        _join_category(select(*_read_columns(Goal, GOAL_READ_COLUMNS)), Goal)
+        .where(Goal.user_id == user_id)
+        .order_by(Goal.deadline.asc(), Goal.id.asc())
+    )
+    return list(session.execute(statement))
 
 
-def create_goal(session: Session, payload: GoalCreate, user_id: int) -> Goal:
-    goal = Goal(**payload.dict(), user_id=user_id)
+def create_goal(session: Session, payload: GoalCreate, user_id: int) -> GoalRead:
+    goal = Goal(
+        **_category_values(session, user_id, payload.dict()),
+        user_id=user_id,
+        change_seq=_next_change_seq(session, user_id),
+    )
     session.add(goal)
+    _record_change(session, user_id, GOALS_SCOPE)
     session.commit()
     session.refresh(goal)
-    return goal
+    return _read_model(session, goal, GoalRead)
 
 
 def get_goal(session: Session, goal_id: int, user_id: int) -> Optional[Goal]:
@@ -80,15 +1413,216 @@ def get_goal(session: Session, goal_id: int, user_id: int) -> Optional[Goal]:
     return None
 
 
-def update_goal(session: Session, goal: Goal, payload: GoalUpdate) -> Goal:
-    for field, value in payload.dict(exclude_unset=True).items():
+def update_goal(session: Session, goal: Goal, payload: GoalUpdate) -> GoalRead:
+    values = _category_values(session, goal.user_id, payload.dict(exclude_unset=True))
+    seq = _next_change_seq(session, goal.user_id)
+    for field, value in values.items():
         setattr(goal, field, value)
+    goal.updated_at = datetime.utcnow()
+    goal.change_seq = seq
     session.add(goal)
+    _record_change(session, goal.user_id, GOALS_SCOPE)
     session.commit()
     session.refresh(goal)
-    return goal
+    return _read_model(session, goal, GoalRead)
 
 
 def delete_goal(session: Session, goal: Goal) -> None:
+    _record_change(session, goal.user_id, GOALS_SCOPE)
+    _add_tombstones(
+        session, goal.user_id, GOAL_ENTITY, [goal.id], _next_change_seq(session, goal.user_id)
+    )
     session.delete(goal)
     session.commit()
+
+
+def _goal_selection(
+    user_id: int, ids: Optional[Sequence[int]], filters: Optional[GoalFilter]
+) -> list:
+    clauses = [Goal.user_id == user_id]
+    if ids is not None:
+        clauses.append(Goal.id.in_(ids))
+    if filters is not None:
+        if filters.start_date is not None:
+            clauses.append(Goal.deadline >= filters.start_date)
+        if filters.end_date is not None:
+            clauses.append(Goal.deadline <= filters.end_date)
+        if filters.category is not None:
+            clauses.append(_category_clause(Goal, filters.category))
+    return clauses
+
+
+def update_goals(
+    session: Session,
+    user_id: int,
+    patch: GoalUpdate,
+    ids: Optional[Sequence[int]] = None,
+    filters: Optional[GoalFilter] = None,
+    return_rows: bool = False,
+) -> Tuple[int, Optional[list]]:
+    """Goal counterpart of `update_transactions`; rows are `GoalRead` models."""
+    values = dict(
+        _category_values(session, user_id, patch.dict(exclude_unset=True)),
+        change_seq=_next_change_seq(session, user_id),
+    )
+    affected, rows = _bulk_update(
+        session, Goal, _goal_selection(user_id, ids, filters), values,
+        GoalRead if return_rows else None,
+    )
+    if rows:
+        rows.sort(key=lambda row: (row.deadline, row.id))
+    if affected:
+        _record_change(session, user_id, GOALS_SCOPE)
+    session.commit()
+    return affected, rows
+
+
+def delete_goals(
+    session: Session,
+    user_id: int,
+    ids: Optional[Sequence[int]] = None,
+    filters: Optional[GoalFilter] = None,
+) -> int:
+    """Delete many of a user's goals with one DELETE and one commit."""
+    deleted = _bulk_delete(session, Goal, _goal_selection(user_id, ids, filters))
+    if deleted:
+        _record_change(session, user_id, GOALS_SCOPE)
+        seq = _next_change_seq(session, user_id)
+        _add_tombstones(session, user_id, GOAL_ENTITY, deleted, seq)
+    session.commit()
+    return len(deleted)
+
+
+# Sync helpers
+
+# Position of a change in a user's change stream: (seq, source rank, id). Rows
+# written by one operation share a seq, so the rank and id break ties.
+SyncPosition = Tuple[int, int, int]
+SYNC_START: SyncPosition = (-1, 0, 0)
+
+_SYNC_TRANSACTIONS, _SYNC_GOALS, _SYNC_TOMBSTONES = range(3)
+
+
+def encode_sync_cursor(position: SyncPosition) -> str:
+    raw = ".".join(str(part) for part in position).encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_sync_cursor(cursor: str) -> SyncPosition:
+    """Decode a cursor produced by `encode_sync_cursor`. Raises ValueError if malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("ascii")
+        seq, rank, row_id = (int(part) for part in raw.split("."))
+    except (binascii.Error, UnicodeError, ValueError) as exc:
+        raise ValueError(f"Invalid sync cursor: {cursor!r}") from exc
+    return seq, rank, row_id
+
+
+def _after_position(seq_column, id_column, rank: int, position: SyncPosition):
+    seq, position_rank, position_id = position
+    if rank < position_rank:
+        return seq_column > seq
+    if rank > position_rank:
+        return seq_column >= seq
+    return tuple_(seq_column, id_column) > (seq, position_id)
+
+
+def _sync_source(session: Session, statement, seq_column, id_column, rank, position, limit):
+    """Up to `limit` rows of one source after `position`, as (seq, rank, id, row)."""
+    statement = (
+        statement.where(_after_position(seq_column, id_column, rank, position))
+        .order_by(seq_column, id_column)
+        .limit(limit)
+    )
+    return [(row[-2], rank, row[-1], row) for row in session.execute(statement)]
+
+
+def _with_archived_changes(
+    session: Session, user_id: int, changes: list, position: SyncPosition, limit: int
+) -> list:
+    """Merge archived transactions after `position` into the transaction source."""
+    seq, rank, row_id = position
+    entries = [
+        entry for entry in archived_segments(session, user_id) if entry.max_change_seq >= seq
+    ]
+    if not entries:
+        return changes
+    from . import archive
+
+    if rank != _SYNC_TRANSACTIONS:
+        # The cursor is past every transaction of its seq
+        row_id = 2 ** 63 - 1
+    rows = archive.rows_after_change(
+        entries, user_id, (*TRANSACTION_READ_COLUMNS, "change_seq", "id"), (seq, row_id), limit
+    )
+    archived = [(row[-2], _SYNC_TRANSACTIONS, row[-1], row) for row in rows]
+    merged = heapq.merge(changes, archived, key=lambda change: change[:3])
+    return list(itertools.islice(merged, limit))
+
+
+def list_changes(
+    session: Session, user_id: int, cursor: Optional[str] = None, limit: int = 500
+) -> Tuple[list, list, list, str, bool]:
+    """One page of a user's changes after `cursor`, in change order.
+
+    Returns (transactions, goals, deletions, next_cursor, has_more): rows as
+    `TRANSACTION_READ_COLUMNS` and `GOAL_READ_COLUMNS` tuples in their current
+    state, and (entity, id) pairs of deleted rows. Without `cursor` the stream
+    starts at the beginning, so the first pages are a full download. A row
+    changed several times appears once, at its latest change, and a deletion
+    is left out when the page holds a row that has taken its id since. Each
+    source is read through its (user_id, seq, id) index, at most `limit + 1`
+    rows apiece.
+    """
+    position = SYNC_START if cursor is None else decode_sync_cursor(cursor)
+    sources = [
+        (
+            _join_category(
+                select(*_read_columns(Transaction, TRANSACTION_READ_COLUMNS),
+                       Transaction.change_seq, Transaction.id),
+                Transaction,
+            ).where(Transaction.user_id == user_id),
+            Transaction.change_seq, Transaction.id, _SYNC_TRANSACTIONS,
+        ),
+        (
+            _join_category(
+                select(*_read_columns(Goal, GOAL_READ_COLUMNS), Goal.change_seq, Goal.id), Goal
+            ).where(Goal.user_id == user_id),
+            Goal.change_seq, Goal.id, _SYNC_GOALS,
+        ),
+        (
+            select(Tombstone.entity, Tombstone.entity_id, Tombstone.seq, Tombstone.id)
+            .where(Tombstone.user_id == user_id),
+            Tombstone.seq, Tombstone.id, _SYNC_TOMBSTONES,
+        ),
+    ]
+    changes = [
+        _sync_source(session, statement, seq_column, id_column, rank, position, limit + 1)
+        for statement, seq_column, id_column, rank in sources
+    ]
+    changes[_SYNC_TRANSACTIONS] = _with_archived_changes(
+        session, user_id, changes[_SYNC_TRANSACTIONS], position, limit + 1
+    )
+    merged = heapq.merge(*changes, key=lambda change: change[:3])
+    page = list(itertools.islice(merged, limit + 1))
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    transactions, goals, deletions, live = [], [], [], set()
+    for _seq, rank, row_id, row in page:
+        if rank == _SYNC_TRANSACTIONS:
+            transactions.append(row[:-2])
+            live.add((TRANSACTION_ENTITY, row_id))
+        elif rank == _SYNC_GOALS:
+            goals.append(row[:-2])
+            live.add((GOAL_ENTITY, row_id))
+        else:
+            deletions.append((row.entity, row.entity_id))
+    # A deleted id can be used again: SQLite reuses the highest rowid of
+    # tables made without AUTOINCREMENT, and moves between shards renumber
+    # rows. The new row always sorts after the tombstone, so only a page
+    # holding both has to drop the tombstone, which the row supersedes.
+    deletions = [deletion for deletion in deletions if deletion not in live]
+    next_position = page[-1][:3] if page else position
+    return transactions, goals, deletions, encode_sync_cursor(next_position), has_more
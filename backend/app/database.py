@@ -1,17 +1,389 @@
-from typing import Generator
+import hashlib
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import (
+    TYPE_CHECKING, Any, AsyncGenerator, AsyncIterator, Callable, Dict, Generator, List,
+    Optional, TypeVar,
+)
 
+from sqlalchemy import column, delete, event, exists, insert, inspect, select, table, update
+from sqlalchemy.engine import Connection, Dialect, Engine, make_url
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
 from sqlmodel import Session, SQLModel, create_engine
+from starlette.concurrency import run_in_threadpool
 
-from .config import get_settings
+from . import categories, crud, search
+from .config import Settings, get_settings
+from .metrics import instrument_engine
+from .models import Category, Goal, MonthlyRollup, SchemaState, Transaction
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+    from sqlmodel.ext.asyncio.session import AsyncSession
 
 settings = get_settings()
-engine = create_engine(settings.database_url, echo=False, future=True)
 
 
-def init_db() -> None:
-    SQLModel.metadata.create_all(engine)
+def sqlite_pragmas(config: Settings) -> List[str]:
+    """PRAGMA statements run on each new SQLite connection for a profile."""
+    if config.database_profile == "default":
+        return []
+    return [
+        f"PRAGMA journal_mode={config.sqlite_journal_mode}",
+        f"PRAGMA synchronous={config.sqlite_synchronous}",
+        f"PRAGMA busy_timeout={int(config.sqlite_busy_timeout_ms)}",
+        # Negative cache_size is in KiB rather than pages
+        f"PRAGMA cache_size=-{int(config.sqlite_cache_size_kib)}",
+        f"PRAGMA mmap_size={int(config.sqlite_mmap_size_bytes)}",
+        f"PRAGMA foreign_keys={'ON' if config.sqlite_foreign_keys else 'OFF'}",
+    ]
+
+
+def _engine_options(url: str, config: Settings) -> Dict[str, Any]:
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": config.db_pool_size,
+        "max_overflow": config.db_max_overflow,
+        "pool_timeout": config.db_pool_timeout_seconds,
+        "pool_recycle": config.db_pool_recycle_seconds,
+        "pool_pre_ping": True,
+    }
+
+
+def configure_engine(sync_engine: Engine, config: Settings) -> None:
+    """Attach the connection profile of `config` to an engine.
+
+    New SQLite connections also get the SQL function that derives search
+    index terms. For async engines pass `async_engine.sync_engine`; the
+    hook receives the driver's adapted connection, which accepts the same calls.
+    """
+    if sync_engine.dialect.name != "sqlite":
+        return
+    pragmas = sqlite_pragmas(config)
+
+    @event.listens_for(sync_engine, "connect")
+    def _configure_connection(dbapi_connection, _connection_record) -> None:
+        if pragmas:
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+        search.register_functions(dbapi_connection)
+
+
+def create_db_engine(url: str, config: Settings = settings) -> Engine:
+    db_engine = create_engine(url, echo=False, future=True, **_engine_options(url, config))
+    configure_engine(db_engine, config)
+    if config.metrics_enabled:
+        instrument_engine(db_engine)
+    return db_engine
+
+
+engine = create_db_engine(settings.database_url)
+
+
+def _shard_urls(config: Settings) -> List[str]:
+    return list(config.shard_database_urls) or [config.database_url]
+
+
+# Databases holding users' data, indexed by shard number. `engine` holds the
+# user directory and is reused for a shard with the same URL.
+shard_engines: List[Engine] = [
+    engine if url == settings.database_url else create_db_engine(url)
+    for url in _shard_urls(settings)
+]
+
+# Async drivers used when `settings.async_database` is on and the configured
+# URL does not already name a driver.
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg", "postgres": "asyncpg"}
+
+
+def async_database_url(url: str) -> str:
+    """Map a sync database URL onto its async-driver equivalent."""
+    parsed = make_url(url)
+    backend, _, driver = parsed.drivername.partition("+")
+    if driver and driver in ASYNC_DRIVERS.values():
+        return url
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for database backend {backend!r}")
+    backend = "postgresql" if backend == "postgres" else backend
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(
+        hide_password=False
+    )
+
+
+def create_async_db_engine(url: str, config: Settings = settings) -> "AsyncEngine":
+    # The async extension is only imported when `settings.async_database` is on
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    db_engine = create_async_engine(
+        async_database_url(url), echo=False, **_engine_options(url, config)
+    )
+    configure_engine(db_engine.sync_engine, config)
+    if config.metrics_enabled:
+        instrument_engine(db_engine.sync_engine)
+    return db_engine
+
+
+async_engine: Optional["AsyncEngine"] = (
+    create_async_db_engine(settings.database_url) if settings.async_database else None
+)
+
+async_shard_engines: List["AsyncEngine"] = [
+    async_engine if url == settings.database_url else create_async_db_engine(url)
+    for url in _shard_urls(settings)
+] if async_engine is not None else []
+
+
+def schema_fingerprint(dialect: Dialect) -> str:
+    """Hash of the DDL the models compile to on `dialect`, search index included.
+
+    Any change to a table, column, constraint or index changes the hash.
+    """
+    digest = hashlib.sha256()
+    for table in SQLModel.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=dialect)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            digest.update(str(CreateIndex(index).compile(dialect=dialect)).encode())
+    if dialect.name == "sqlite":
+        for ddl in search.schema_ddl():
+            digest.update(ddl.encode())
+    return digest.hexdigest()
+
+
+def _stored_fingerprint(connection: Connection) -> Optional[str]:
+    if not inspect(connection).has_table(SchemaState.__tablename__):
+        return None
+    return connection.execute(
+        select(SchemaState.fingerprint).where(SchemaState.id == 1)
+    ).scalar_one_or_none()
+
+
+def _add_missing_columns(connection: Connection) -> None:
+    """Add columns that models gained after their table was created.
+
+    Only additive changes are handled: new columns must be nullable or carry
+    a server default. Anything else needs a hand-written migration.
+    """
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    for table in SQLModel.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.exec_driver_sql(
+                f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}"
+            )
+
+
+def _seed_categories(connection: Connection) -> None:
+    """Insert the default categories that are missing."""
+    existing = set(connection.execute(
+        select(Category.name).where(Category.user_id.is_(None))
+    ).scalars())
+    missing = [name for name in categories.DEFAULT_CATEGORIES if name not in existing]
+    if missing:
+        connection.execute(
+            insert(Category), [{"user_id": None, "name": name} for name in missing]
+        )
+
+
+def _migrate_category_names(connection: Connection) -> bool:
+    """Move transactions and goals from category names to category ids.
+
+    Databases created before the category table hold each row's category as
+    text. Every name that is not a default becomes a custom category of the
+    rows' owner, rows get the matching `category_id`, and the text columns
+    are dropped. The rollup table is keyed by category, so it is dropped and
+    re-created; returns True when the caller has to rebuild it. Migrated
+    tables keep `category_id` nullable: a NOT NULL column cannot be added to
+    a populated SQLite table.
+    """
+    inspector = inspect(connection)
+    preparer = connection.dialect.identifier_preparer
+    migrated = False
+    for model in (Transaction, Goal):
+        name = model.__tablename__
+        if "category" not in {info["name"] for info in inspector.get_columns(name)}:
+            continue
+        if not migrated:
+            # Older versions' search index triggers read the column being dropped
+            search.drop_legacy_triggers(connection)
+            migrated = True
+        rows = table(name, column("user_id"), column("category"), column("category_id"))
+        known = exists().where(
+            Category.name == rows.c.category,
+            (Category.user_id.is_(None)) | (Category.user_id == rows.c.user_id),
+        )
+        connection.execute(insert(Category).from_select(
+            ["user_id", "name"],
+            select(rows.c.user_id, rows.c.category)
+            .where(rows.c.category.is_not(None))
+            .where(~known)
+            .distinct(),
+        ))
+        quoted = preparer.quote(name)
+        connection.exec_driver_sql(
+            f"ALTER TABLE {quoted} ADD COLUMN category_id INTEGER REFERENCES category (id)"
+        )
+        connection.execute(update(rows).values(category_id=(
+            select(Category.id)
+            .where(Category.name == rows.c.category)
+            .where((Category.user_id.is_(None)) | (Category.user_id == rows.c.user_id))
+            # A default wins over a custom category of the same name
+            .order_by(Category.user_id.is_not(None))
+            .limit(1)
+            .scalar_subquery()
+        )))
+        connection.exec_driver_sql(f"ALTER TABLE {quoted} DROP COLUMN category")
+    rollup = MonthlyRollup.__table__
+    if "category" in {info["name"] for info in inspector.get_columns(rollup.name)}:
+        rollup.drop(connection)
+        rollup.create(connection)
+        migrated = True
+    return migrated
+
+
+def _create_schema(connection: Connection, force: bool = False) -> None:
+    """Bring the schema up to date unless its stored fingerprint is current.
+
+    A database already at the current fingerprint costs one table lookup and
+    one single-row read, instead of create_all reflecting every table and
+    index on every worker start.
+    """
+    fingerprint = schema_fingerprint(connection.dialect)
+    if not force and _stored_fingerprint(connection) == fingerprint:
+        return
+    SQLModel.metadata.create_all(connection)
+    _seed_categories(connection)
+    rebuild_rollups = _migrate_category_names(connection)
+    _add_missing_columns(connection)
+    # create_all skips tables that already exist, including their indexes, so
+    # make sure indexes added after a database was created get built too.
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+    search.install(connection)
+    if rebuild_rollups:
+        with Session(bind=connection) as session:
+            crud.rebuild_rollups(session)
+    connection.execute(delete(SchemaState))
+    connection.execute(insert(SchemaState).values(
+        id=1, fingerprint=fingerprint, updated_at=datetime.utcnow()
+    ))
+
+
+def init_db(force: bool = False) -> None:
+    """Create missing tables, indexes and the search index, in every database.
+
+    Each database is skipped when it records the current schema fingerprint,
+    unless `force` is set.
+    """
+    for db_engine in _distinct([engine, *shard_engines]):
+        with db_engine.begin() as connection:
+            _create_schema(connection, force)
+
+
+async def init_async_db(force: bool = False) -> None:
+    for db_engine in _distinct([async_engine, *async_shard_engines]):
+        async with db_engine.begin() as connection:
+            await connection.run_sync(_create_schema, force)
+
+
+async def dispose_async_engines() -> None:
+    for db_engine in _distinct([async_engine, *async_shard_engines]):
+        await db_engine.dispose()
+
+
+def _distinct(engines: list) -> list:
+    return list({id(db_engine): db_engine for db_engine in engines}.values())
 
 
 def get_session() -> Generator[Session, None, None]:
     with Session(engine) as session:
         yield session
+
+
+T = TypeVar("T")
+
+
+class Database(ABC):
+    """Per-request handle that runs sync data-access helpers.
+
+    Helpers in `crud` take a sync `Session` as their first argument. On the
+    sync path they run on the threadpool; on the async path they run through
+    `AsyncSession.run_sync`, which drives the async driver from a greenlet on
+    the event loop without a thread hop. `shard` is the shard database the
+    session is bound to; handles on the user directory report 0.
+    """
+
+    shard: int = 0
+
+    @abstractmethod
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Call `func(session, *args, **kwargs)` and return its result."""
+
+    @abstractmethod
+    async def rollback(self) -> None:
+        """Roll back the session's open transaction."""
+
+
+class SyncDatabase(Database):
+    def __init__(self, session: Session, shard: int = 0) -> None:
+        self.session = session
+        self.shard = shard
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        return await run_in_threadpool(func, self.session, *args, **kwargs)
+
+    async def rollback(self) -> None:
+        await run_in_threadpool(self.session.rollback)
+
+
+class AsyncDatabase(Database):
+    def __init__(self, session: "AsyncSession", shard: int = 0) -> None:
+        self.session = session
+        self.shard = shard
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        return await self.session.run_sync(func, *args, **kwargs)
+
+    async def rollback(self) -> None:
+        await self.session.rollback()
+
+
+def async_session(db_engine: "AsyncEngine") -> "AsyncSession":
+    """An `AsyncSession` on `db_engine`, importing the async extension on first use."""
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    return AsyncSession(db_engine)
+
+
+async def get_db() -> AsyncGenerator[Database, None]:
+    """Yield a `Database` on the sync or async path, per `settings.async_database`.
+
+    It is bound to the user directory. Routes that read or write one user's
+    data use `auth.get_user_db`, which is bound to that user's shard.
+    """
+    if async_engine is not None:
+        async with async_session(async_engine) as session:
+            yield AsyncDatabase(session)
+    else:
+        with Session(engine) as session:
+            yield SyncDatabase(session)
+
+
+@asynccontextmanager
+async def shard_database(shard: int) -> AsyncIterator[Database]:
+    """A `Database` bound to one shard, on the sync or async path."""
+    if async_engine is not None:
+        async with async_session(async_shard_engines[shard]) as session:
+            yield AsyncDatabase(session, shard)
+    else:
+        with Session(shard_engines[shard]) as session:
+            yield SyncDatabase(session, shard)
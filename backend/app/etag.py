@@ -0,0 +1,46 @@
+"""Conditional GET support derived from per-user data versions.
+
+A list response is identified by the user, the collection's change counter
+(`crud.get_data_version`) and the query string, so checking whether a client
+copy is current costs one primary-key lookup instead of re-running the list.
+Responses that also depend on something else, such as the current day, pass
+it as part of `variant`.
+"""
+import hashlib
+from typing import Dict, Optional
+
+from fastapi import Request, Response, status
+
+ETAG_HEADER = "ETag"
+# Let browsers keep the body but revalidate it on every use
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(
+    request: Request, scope: str, user_id: int, version: int, variant: Optional[str] = None
+) -> str:
+    """Weak ETag of a list response; `variant` defaults to the query string."""
+    if variant is None:
+        variant = str(request.url.query)
+    digest = hashlib.blake2b(variant.encode(), digest_size=6).hexdigest()
+    return f'W/"{scope}-{user_id}-{version}-{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers `etag` (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(",")
+    )
+
+
+def etag_headers(etag: str) -> Dict[str, str]:
+    return {ETAG_HEADER: etag, "Cache-Control": CACHE_CONTROL}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=etag_headers(etag))
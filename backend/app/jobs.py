@@ -0,0 +1,180 @@
+"""In-process queue for work that follows a write but must not delay its response.
+
+Writes made through `auth.get_user_db` note which of the user's collections
+they changed. Once the route has finished, `after_writes` turns that into
+jobs on `work_queue`, a pool of asyncio workers started and stopped by the
+app's lifespan. Today the only job refreshes the user's stored insights,
+so the next insights read finds them ready.
+
+Jobs are keyed by (job, user, shard) and wait `coalesce_seconds` before
+running. A job submitted while an identical one is still waiting is merged
+into it, so a burst of writes by one user costs one run. Once a job starts,
+later writes queue a new run that sees their changes.
+
+Capacity is bounded. When `max_size` jobs are waiting, `enqueue` waits up to
+`submit_timeout_seconds` for room and then drops the job. Every job
+recomputes data that is also derived on demand, so a dropped job makes a
+later read slower but never wrong. `stop` stops taking jobs and runs the
+waiting ones without their delay, for up to `drain_timeout_seconds`.
+
+Queue depth and job outcomes are exported on /metrics.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from . import crud
+from .config import get_settings
+from .database import Database
+from .metrics import WORK_QUEUE_DEPTH, WORK_QUEUE_JOB_SECONDS, WORK_QUEUE_JOBS
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+Job = Callable[[int, int], Awaitable[None]]
+# (job name, user id, shard)
+JobKey = Tuple[str, int, int]
+
+REFRESH_INSIGHTS = "refresh_insights"
+
+
+class WorkQueue:
+    """Bounded, coalescing queue of per-user jobs run by asyncio workers."""
+
+    def __init__(
+        self,
+        workers: int,
+        max_size: int,
+        coalesce_seconds: float,
+        submit_timeout_seconds: float,
+        drain_timeout_seconds: float,
+    ) -> None:
+        self.workers = workers
+        self.max_size = max_size
+        self.coalesce_seconds = coalesce_seconds
+        self.submit_timeout_seconds = submit_timeout_seconds
+        self.drain_timeout_seconds = drain_timeout_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        # Jobs queued and not yet started, with their function and due time
+        self._waiting: Dict[JobKey, Tuple[Job, float]] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._idle = 0
+        self._draining: Optional[asyncio.Event] = None
+
+    def __len__(self) -> int:
+        return self._queue.qsize() + self.workers - self._idle if self._queue else 0
+
+    @property
+    def running(self) -> bool:
+        return self._queue is not None and not self._draining.is_set()
+
+    def start(self) -> None:
+        """Start the workers on the running event loop; a no-op with 0 workers."""
+        if self.workers <= 0 or self._queue is not None:
+            return
+        self._queue = asyncio.Queue(self.max_size)
+        self._draining = asyncio.Event()
+        self._idle = self.workers
+        self._tasks = [
+            asyncio.create_task(self._work(), name=f"work-queue-{index}")
+            for index in range(self.workers)
+        ]
+
+    async def enqueue(self, name: str, job: Job, user_id: int, shard: int = 0) -> bool:
+        """Schedule `job(user_id, shard)` unless the same job is already waiting.
+
+        Returns False when the job was dropped: the queue is not running, or
+        stayed full for the submit timeout.
+        """
+        if not self.running:
+            return False
+        key = (name, user_id, shard)
+        if key in self._waiting:
+            WORK_QUEUE_JOBS.labels(name, "coalesced").inc()
+            return True
+        loop = asyncio.get_running_loop()
+        self._waiting[key] = (job, loop.time() + self.coalesce_seconds)
+        try:
+            if self._queue.full():
+                await asyncio.wait_for(self._queue.put(key), self.submit_timeout_seconds)
+            else:
+                self._queue.put_nowait(key)
+        except asyncio.TimeoutError:
+            self._waiting.pop(key, None)
+            WORK_QUEUE_JOBS.labels(name, "dropped").inc()
+            return False
+        WORK_QUEUE_JOBS.labels(name, "queued").inc()
+        return True
+
+    async def _work(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            key = await self._queue.get()
+            self._idle -= 1
+            try:
+                job, due = self._waiting[key]
+                delay = due - loop.time()
+                if delay > 0 and not self._draining.is_set():
+                    try:
+                        await asyncio.wait_for(self._draining.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                # Writes from here on queue a new run
+                del self._waiting[key]
+                await self._run(key, job)
+            finally:
+                self._idle += 1
+                self._queue.task_done()
+
+    async def _run(self, key: JobKey, job: Job) -> None:
+        name, user_id, shard = key
+        started = time.perf_counter()
+        try:
+            await job(user_id, shard)
+        except Exception:
+            logger.exception("Job %s for user %s failed", name, user_id)
+            WORK_QUEUE_JOBS.labels(name, "failed").inc()
+        else:
+            WORK_QUEUE_JOBS.labels(name, "done").inc()
+        WORK_QUEUE_JOB_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+    async def stop(self) -> None:
+        """Refuse new jobs, run the waiting ones now, then stop the workers."""
+        if self._queue is None:
+            return
+        self._draining.set()
+        try:
+            await asyncio.wait_for(self._queue.join(), self.drain_timeout_seconds)
+        except asyncio.TimeoutError:
+            logger.warning("Work queue drain timed out; dropping %d jobs", len(self._waiting))
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._waiting.clear()
+        self._queue = None
+
+
+work_queue = WorkQueue(
+    settings.work_queue_workers,
+    settings.work_queue_max_size,
+    settings.work_queue_coalesce_seconds,
+    settings.work_queue_submit_timeout_seconds,
+    settings.work_queue_drain_timeout_seconds,
+)
+WORK_QUEUE_DEPTH.labels().set_function(work_queue.__len__)
+
+
+async def _refresh_insights(user_id: int, shard: int) -> None:
+    # NumPy is only loaded by workers that serve insights or run this job
+    from . import analytics
+
+    await analytics.refresh_insights(user_id, shard)
+
+
+async def after_writes(user_id: int, db: Database) -> None:
+    """Queue the jobs that follow the changes a request made through `db`."""
+    scopes = db.session.info.pop(crud.CHANGED_SCOPES_KEY, None)
+    if scopes and crud.TRANSACTIONS_SCOPE in scopes:
+        await work_queue.enqueue(REFRESH_INSIGHTS, _refresh_insights, user_id, db.shard)
@@ -1,11 +1,15 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 
+from . import metrics
 from .config import get_settings
-from .database import init_db
-from .routes import api_router
+from .database import async_engine, dispose_async_engines, init_async_db, init_db
+from .routes import include_routers
+from .etag import ETAG_HEADER
+from .jobs import work_queue
+from .routes.transactions import NEXT_CURSOR_HEADER, NEXT_OFFSET_HEADER
 
 settings = get_settings()
 
@@ -13,9 +17,16 @@ settings = get_settings()
 @asynccontextmanager
 async def lifespan(_: FastAPI):
     # Startup
-    init_db()
+    if async_engine is not None:
+        await init_async_db()
+    else:
+        init_db()
+    work_queue.start()
     yield
-    # Shutdown (if needed)
+    # Shutdown
+    await work_queue.stop()
+    if async_engine is not None:
+        await dispose_async_engines()
 
 
 app = FastAPI(title=settings.app_name, lifespan=lifespan)
@@ -40,7 +51,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, NEXT_OFFSET_HEADER, ETAG_HEADER],
 )
+if settings.metrics_enabled:
+    # Added last so it is outermost and times the whole stack
+    app.add_middleware(metrics.MetricsMiddleware, slow_request_ms=settings.slow_request_ms)
 
 
 @app.get("/health", tags=["health"])
@@ -48,4 +63,10 @@ def health_check() -> dict[str, str]:
     return {"status": "ok"}
 
 
-app.include_router(api_router, prefix="/api")
+if settings.metrics_enabled:
+    @app.get("/metrics", tags=["health"], include_in_schema=False)
+    def metrics_endpoint() -> PlainTextResponse:
+        return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+include_routers(app, prefix="/api")
@@ -0,0 +1,379 @@
+"""Request and database instrumentation exposed in Prometheus text format.
+
+`MetricsMiddleware` times every HTTP request and labels it with the matched
+route template (``/api/transactions/{transaction_id}``, never the raw path)
+and status code. SQLAlchemy cursor events installed by `instrument_engine`
+time each statement and attribute it to the request that issued it through a
+context variable, which follows the request onto the threadpool and into
+`AsyncSession.run_sync` greenlets alike.
+
+Recording is a dictionary lookup and a few integer additions per request and
+per statement, cheap enough to leave on under load. Statement text is only
+kept when the slow-request log is enabled.
+"""
+import bisect
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+KDF_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Statements kept per request for the slow-request log
+MAX_LOGGED_STATEMENTS = 50
+UNMATCHED_ROUTE = "unmatched"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Metric(ABC):
+    """A metric family: one child per distinct tuple of label values."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """A child holding the value(s) of one tuple of label values."""
+
+    @abstractmethod
+    def _samples(self, values: Tuple[str, ...], child) -> List[str]:
+        """Exposition lines of one child."""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._samples(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "_lock", "_function")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Read the value from `function` at scrape time instead."""
+        self._function = function
+
+    def get(self) -> float:
+        return self._function() if self._function is not None else self.value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def _samples(self, values, child) -> List[str]:
+        return [f"{self.name}{_label_text(self.labelnames, values)} {_format_value(child.get())}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        # counts[i] holds observations in (buckets[i-1], buckets[i]]; the last
+        # slot is the +Inf overflow
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def _samples(self, values, child) -> List[str]:
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        names = self.labelnames + ("le",)
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            labels = _label_text(names, values + (_format_value(bound),))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _label_text(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name!r} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "spendshift_http_request_duration_seconds",
+    "HTTP request latency by route template and status code.",
+    ("method", "route", "status"),
+))
+REQUESTS_IN_PROGRESS = REGISTRY.register(Gauge(
+    "spendshift_http_requests_in_progress", "HTTP requests currently being served.",
+))
+REQUEST_QUERIES = REGISTRY.register(Histogram(
+    "spendshift_http_request_db_queries",
+    "SQL statements issued per HTTP request, by route template.",
+    ("method", "route"), buckets=QUERY_COUNT_BUCKETS,
+))
+REQUEST_DB_SECONDS = REGISTRY.register(Histogram(
+    "spendshift_http_request_db_seconds",
+    "Time spent executing SQL per HTTP request, by route template.",
+    ("method", "route"),
+))
+QUERY_SECONDS = REGISTRY.register(Histogram(
+    "spendshift_db_query_duration_seconds",
+    "SQL statement latency by statement kind.",
+    ("operation",), buckets=QUERY_LATENCY_BUCKETS,
+))
+SLOW_REQUESTS = REGISTRY.register(Counter(
+    "spendshift_http_slow_requests_total",
+    "Requests slower than the slow-request threshold, by route template.",
+    ("method", "route"),
+))
+
+KDF_SECONDS = REGISTRY.register(Histogram(
+    "spendshift_password_kdf_seconds",
+    "Time spent deriving password keys (hashing and verification).",
+    buckets=KDF_BUCKETS,
+))
+KDF_SHED = REGISTRY.register(Counter(
+    "spendshift_password_kdf_shed_total",
+    "Auth requests rejected before deriving a password key, by reason.",
+    ("reason",),
+))
+RATE_LIMIT_KEYS = REGISTRY.register(Gauge(
+    "spendshift_auth_rate_limit_keys", "Keys tracked by the in-process auth rate limiter.",
+))
+RESPONSE_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "spendshift_response_cache_lookups_total",
+    "List response cache lookups by collection and result (hit or miss).",
+    ("scope", "result"),
+))
+RESPONSE_CACHE_EVICTIONS = REGISTRY.register(Counter(
+    "spendshift_response_cache_evictions_total",
+    "Cached list responses evicted to stay within the cache's limits, by collection.",
+    ("scope",),
+))
+RESPONSE_CACHE_BYTES = REGISTRY.register(Gauge(
+    "spendshift_response_cache_bytes", "Bytes held by the list response cache.",
+))
+WORK_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "spendshift_work_queue_depth", "Post-write jobs waiting to run or running.",
+))
+WORK_QUEUE_JOBS = REGISTRY.register(Counter(
+    "spendshift_work_queue_jobs_total",
+    "Post-write jobs by job and outcome (queued, coalesced, dropped, done, failed).",
+    ("job", "outcome"),
+))
+WORK_QUEUE_JOB_SECONDS = REGISTRY.register(Histogram(
+    "spendshift_work_queue_job_seconds", "Time spent running post-write jobs, by job.",
+    ("job",),
+))
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+    # (statement, seconds) pairs; None unless the slow-request log is on
+    statements: Optional[List[Tuple[str, float]]] = None
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+_OPERATIONS = {
+    "SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK", "PRAGMA",
+}
+_QUERY_STARTED = "metrics_query_started"
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+def _operation(statement: str) -> str:
+    head = statement[:16].lstrip().split(None, 1)
+    word = head[0].upper() if head else ""
+    return word if word in _OPERATIONS else "OTHER"
+
+
+def _before_cursor_execute(conn, _cursor, _statement, _parameters, _context, _executemany) -> None:
+    # A connection runs one statement at a time, so one slot is enough; a
+    # failed statement's start time is simply overwritten by the next one.
+    conn.info[_QUERY_STARTED] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, _cursor, statement, _parameters, _context, _executemany) -> None:
+    started = conn.info.pop(_QUERY_STARTED, None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    QUERY_SECONDS.labels(_operation(statement)).observe(elapsed)
+    stats = _request_stats.get()
+    if stats is None:
+        return
+    stats.queries += 1
+    stats.db_seconds += elapsed
+    if stats.statements is not None and len(stats.statements) < MAX_LOGGED_STATEMENTS:
+        stats.statements.append((statement, elapsed))
+
+
+def instrument_engine(sync_engine: Engine) -> None:
+    """Time every statement run through `sync_engine`.
+
+    For async engines pass `async_engine.sync_engine`.
+    """
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording per-route latency and SQL statistics.
+
+    With `slow_request_ms` above zero, requests slower than that are logged
+    together with the SQL statements they issued.
+    """
+
+    def __init__(self, app, slow_request_ms: float = 0) -> None:
+        self.app = app
+        self.slow_request_seconds = slow_request_ms / 1000
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(statements=[] if self.slow_request_seconds > 0 else None)
+        token = _request_stats.set(stats)
+        status_code = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.labels().inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUESTS_IN_PROGRESS.labels().dec()
+            _request_stats.reset(token)
+            self._record(scope, status_code, elapsed, stats)
+
+    def _record(self, scope, status_code: int, elapsed: float, stats: RequestStats) -> None:
+        method = scope["method"]
+        # FastAPI stores the matched route in the scope; its path is the template
+        route = getattr(scope.get("route"), "path", None) or UNMATCHED_ROUTE
+        REQUEST_SECONDS.labels(method, route, str(status_code)).observe(elapsed)
+        REQUEST_QUERIES.labels(method, route).observe(stats.queries)
+        REQUEST_DB_SECONDS.labels(method, route).observe(stats.db_seconds)
+        if self.slow_request_seconds <= 0 or elapsed < self.slow_request_seconds:
+            return
+        SLOW_REQUESTS.labels(method, route).inc()
+        statements = "".join(
+            f"\n  [{seconds * 1000:.2f} ms] {' '.join(statement.split())}"
+            for statement, seconds in stats.statements
+        )
+        logger.warning(
+            "Slow request %s %s -> %s in %.1f ms; %d SQL statements in %.1f ms%s",
+            method, scope.get("path", route), status_code, elapsed * 1000,
+            stats.queries, stats.db_seconds * 1000, statements,
+        )
+
+
+def render() -> str:
+    return REGISTRY.render()
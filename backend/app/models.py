@@ -1,15 +1,37 @@
+import datetime as dt
 from datetime import date, datetime
 from enum import Enum
 from typing import Optional
 
+from pydantic import model_validator
+from sqlalchemy import Index, UniqueConstraint, text
 from sqlmodel import Field, Relationship, SQLModel
 
+# Upper bound on explicit ids per batch request
+MAX_BATCH_IDS = 10_000
+
+
+def _change_seq_field():
+    # Server default so the column can be added to existing tables in place
+    return Field(
+        default=0,
+        sa_column_kwargs={"server_default": text("0")},
+        description="Position in the owner's change sequence of the last write",
+    )
+
 
 class TransactionType(str, Enum):
     INCOME = "income"
     EXPENSE = "expense"
 
 
+class RecurrenceFrequency(str, Enum):
+    DAILY = "daily"
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+    YEARLY = "yearly"
+
+
 # User models
 class UserBase(SQLModel):
     email: str = Field(unique=True, index=True)
@@ -51,20 +73,55 @@ class TokenData(SQLModel):
     user_id: Optional[int] = None
 
 
+class UserPrincipal(SQLModel):
+    """The authenticated caller as seen by routes that only need identity."""
+
+    id: int
+    email: str
+
+
+# Category models
+class Category(SQLModel, table=True):
+    """A category name stored once and referenced by id.
+
+    The defaults (`app.categories.DEFAULT_CATEGORIES`) have no owner and are
+    shared; any other name is created as a custom category of the user who
+    first uses it. The API only ever deals in names; see `app.categories`.
+    """
+
+    __table_args__ = (UniqueConstraint("user_id", "name"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: Optional[int] = Field(
+        default=None, foreign_key="user.id", description="Owner; null for the defaults"
+    )
+    name: str
+
+
 # Transaction models
 class TransactionBase(SQLModel):
     description: str
     amount: float = Field(gt=0)
-    category: str
+    category_id: int = Field(foreign_key="category.id")
     type: TransactionType = Field(description="income or expense")
     date: date
     user_id: int = Field(foreign_key="user.id")
 
 
 class Transaction(TransactionBase, table=True):
+    __table_args__ = (
+        # Backs keyset pagination over (date DESC, id DESC) for a single user
+        Index("ix_transaction_user_date_id", "user_id", "date", "id"),
+        # Backs delta sync, which walks a user's rows in change order
+        Index("ix_transaction_user_change_seq_id", "user_id", "change_seq", "id"),
+        # Archived rows keep their ids, so SQLite must never hand them out again
+        {"sqlite_autoincrement": True},
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
     updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    change_seq: int = _change_seq_field()
     
     # Relationship
     user: User = Relationship(back_populates="transactions")
@@ -95,7 +152,254 @@ class TransactionUpdate(SQLModel):
     amount: Optional[float] = Field(default=None, gt=0)
     category: Optional[str] = None
     type: Optional[TransactionType] = None
-    date: Optional[date] = None
+    # Spelled dt.date: inside the class body `date` resolves to this field's default
+    date: Optional[dt.date] = None
+
+
+class TransactionFilter(SQLModel):
+    start_date: Optional[date] = Field(default=None, description="Inclusive lower date bound")
+    end_date: Optional[date] = Field(default=None, description="Inclusive upper date bound")
+    type: Optional[TransactionType] = None
+    category: Optional[str] = None
+    min_amount: Optional[float] = Field(default=None, ge=0)
+    max_amount: Optional[float] = Field(default=None, ge=0)
+
+
+class _BatchSelection(SQLModel):
+    """Rows picked by explicit ids or by a filter; exactly one must be given.
+
+    A filter must constrain something: an empty one would match every row
+    the user has.
+    """
+
+    ids: Optional[list[int]] = Field(default=None, min_length=1, max_length=MAX_BATCH_IDS)
+
+    @model_validator(mode="after")
+    def _one_selector(self):
+        if (self.ids is None) == (self.filter is None):
+            raise ValueError("Give exactly one of 'ids' or 'filter'")
+        if self.filter is not None and not self.filter.model_dump(exclude_none=True):
+            raise ValueError("'filter' must set at least one field")
+        return self
+
+
+def _require_patch(patch: SQLModel) -> None:
+    if not patch.model_fields_set:
+        raise ValueError("'patch' must set at least one field")
+
+
+class TransactionBatchDelete(_BatchSelection):
+    filter: Optional[TransactionFilter] = None
+
+
+class TransactionBatchUpdate(TransactionBatchDelete):
+    patch: TransactionUpdate
+    return_rows: bool = Field(default=False, description="Include the updated rows in the response")
+
+    @model_validator(mode="after")
+    def _non_empty_patch(self):
+        _require_patch(self.patch)
+        return self
+
+
+class BatchResult(SQLModel):
+    affected: int
+
+
+class TransactionBatchResult(BatchResult):
+    items: Optional[list[TransactionRead]] = None
+
+
+class ImportRowError(SQLModel):
+    line: int = Field(description="Line of the uploaded file the record starts on")
+    error: str
+
+
+class ImportResult(SQLModel):
+    inserted: int = 0
+    failed: int = 0
+    errors: list[ImportRowError] = Field(default_factory=list)
+    errors_truncated: bool = False
+
+
+# Recurring transaction models
+class RecurringRuleBase(SQLModel):
+    description: str
+    amount: float = Field(gt=0)
+    category: str
+    type: TransactionType = Field(description="income or expense")
+    frequency: RecurrenceFrequency
+    interval: int = Field(default=1, ge=1, description="Repeat every `interval` periods")
+    start_date: date = Field(description="Date of the first occurrence")
+    until: Optional[date] = Field(default=None, description="Inclusive last possible date")
+    count: Optional[int] = Field(default=None, ge=1, description="Number of occurrences")
+
+
+class RecurringRule(RecurringRuleBase, table=True):
+    """A schedule of transactions stored once instead of as one row each.
+
+    Occurrences are generated when transactions are read (see
+    `app.recurring`); only edited ones become `Transaction` rows.
+    """
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
+class RecurringRuleCreate(RecurringRuleBase):
+    @model_validator(mode="after")
+    def _until_after_start(self):
+        if self.until is not None and self.until < self.start_date:
+            raise ValueError("until must not be before start_date")
+        return self
+
+
+class RecurringRuleRead(RecurringRuleBase):
+    id: int
+    user_id: int
+    created_at: datetime
+    updated_at: datetime
+
+
+class RecurringRuleUpdate(SQLModel):
+    description: Optional[str] = None
+    amount: Optional[float] = Field(default=None, gt=0)
+    category: Optional[str] = None
+    type: Optional[TransactionType] = None
+    frequency: Optional[RecurrenceFrequency] = None
+    interval: Optional[int] = Field(default=None, ge=1)
+    start_date: Optional[date] = None
+    until: Optional[date] = None
+    count: Optional[int] = Field(default=None, ge=1)
+
+
+class RecurringException(SQLModel, table=True):
+    """A date on which a rule generates no occurrence.
+
+    Written when an occurrence is deleted, or edited and so stored as a
+    `Transaction` of its own.
+    """
+
+    rule_id: int = Field(foreign_key="recurringrule.id", primary_key=True)
+    occurrence_date: date = Field(primary_key=True)
+
+
+# Change tracking
+class DataVersion(SQLModel, table=True):
+    """Per-user counter bumped by every change to one collection.
+
+    `scope` names the collection ("transactions" or "goals"). The counter is
+    what list ETags are derived from. The "changes" scope instead numbers the
+    user's change sequence across both collections, for delta sync.
+    """
+
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    scope: str = Field(primary_key=True)
+    version: int = 0
+
+
+class Tombstone(SQLModel, table=True):
+    """A deleted transaction or goal, kept so delta sync can report it."""
+
+    __table_args__ = (
+        Index("ix_tombstone_user_seq_id", "user_id", "seq", "id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
+    entity: str = Field(description="\"transaction\" or \"goal\"")
+    entity_id: int
+    seq: int = Field(description="Change sequence number of the delete")
+    deleted_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
+# Summary models
+class MonthlyRollup(SQLModel, table=True):
+    """Running per-user totals of transactions by (month, category, type).
+
+    Maintained incrementally by the transaction helpers in `crud` so summaries
+    never have to scan the transaction table.
+    """
+
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    month: date = Field(primary_key=True, description="First day of the month")
+    category_id: int = Field(foreign_key="category.id", primary_key=True)
+    type: TransactionType = Field(primary_key=True)
+    total: float = 0
+    count: int = 0
+
+
+class CategoryTotal(SQLModel):
+    category: str
+    amount: float
+
+
+class TransactionSummary(SQLModel):
+    total_income: float
+    total_expenses: float
+    monthly_income: float
+    monthly_expenses: float
+    top_spending_category: Optional[CategoryTotal] = None
+    average_daily_spend: float
+
+
+# Insight models
+class RollingSpend(SQLModel):
+    days: int
+    total: float = Field(description="Expenses in the `days` days ending on as_of")
+    previous_total: float = Field(description="Expenses in the `days` days before that")
+    daily_average: float
+
+
+class CategoryChange(SQLModel):
+    category: str
+    current: float = Field(description="Expenses so far in the month of as_of")
+    previous: float = Field(description="Expenses in the month before")
+    change: float
+
+
+class RecurringMerchant(SQLModel):
+    merchant: str
+    category: str
+    occurrences: int
+    cadence_days: float = Field(description="Average days between charges")
+    average_amount: float
+    last_date: date
+    next_expected_date: date
+
+
+class SpendingAnomaly(SQLModel):
+    transaction_id: int
+    date: date
+    description: str
+    category: str
+    amount: float
+    typical_amount: float = Field(description="Geometric mean of the category's expenses")
+    score: float = Field(description="Standard deviations above the category norm, in log space")
+
+
+class Insights(SQLModel):
+    as_of: date
+    rolling_spend: list[RollingSpend]
+    category_changes: list[CategoryChange]
+    recurring_merchants: list[RecurringMerchant]
+    anomalies: list[SpendingAnomaly]
+
+
+class UserInsights(SQLModel, table=True):
+    """Insights precomputed offline, served while `version` is current.
+
+    `version` is the user's transactions data version the payload was
+    computed from.
+    """
+
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    as_of: date
+    version: int
+    computed_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    payload: str = Field(description="`Insights` as JSON")
 
 
 # Goal models
@@ -104,14 +408,19 @@ class GoalBase(SQLModel):
     target_amount: float = Field(gt=0)
     current_amount: float = Field(default=0, ge=0)
     deadline: date
-    category: Optional[str] = None
+    category_id: Optional[int] = Field(default=None, foreign_key="category.id")
     user_id: int = Field(foreign_key="user.id")
 
 
 class Goal(GoalBase, table=True):
+    __table_args__ = (
+        Index("ix_goal_user_change_seq_id", "user_id", "change_seq", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
     updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+    change_seq: int = _change_seq_field()
     
     # Relationship
     user: User = Relationship(back_populates="goals")
@@ -143,3 +452,104 @@ class GoalUpdate(SQLModel):
     current_amount: Optional[float] = Field(default=None, ge=0)
     deadline: Optional[date] = None
     category: Optional[str] = None
+
+    @model_validator(mode="after")
+    def _no_null_required_fields(self):
+        # Only the category can be cleared; the other columns are NOT NULL
+        nulls = [
+            name for name in ("name", "target_amount", "current_amount", "deadline")
+            if name in self.model_fields_set and getattr(self, name) is None
+        ]
+        if nulls:
+            raise ValueError(f"{', '.join(nulls)} cannot be null")
+        return self
+
+
+class GoalFilter(SQLModel):
+    start_date: Optional[date] = Field(default=None, description="Inclusive lower deadline bound")
+    end_date: Optional[date] = Field(default=None, description="Inclusive upper deadline bound")
+    category: Optional[str] = None
+
+
+class GoalBatchDelete(_BatchSelection):
+    filter: Optional[GoalFilter] = None
+
+
+class GoalBatchUpdate(GoalBatchDelete):
+    patch: GoalUpdate
+    return_rows: bool = Field(default=False, description="Include the updated rows in the response")
+
+    @model_validator(mode="after")
+    def _non_empty_patch(self):
+        _require_patch(self.patch)
+        return self
+
+
+class GoalBatchResult(BatchResult):
+    items: Optional[list[GoalRead]] = None
+
+
+# Sync models
+class SyncDeletion(SQLModel):
+    entity: str
+    id: int
+
+
+class SyncPage(SQLModel):
+    """One page of a user's changes after a sync cursor, oldest first."""
+
+    transactions: list[TransactionRead]
+    goals: list[GoalRead]
+    deleted: list[SyncDeletion]
+    cursor: str = Field(description="Pass as `since` to continue after this page")
+    has_more: bool
+
+
+# Archive models
+class ArchiveSegment(SQLModel, table=True):
+    """Manifest entry of one user's archived transactions for one year.
+
+    The rows live in `file_name` under the user's directory in the archive
+    directory; see `app.archive`.
+    """
+
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    year: int = Field(primary_key=True)
+    generation: int = Field(description="Bumped whenever the segment file is rewritten")
+    file_name: str
+    row_count: int = 0
+    min_date: date
+    max_date: date
+    max_change_seq: int = Field(description="Newest change sequence number in the segment")
+    # Unknown (None) for segments written before ids were recorded
+    min_id: Optional[int] = Field(default=None, description="Smallest transaction id")
+    max_id: Optional[int] = Field(default=None, description="Largest transaction id")
+    size_bytes: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
+# Sharding models
+class UserShard(SQLModel, table=True):
+    """The shard database holding a user's data, kept in the user directory.
+
+    Users without a row predate sharding and live on shard 0. `moving` is set
+    while the user's data is copied to another shard; see `app.sharding`.
+    """
+
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    shard: int = 0
+    moving: bool = False
+    updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
+# Schema bookkeeping
+class SchemaState(SQLModel, table=True):
+    """Fingerprint of the schema the database was last brought up to date with.
+
+    A single row. Startup compares it with the fingerprint of the current
+    models and only issues DDL when they differ.
+    """
+
+    id: int = Field(default=1, primary_key=True)
+    fingerprint: str
+    updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
@@ -0,0 +1,245 @@
+"""Admission control for the password-hashing auth routes.
+
+Login and registration each cost a full PBKDF2 derivation, so a credential
+stuffing burst can keep every core busy. `AuthRateLimiter` counts attempts
+per client IP and per target email in sliding windows and rejects a request
+with 429 before any hashing happens once either key is over its limit.
+
+The window is the usual two-bucket approximation: a key keeps the count of
+the current fixed window and of the one before it, and the estimate weighs
+the previous count by how much of it still overlaps the sliding window. That
+is three integers per key, whatever the request rate.
+
+Counters live in a `RateLimitBackend`. `MemoryBackend` keeps them in this
+process, bounded to a fixed number of keys; `SQLiteBackend` keeps them in a
+local SQLite file so all workers on a host share one budget, a stand-in for
+a networked store.
+"""
+import math
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+
+from .config import Settings, get_settings
+from .metrics import KDF_SHED, RATE_LIMIT_KEYS
+
+BACKENDS = ("memory", "sqlite")
+
+
+class RateLimitBackend(ABC):
+    """Counter store behind `SlidingWindowLimiter`.
+
+    `blocking` backends do I/O and are called on the threadpool.
+    """
+
+    blocking = False
+
+    @abstractmethod
+    def hit(self, key: str, window: int) -> Tuple[int, int]:
+        """Count one request for `key` in fixed window number `window`.
+
+        Returns the key's counts for the previous and the current window,
+        this request included.
+        """
+
+
+class _Counts:
+    __slots__ = ("window", "previous", "current")
+
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self.previous = 0
+        self.current = 0
+
+
+class MemoryBackend(RateLimitBackend):
+    """Per-process counters for at most `max_keys` keys.
+
+    Keys are stored as their hash and entries are kept in least recently hit
+    order. Entries that can no longer affect an estimate sit at the front and
+    are evicted as new hits arrive; past `max_keys` the least recently hit
+    key is dropped, which at worst forgets an attacker that went quiet.
+    """
+
+    def __init__(self, max_keys: int) -> None:
+        self.max_keys = max_keys
+        self._entries: "OrderedDict[int, _Counts]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def hit(self, key: str, window: int) -> Tuple[int, int]:
+        hashed = hash(key)
+        with self._lock:
+            counts = self._entries.get(hashed)
+            if counts is None:
+                counts = self._entries[hashed] = _Counts(window)
+            else:
+                self._entries.move_to_end(hashed)
+                if counts.window != window:
+                    counts.previous = counts.current if counts.window == window - 1 else 0
+                    counts.current = 0
+                    counts.window = window
+            counts.current += 1
+            self._evict(window)
+            return counts.previous, counts.current
+
+    def _evict(self, window: int) -> None:
+        entries = self._entries
+        while entries:
+            oldest = next(iter(entries.values()))
+            if oldest.window >= window - 1 and len(entries) <= self.max_keys:
+                break
+            entries.popitem(last=False)
+
+
+class SQLiteBackend(RateLimitBackend):
+    """Counters shared by every process that opens the same SQLite file.
+
+    Each hit is one upsert. Rows whose windows have passed are deleted at
+    most once per `sweep_seconds` by whichever process notices first.
+    """
+
+    blocking = True
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS rate_limit ("
+        "key TEXT PRIMARY KEY, window_index INTEGER NOT NULL, "
+        "previous INTEGER NOT NULL, current INTEGER NOT NULL) WITHOUT ROWID"
+    )
+    # SET expressions all see the row as it was before the update
+    _HIT = (
+        "INSERT INTO rate_limit (key, window_index, previous, current) VALUES (?, ?, 0, 1) "
+        "ON CONFLICT (key) DO UPDATE SET "
+        "previous = CASE WHEN window_index = excluded.window_index THEN previous "
+        "WHEN window_index = excluded.window_index - 1 THEN current ELSE 0 END, "
+        "current = CASE WHEN window_index = excluded.window_index THEN current + 1 ELSE 1 END, "
+        "window_index = excluded.window_index "
+        "RETURNING previous, current"
+    )
+
+    def __init__(self, path: str, sweep_seconds: float, busy_timeout_ms: int = 1000) -> None:
+        self.path = path
+        self.sweep_seconds = sweep_seconds
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._next_sweep = 0.0
+        self._connection().execute(self._SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=wal")
+            connection.execute("PRAGMA synchronous=off")
+            connection.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.connection = connection
+        return connection
+
+    def hit(self, key: str, window: int) -> Tuple[int, int]:
+        connection = self._connection()
+        previous, current = connection.execute(self._HIT, (key, window)).fetchone()
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_seconds
+            connection.execute("DELETE FROM rate_limit WHERE window_index < ?", (window - 1,))
+        return previous, current
+
+
+class SlidingWindowLimiter:
+    """At most `limit` hits per key in any `window_seconds` (approximately)."""
+
+    def __init__(
+        self, backend: RateLimitBackend, limit: int, window_seconds: float,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.backend = backend
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.clock = clock
+
+    def hit(self, key: str) -> Optional[float]:
+        """Count a hit; returns seconds to wait if `key` is over its limit, else None."""
+        now = self.clock()
+        window, offset = divmod(now, self.window_seconds)
+        previous, current = self.backend.hit(key, int(window))
+        overlap = 1 - offset / self.window_seconds
+        if previous * overlap + current <= self.limit:
+            return None
+        return self.window_seconds - offset
+
+
+class AuthRateLimiter:
+    """Per-IP and per-email attempt limits for one set of auth routes."""
+
+    def __init__(self, backend: RateLimitBackend, per_ip: int, per_email: int,
+                 window_seconds: float) -> None:
+        self.backend = backend
+        self.by_ip = SlidingWindowLimiter(backend, per_ip, window_seconds)
+        self.by_email = SlidingWindowLimiter(backend, per_email, window_seconds)
+
+    def _check(self, action: str, ip: str, email: str) -> Optional[Tuple[str, float]]:
+        ip_wait = self.by_ip.hit(f"{action}:ip:{ip}")
+        email_wait = self.by_email.hit(f"{action}:email:{email.strip().lower()}")
+        if ip_wait is not None:
+            return "ip", ip_wait
+        if email_wait is not None:
+            return "email", email_wait
+        return None
+
+    async def admit(self, request: Request, action: str, email: str) -> None:
+        """Count an attempt at `action`; raise 429 if the caller is over a limit.
+
+        Call before any password hashing. Both keys are counted even when the
+        first is already over, so neither budget can be spent around the other.
+        """
+        ip = request.client.host if request.client else "unknown"
+        if self.backend.blocking:
+            rejected = await run_in_threadpool(self._check, action, ip, email)
+        else:
+            rejected = self._check(action, ip, email)
+        if rejected is None:
+            return
+        reason, wait = rejected
+        KDF_SHED.labels(f"{reason}_limit").inc()
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, please retry later",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))},
+        )
+
+
+def create_backend(config: Settings) -> RateLimitBackend:
+    if config.auth_rate_limit_backend == "sqlite":
+        return SQLiteBackend(
+            config.auth_rate_limit_store_path, config.auth_rate_limit_window_seconds
+        )
+    if config.auth_rate_limit_backend != "memory":
+        raise ValueError(
+            f"Unknown rate limit backend {config.auth_rate_limit_backend!r}; "
+            f"expected one of {', '.join(BACKENDS)}"
+        )
+    backend = MemoryBackend(config.auth_rate_limit_max_keys)
+    RATE_LIMIT_KEYS.labels().set_function(backend.__len__)
+    return backend
+
+
+def create_auth_limiter(config: Settings) -> Optional[AuthRateLimiter]:
+    if not config.auth_rate_limit_enabled:
+        return None
+    return AuthRateLimiter(
+        create_backend(config), config.auth_rate_limit_per_ip,
+        config.auth_rate_limit_per_email, config.auth_rate_limit_window_seconds,
+    )
+
+
+auth_limiter = create_auth_limiter(get_settings())
@@ -0,0 +1,238 @@
+"""Expansion of recurring rules into transaction occurrences.
+
+A `RecurringRule` describes a schedule the way an iCalendar RRULE does: a
+frequency, an interval, a first date and optionally an end date and/or an
+occurrence count. Occurrences are never stored. They are generated for the
+date window a read asks for and merged with real transactions by `crud`.
+
+Occurrences are numbered from 0 and carry negative transaction ids that
+encode (rule id, number), so they sort and paginate like rows and can be
+addressed by the edit and delete endpoints. Monthly and yearly rules clamp
+to the end of shorter months: a rule starting on January 31st falls on
+February 28th (or 29th), then March 31st.
+"""
+import calendar
+import heapq
+from collections import namedtuple
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Collection, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .models import RecurrenceFrequency, RecurringRule, TransactionFilter, TransactionType
+
+# Occurrence numbers per rule that fit in an id; enough for daily rules
+# spanning some 2,800 years
+OCCURRENCE_ID_STRIDE = 1 << 20
+
+_MONTHS_PER_PERIOD = {RecurrenceFrequency.MONTHLY: 1, RecurrenceFrequency.YEARLY: 12}
+_DAYS_PER_PERIOD = {RecurrenceFrequency.DAILY: 1, RecurrenceFrequency.WEEKLY: 7}
+
+
+def occurrence_id(rule_id: int, index: int) -> int:
+    return -(rule_id * OCCURRENCE_ID_STRIDE + index)
+
+
+def parse_occurrence_id(transaction_id: int) -> Optional[Tuple[int, int]]:
+    """(rule id, occurrence number) of an occurrence id; None for real rows."""
+    if transaction_id >= 0:
+        return None
+    return divmod(-transaction_id, OCCURRENCE_ID_STRIDE)
+
+
+def _add_months(day: date, months: int) -> date:
+    year, month = divmod(day.month - 1 + months, 12)
+    year += day.year
+    return date(year, month + 1, min(day.day, calendar.monthrange(year, month + 1)[1]))
+
+
+def occurrence_date(rule: RecurringRule, index: int) -> Optional[date]:
+    """Date of occurrence number `index`, or None if the rule has no such occurrence."""
+    if not 0 <= index < OCCURRENCE_ID_STRIDE:
+        return None
+    if rule.count is not None and index >= rule.count:
+        return None
+    step = index * rule.interval
+    frequency = RecurrenceFrequency(rule.frequency)
+    try:
+        if frequency in _DAYS_PER_PERIOD:
+            day = rule.start_date + timedelta(days=step * _DAYS_PER_PERIOD[frequency])
+        else:
+            day = _add_months(rule.start_date, step * _MONTHS_PER_PERIOD[frequency])
+    except (OverflowError, ValueError):
+        return None
+    if rule.until is not None and day > rule.until:
+        return None
+    return day
+
+
+def _index_at(rule: RecurringRule, day: date) -> int:
+    """Number of the last period that starts on or before `day`, by arithmetic.
+
+    The occurrence in that period may still fall after `day`: clamping to
+    the end of a month can only move a date earlier, never past the next
+    period, so the occurrence on or before `day` is this one or the one
+    before it.
+    """
+    frequency = RecurrenceFrequency(rule.frequency)
+    if frequency in _DAYS_PER_PERIOD:
+        period = rule.interval * _DAYS_PER_PERIOD[frequency]
+        return (day - rule.start_date).days // period
+    months = (day.year - rule.start_date.year) * 12 + day.month - rule.start_date.month
+    return months // (rule.interval * _MONTHS_PER_PERIOD[frequency])
+
+
+def _first_index(rule: RecurringRule, start: Optional[date]) -> int:
+    """Number of the first occurrence on or after `start`."""
+    if start is None or start <= rule.start_date:
+        return 0
+    index = _index_at(rule, start)
+    day = occurrence_date(rule, index)
+    return index + 1 if day is None or day < start else index
+
+
+def _last_index(rule: RecurringRule, end: date) -> int:
+    """Number of the last occurrence on or before `end`; -1 if there is none."""
+    if rule.until is not None:
+        end = min(end, rule.until)
+    if end < rule.start_date:
+        return -1
+    index = min(_index_at(rule, end), OCCURRENCE_ID_STRIDE - 1)
+    if rule.count is not None:
+        index = min(index, rule.count - 1)
+    while index >= 0:
+        day = occurrence_date(rule, index)
+        if day is not None and day <= end:
+            return index
+        index -= 1
+    return -1
+
+
+def occurrences(
+    rule: RecurringRule,
+    start: Optional[date],
+    end: date,
+    skipped: Collection[date] = (),
+) -> List[Tuple[int, date]]:
+    """(number, date) of the rule's occurrences within [start, end], oldest first."""
+    result = []
+    for index in range(_first_index(rule, start), _last_index(rule, end) + 1):
+        day = occurrence_date(rule, index)
+        if day not in skipped:
+            result.append((index, day))
+    return result
+
+
+def occurrences_newest_first(
+    rule: RecurringRule,
+    start: Optional[date],
+    end: date,
+    skipped: Collection[date] = (),
+) -> Iterator[Tuple[int, date]]:
+    """(number, date) of the rule's occurrences within [start, end], newest first.
+
+    Generated lazily, stepping back from the last one, which is found by
+    arithmetic.
+    """
+    first = _first_index(rule, start)
+    for index in range(_last_index(rule, end), first - 1, -1):
+        day = occurrence_date(rule, index)
+        if day not in skipped:
+            yield index, day
+
+
+def count_occurrences(
+    rule: RecurringRule,
+    start: Optional[date],
+    end: date,
+    skipped: Collection[date] = (),
+) -> int:
+    """Number of the rule's occurrences within [start, end], without listing them."""
+    first, last = _first_index(rule, start), _last_index(rule, end)
+    if last < first:
+        return 0
+    excepted = 0
+    for day in skipped:
+        if (start is None or day >= start) and day <= end:
+            index = _first_index(rule, day)
+            excepted += first <= index <= last and occurrence_date(rule, index) == day
+    return last - first + 1 - excepted
+
+
+def matches(rule: RecurringRule, filters: Optional[TransactionFilter]) -> bool:
+    """Whether the rule's occurrences pass the non-date parts of `filters`."""
+    if filters is None:
+        return True
+    if filters.type is not None and TransactionType(rule.type) != filters.type:
+        return False
+    if filters.category is not None and rule.category != filters.category:
+        return False
+    if filters.min_amount is not None and rule.amount < filters.min_amount:
+        return False
+    if filters.max_amount is not None and rule.amount > filters.max_amount:
+        return False
+    return True
+
+
+def occurrence_values(rule: RecurringRule, index: int, day: date) -> dict:
+    """Column values of one occurrence, as the transaction it stands for."""
+    return {
+        "id": occurrence_id(rule.id, index),
+        "description": rule.description,
+        "amount": rule.amount,
+        "category": rule.category,
+        "type": TransactionType(rule.type),
+        "date": day,
+        "user_id": rule.user_id,
+        "created_at": rule.created_at,
+        "updated_at": rule.updated_at,
+    }
+
+
+@lru_cache(maxsize=32)
+def _row_type(names: Tuple[str, ...]):
+    return namedtuple("OccurrenceRow", names)
+
+
+def _rule_rows(
+    rule: RecurringRule,
+    row_type,
+    names: Sequence[str],
+    start: Optional[date],
+    end: date,
+    skipped: Collection[date],
+    before: Optional[Tuple[date, int]],
+) -> Iterator[tuple]:
+    for index, day in occurrences_newest_first(rule, start, end, skipped):
+        values = occurrence_values(rule, index, day)
+        row = row_type(*(values[name] for name in names))
+        if before is None or (day, row.id) < before:
+            yield row
+
+
+def iter_rows(
+    rules: Sequence[RecurringRule],
+    skipped: Dict[int, Collection[date]],
+    names: Sequence[str],
+    filters: Optional[TransactionFilter],
+    end: date,
+    before: Optional[Tuple[date, int]] = None,
+) -> Iterator[tuple]:
+    """Every rule's occurrences up to `end` as `names` tuples, newest first.
+
+    `skipped` maps rule ids to their exception dates. `before` is an
+    exclusive (date, id) position to resume after. Occurrences are generated
+    as the result is consumed, so a page of rows costs about a page of
+    occurrences per rule, however long the rules have been running.
+    """
+    row_type = _row_type(tuple(names))
+    start = None if filters is None else filters.start_date
+    if filters is not None and filters.end_date is not None:
+        end = min(end, filters.end_date)
+    if before is not None:
+        end = min(end, before[0])
+    per_rule = [
+        _rule_rows(rule, row_type, names, start, end, skipped.get(rule.id, ()), before)
+        for rule in rules if matches(rule, filters)
+    ]
+    return heapq.merge(*per_rule, key=lambda row: (row.date, row.id), reverse=True)
+
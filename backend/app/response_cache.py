@@ -0,0 +1,139 @@
+"""Read-through cache of encoded list responses.
+
+List routes already read the collection's data version for their ETag. With
+that version in hand, a repeat of the same query is answered from the bytes
+encoded last time instead of querying and serializing the rows again.
+
+Entries are grouped per user and collection and are only served while their
+version matches the current one, so they stay correct across processes and
+whatever writes the database. Writes through `crud` also drop this process's
+entries for the user right away, so stale responses do not sit in memory.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from .config import get_settings
+from .metrics import (
+    RESPONSE_CACHE_BYTES,
+    RESPONSE_CACHE_EVICTIONS,
+    RESPONSE_CACHE_LOOKUPS,
+)
+
+settings = get_settings()
+
+# Distinct queries (filters, pages, formats) kept per user and collection
+VARIANTS_PER_USER = 32
+# Rough bookkeeping cost of one cached response on top of its body
+ENTRY_OVERHEAD_BYTES = 256
+
+CachedResponse = Tuple[bytes, Dict[str, str]]
+
+
+class _UserEntry:
+    __slots__ = ("version", "responses", "size")
+
+    def __init__(self, version: int) -> None:
+        self.version = version
+        self.responses: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self.size = 0
+
+
+class ResponseCache:
+    """LRU of users' encoded list responses, bounded by total bytes.
+
+    `variant` tells apart the queries of one collection, normally the raw
+    query string. Cached headers are the ones that depend on the result, such
+    as the next-page cursor. All methods are safe to call from any thread.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[Tuple[str, int], _UserEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def get(
+        self, scope: str, user_id: int, version: int, variant: str
+    ) -> Optional[CachedResponse]:
+        if self.max_bytes <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get((scope, user_id))
+            response = None
+            if entry is not None and entry.version == version:
+                response = entry.responses.get(variant)
+            if response is None:
+                RESPONSE_CACHE_LOOKUPS.labels(scope, "miss").inc()
+                return None
+            self._entries.move_to_end((scope, user_id))
+            entry.responses.move_to_end(variant)
+            RESPONSE_CACHE_LOOKUPS.labels(scope, "hit").inc()
+            return response
+
+    def put(
+        self, scope: str, user_id: int, version: int, variant: str,
+        body: bytes, headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        size = len(body) + len(variant) + ENTRY_OVERHEAD_BYTES
+        if self.max_bytes <= 0 or size > self.max_entry_bytes:
+            return
+        key = (scope, user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version != version:
+                if entry.version > version:
+                    return
+                self._discard(key)
+                entry = None
+            if entry is None:
+                entry = self._entries[key] = _UserEntry(version)
+            self._entries.move_to_end(key)
+            previous = entry.responses.pop(variant, None)
+            if previous is not None:
+                self._resize(entry, -self._size(variant, previous))
+            entry.responses[variant] = (body, dict(headers or {}))
+            self._resize(entry, size)
+            while len(entry.responses) > VARIANTS_PER_USER:
+                old_variant, old_response = entry.responses.popitem(last=False)
+                self._resize(entry, -self._size(old_variant, old_response))
+                RESPONSE_CACHE_EVICTIONS.labels(scope).inc()
+            while self._bytes > self.max_bytes:
+                old_key = next(iter(self._entries))
+                RESPONSE_CACHE_EVICTIONS.labels(old_key[0]).inc(
+                    len(self._entries[old_key].responses)
+                )
+                self._discard(old_key)
+
+    def invalidate(self, scope: str, user_id: int) -> None:
+        with self._lock:
+            self._discard((scope, user_id))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    @staticmethod
+    def _size(variant: str, response: CachedResponse) -> int:
+        return len(response[0]) + len(variant) + ENTRY_OVERHEAD_BYTES
+
+    def _resize(self, entry: _UserEntry, delta: int) -> None:
+        entry.size += delta
+        self._bytes += delta
+
+    def _discard(self, key: Tuple[str, int]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+
+response_cache = ResponseCache(
+    settings.response_cache_max_bytes, settings.response_cache_max_entry_bytes
+)
+RESPONSE_CACHE_BYTES.labels().set_function(lambda: response_cache.size_bytes)
@@ -1,10 +1,27 @@
-from fastapi import APIRouter
+from fastapi import FastAPI
 
-from . import auth, goals, transactions
+from . import auth, goals, insights, recurring, sync, transactions
 
-api_router = APIRouter()
-api_router.include_router(auth.router, prefix="/auth", tags=["auth"])
-api_router.include_router(transactions.router, prefix="/transactions", tags=["transactions"])
-api_router.include_router(goals.router, prefix="/goals", tags=["goals"])
+# (router, path prefix, OpenAPI tag) of each API section
+ROUTERS = (
+    (auth.router, "/auth", "auth"),
+    (transactions.router, "/transactions", "transactions"),
+    (goals.router, "/goals", "goals"),
+    (recurring.router, "/recurring", "recurring"),
+    (insights.router, "/insights", "insights"),
+    (sync.router, "/sync", "sync"),
+)
 
-__all__ = ["api_router"]
+
+def include_routers(app: FastAPI, prefix: str = "") -> None:
+    """Add every API router to `app` under `prefix`.
+
+    Each router is included into the app itself: an include copies every
+    route it adds, so collecting them in one APIRouter first would build
+    each route twice when a worker starts.
+    """
+    for router, path, tag in ROUTERS:
+        app.include_router(router, prefix=f"{prefix}{path}", tags=[tag])
+
+
+__all__ = ["ROUTERS", "include_routers"]
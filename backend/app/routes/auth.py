@@ -1,8 +1,9 @@
+import logging
 from datetime import timedelta
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlmodel import Session, select
+from sqlmodel import select
 
 from ..auth import (
     authenticate_user,
@@ -10,21 +11,30 @@ from ..auth import (
     get_current_user,
     get_password_hash,
     get_user_by_email,
+    run_password_kdf,
+    save_new_user,
 )
 from ..config import get_settings
-from ..database import get_session
+from ..database import Database, get_db
 from ..models import Token, User, UserCreate, UserRead
+from ..ratelimit import auth_limiter
+from ..sharding import ensure_user_on_shard, user_placement
 
+logger = logging.getLogger(__name__)
 router = APIRouter()
 settings = get_settings()
 
 
 @router.post("/register", response_model=UserRead, status_code=status.HTTP_201_CREATED)
-def register(user_data: UserCreate, session: Session = Depends(get_session)) -> UserRead:
+async def register(
+    request: Request, user_data: UserCreate, db: Database = Depends(get_db)
+) -> UserRead:
     """Register a new user."""
+    if auth_limiter is not None:
+        await auth_limiter.admit(request, "register", user_data.email)
     try:
         # Check if user already exists
-        existing_user = get_user_by_email(session, user_data.email)
+        existing_user = await db.run(get_user_by_email, user_data.email)
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -32,21 +42,19 @@ def register(user_data: UserCreate, session: Session = Depends(get_session)) ->
             )
         
         # Create new user
-        hashed_password = get_password_hash(user_data.password)
+        hashed_password = await run_password_kdf(get_password_hash, user_data.password)
         user = User(
             email=user_data.email,
             hashed_password=hashed_password,
             full_name=user_data.full_name,
         )
-        session.add(user)
-        session.commit()
-        session.refresh(user)
+        shard = await db.run(save_new_user, user)
+        await ensure_user_on_shard(user, shard)
         return user
     except HTTPException:
         raise
     except Exception as e:
-        # Log the error for debugging
-        print(f"Registration error: {str(e)}")
+        logger.exception("Registration failed for %s", user_data.email)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Registration failed: {str(e)}",
@@ -54,21 +62,26 @@ def register(user_data: UserCreate, session: Session = Depends(get_session)) ->
 
 
 @router.post("/login", response_model=Token)
-def login(
+async def login(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    session: Session = Depends(get_session),
+    db: Database = Depends(get_db),
 ) -> Token:
     """Login and get access token.
     
     Note: OAuth2PasswordRequestForm uses 'username' field, but we treat it as email.
     """
-    user = authenticate_user(session, form_data.username, form_data.password)
+    if auth_limiter is not None:
+        await auth_limiter.admit(request, "login", form_data.username)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    # Repairs a registration that failed before copying the user to its shard
+    await ensure_user_on_shard(user, (await user_placement(user.id)).shard)
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
     access_token = create_access_token(
         data={"sub": str(user.id)}, expires_delta=access_token_expires  # JWT requires sub to be a string
@@ -77,7 +90,7 @@ def login(
 
 
 @router.get("/me", response_model=UserRead)
-def get_current_user_info(current_user: User = Depends(get_current_user)) -> UserRead:
+async def get_current_user_info(current_user: User = Depends(get_current_user)) -> UserRead:
     """Get current user information."""
     return current_user
 
@@ -1,57 +1,103 @@
 from typing import List
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, Request, Response, status
 from fastapi.routing import APIRouter
-from sqlmodel import Session
 
-from .. import crud
-from ..auth import get_current_user
-from ..database import get_session
-from ..models import GoalCreate, GoalRead, GoalUpdate, User
+from .. import crud, etag, serialization
+from ..auth import get_current_principal, get_user_db
+from ..database import Database
+from ..response_cache import response_cache
+from ..models import (
+    BatchResult,
+    GoalBatchDelete,
+    GoalBatchResult,
+    GoalBatchUpdate,
+    GoalCreate,
+    GoalRead,
+    GoalUpdate,
+    UserPrincipal,
+)
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[GoalRead])
-def list_goals(
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
-) -> List[GoalRead]:
-    goals = crud.list_goals(session, current_user.id)
-    return list(goals)
+async def list_goals(
+    request: Request,
+    format: str = Query("records", pattern="^(records|columnar)$"),
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
+) -> Response:
+    version = await db.run(crud.get_data_version, current_user.id, crud.GOALS_SCOPE)
+    tag = etag.make_etag(request, crud.GOALS_SCOPE, current_user.id, version)
+    if etag.etag_matches(request.headers.get("if-none-match"), tag):
+        return etag.not_modified(tag)
+    variant = str(request.url.query)
+    cached = response_cache.get(crud.GOALS_SCOPE, current_user.id, version, variant)
+    if cached is not None:
+        return serialization.json_response(cached[0], etag.etag_headers(tag))
+    rows = await db.run(crud.list_goal_rows, current_user.id)
+    content = serialization.encode_rows(crud.GOAL_READ_COLUMNS, rows, format)
+    response_cache.put(crud.GOALS_SCOPE, current_user.id, version, variant, content)
+    return serialization.json_response(content, etag.etag_headers(tag))
 
 
 @router.post("/", response_model=GoalRead, status_code=status.HTTP_201_CREATED)
-def create_goal(
+async def create_goal(
     payload: GoalCreate,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
 ) -> GoalRead:
-    goal = crud.create_goal(session, payload, current_user.id)
+    goal = await db.run(crud.create_goal, payload, current_user.id)
     return goal
 
 
+@router.patch("/batch", response_model=GoalBatchResult)
+async def update_goals(
+    payload: GoalBatchUpdate,
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
+) -> GoalBatchResult:
+    """Apply one patch to every goal picked by `ids` or `filter` in one statement."""
+    affected, rows = await db.run(
+        crud.update_goals, current_user.id, payload.patch, payload.ids,
+        payload.filter, payload.return_rows,
+    )
+    return GoalBatchResult(affected=affected, items=rows)
+
+
+@router.post("/batch/delete", response_model=BatchResult)
+async def delete_goals(
+    payload: GoalBatchDelete,
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
+) -> BatchResult:
+    """Delete every goal picked by `ids` or `filter` in one statement."""
+    affected = await db.run(crud.delete_goals, current_user.id, payload.ids, payload.filter)
+    return BatchResult(affected=affected)
+
+
 @router.put("/{goal_id}", response_model=GoalRead)
-def update_goal(
+async def update_goal(
     goal_id: int,
     payload: GoalUpdate,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
 ) -> GoalRead:
-    goal = crud.get_goal(session, goal_id, current_user.id)
+    goal = await db.run(crud.get_goal, goal_id, current_user.id)
     if not goal:
         raise HTTPException(status_code=404, detail="Goal not found")
-    updated = crud.update_goal(session, goal, payload)
+    updated = await db.run(crud.update_goal, goal, payload)
     return updated
 
 
 @router.delete("/{goal_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_goal(
+async def delete_goal(
     goal_id: int,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
 ) -> None:
-    goal = crud.get_goal(session, goal_id, current_user.id)
+    goal = await db.run(crud.get_goal, goal_id, current_user.id)
     if not goal:
         raise HTTPException(status_code=404, detail="Goal not found")
-    crud.delete_goal(session, goal)
+    await db.run(crud.delete_goal, goal)
@@ -0,0 +1,25 @@
+from datetime import date
+from typing import Optional
+
+from fastapi import Depends, Query
+from fastapi.routing import APIRouter
+
+from ..auth import get_current_principal, get_user_db
+from ..database import Database
+from ..models import Insights, UserPrincipal
+
+router = APIRouter()
+
+
+@router.get("/", response_model=Insights)
+async def get_insights(
+    as_of: Optional[date] = Query(None, description="Reference day; defaults to today"),
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
+) -> Insights:
+    """Rolling spend, month-over-month category changes, recurring merchants
+    and unusually large recent expenses."""
+    # NumPy is only loaded by workers that serve insights
+    from .. import analytics
+
+    return await analytics.get_insights(db, current_user.id, as_of or date.today())
@@ -0,0 +1,64 @@
+from typing import List
+
+from fastapi import Depends, HTTPException, status
+from fastapi.routing import APIRouter
+
+from .. import crud
+from ..auth import get_current_principal, get_user_db
+from ..database import Database
+from ..models import (
+    RecurringRuleCreate,
+    RecurringRuleRead,
+    RecurringRuleUpdate,
+    UserPrincipal,
+)
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[RecurringRuleRead])
+async def list_recurring_rules(
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
+) -> List[RecurringRuleRead]:
+    return await db.run(crud.list_recurring_rules, current_user.id)
+
+
+@router.post("/", response_model=RecurringRuleRead, status_code=status.HTTP_201_CREATED)
+async def create_recurring_rule(
+    payload: RecurringRuleCreate,
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
+) -> RecurringRuleRead:
+    """Store a schedule; its occurrences show up as transactions when read."""
+    return await db.run(crud.create_recurring_rule, payload, current_user.id)
+
+
+@router.put("/{rule_id}", response_model=RecurringRuleRead)
+async def update_recurring_rule(
+    rule_id: int,
+    payload: RecurringRuleUpdate,
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
+) -> RecurringRuleRead:
+    """Change a rule; every occurrence not yet edited or deleted follows it."""
+    rule = await db.run(crud.get_recurring_rule, rule_id, current_user.id)
+    if not rule:
+        raise HTTPException(status_code=404, detail="Recurring rule not found")
+    try:
+        return await db.run(crud.update_recurring_rule, rule, payload)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+
+@router.delete("/{rule_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_recurring_rule(
+    rule_id: int,
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
+) -> None:
+    """Delete a rule with all its occurrences; edited ones stay as transactions."""
+    rule = await db.run(crud.get_recurring_rule, rule_id, current_user.id)
+    if not rule:
+        raise HTTPException(status_code=404, detail="Recurring rule not found")
+    await db.run(crud.delete_recurring_rule, rule)
@@ -0,0 +1,46 @@
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Query, Response
+from fastapi.routing import APIRouter
+
+from .. import crud, serialization
+from ..auth import get_current_principal, get_user_db
+from ..database import Database
+from ..models import SyncPage, UserPrincipal
+
+router = APIRouter()
+
+MAX_SYNC_PAGE_SIZE = 1000
+
+
+@router.get("/", response_model=SyncPage)
+async def sync(
+    since: Optional[str] = Query(
+        None, description="`cursor` of a previous page; omit to download everything"
+    ),
+    limit: int = Query(500, ge=1, le=MAX_SYNC_PAGE_SIZE, description="Changes per page"),
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
+) -> Response:
+    """Transactions and goals created, updated or deleted since a cursor.
+
+    Changed rows are returned in their current state, deletions as
+    `{"entity": "transaction" | "goal", "id": ...}`. Store the returned
+    `cursor` and pass it as `since` next time; while `has_more` is true,
+    request the next page right away. A cursor stays valid indefinitely.
+
+    Occurrences of recurring rules are not part of the stream: they are
+    generated from the rule as days pass, without a change to sync. An
+    occurrence that is edited is stored, and synced, as a transaction.
+    """
+    try:
+        transactions, goals, deletions, cursor, has_more = await db.run(
+            crud.list_changes, current_user.id, since, limit
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    content = serialization.encode_sync_page(
+        crud.TRANSACTION_READ_COLUMNS, transactions, crud.GOAL_READ_COLUMNS, goals,
+        deletions, cursor, has_more,
+    )
+    return serialization.json_response(content)
@@ -1,57 +1,255 @@
-from typing import List
+from datetime import date
+from typing import List, Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from fastapi.routing import APIRouter
-from sqlmodel import Session
 
-from .. import crud
-from ..auth import get_current_user
-from ..database import get_session
-from ..models import TransactionCreate, TransactionRead, TransactionUpdate, User
+from .. import crud, etag, recurring, search, serialization
+from ..auth import get_current_principal, get_user_db
+from ..database import Database
+from ..response_cache import response_cache
+from ..models import (
+    BatchResult,
+    ImportResult,
+    TransactionBatchDelete,
+    TransactionBatchResult,
+    TransactionBatchUpdate,
+    TransactionCreate,
+    TransactionFilter,
+    TransactionRead,
+    TransactionSummary,
+    TransactionUpdate,
+    UserPrincipal,
+)
+from ..sharding import user_placement
 
 router = APIRouter()
 
+MAX_PAGE_SIZE = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+NEXT_OFFSET_HEADER = "X-Next-Offset"
+# Deep offsets re-rank every skipped row; narrow the query instead
+MAX_SEARCH_OFFSET = 10_000
+
 
 @router.get("/", response_model=List[TransactionRead])
-def list_transactions(
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
-) -> List[TransactionRead]:
-    transactions = crud.list_transactions(session, current_user.id)
-    return list(transactions)
+async def list_transactions(
+    request: Request,
+    limit: Optional[int] = Query(
+        None, ge=1, le=MAX_PAGE_SIZE, description="Page size; omit to list everything"
+    ),
+    cursor: Optional[str] = Query(None, description="Value of a previous X-Next-Cursor header"),
+    format: str = Query("records", pattern="^(records|columnar)$"),
+    occurrences: bool = Query(
+        True, description="Include occurrences of recurring rules; sync clients pass false"
+    ),
+    filters: TransactionFilter = Depends(),
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
+) -> Response:
+    """List transactions newest first.
+
+    When `limit` is given the result is one page, and the cursor of the next
+    page (if there is one) is returned in the `X-Next-Cursor` header. Sends
+    304 when If-None-Match carries the current ETag. `format=columnar`
+    returns `{"columns": [...], "rows": [[...]]}` instead of objects.
+
+    Occurrences of recurring rules are listed up to `end_date`, or today
+    without one, with negative ids. `/api/sync` does not carry them, so
+    clients that keep a synced copy pass `occurrences=false` and only get
+    rows that the sync stream updates and deletes.
+    """
+    if limit is None and cursor is not None:
+        raise HTTPException(status_code=400, detail="cursor requires limit")
+    today = date.today()
+    version = await db.run(crud.get_data_version, current_user.id, crud.TRANSACTIONS_SCOPE)
+    # Occurrences appear as days pass, without a data version change
+    variant = f"{request.url.query}@{today.isoformat()}"
+    tag = etag.make_etag(request, crud.TRANSACTIONS_SCOPE, current_user.id, version, variant)
+    if etag.etag_matches(request.headers.get("if-none-match"), tag):
+        return etag.not_modified(tag)
+    cached = response_cache.get(crud.TRANSACTIONS_SCOPE, current_user.id, version, variant)
+    if cached is not None:
+        content, extra_headers = cached
+        return serialization.json_response(content, {**etag.etag_headers(tag), **extra_headers})
+    try:
+        rows, next_cursor = await db.run(
+            crud.list_transaction_rows, current_user.id, filters, limit, cursor, today,
+            occurrences,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    extra_headers = {} if next_cursor is None else {NEXT_CURSOR_HEADER: next_cursor}
+    content = serialization.encode_rows(crud.TRANSACTION_READ_COLUMNS, rows, format)
+    response_cache.put(
+        crud.TRANSACTIONS_SCOPE, current_user.id, version, variant, content, extra_headers
+    )
+    return serialization.json_response(content, {**etag.etag_headers(tag), **extra_headers})
+
+
+@router.get("/search", response_model=List[TransactionRead])
+async def search_transactions(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200, description="Words to find, as prefixes"),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=MAX_SEARCH_OFFSET),
+    sort: str = Query("relevance", pattern=f"^({'|'.join(search.SORT_ORDERS)})$"),
+    format: str = Query("records", pattern="^(records|columnar)$"),
+    filters: TransactionFilter = Depends(),
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
+) -> Response:
+    """Search descriptions and categories; every word matches as a prefix.
+
+    Accepts the list filters. The offset of the next page, if any, is
+    returned in the `X-Next-Offset` header. Only stored transactions are
+    searched, not archived ones or recurring occurrences.
+    """
+    version = await db.run(crud.get_data_version, current_user.id, crud.TRANSACTIONS_SCOPE)
+    tag = etag.make_etag(request, crud.TRANSACTIONS_SCOPE, current_user.id, version)
+    if etag.etag_matches(request.headers.get("if-none-match"), tag):
+        return etag.not_modified(tag)
+    rows, next_offset = await db.run(
+        crud.search_transaction_rows, current_user.id, q, filters, limit, offset, sort
+    )
+    headers = etag.etag_headers(tag)
+    if next_offset is not None:
+        headers[NEXT_OFFSET_HEADER] = str(next_offset)
+    content = serialization.encode_rows(crud.TRANSACTION_READ_COLUMNS, rows, format)
+    return serialization.json_response(content, headers)
+
+
+@router.get("/summary", response_model=TransactionSummary)
+async def get_summary(
+    as_of: Optional[date] = Query(None, description="Reference day; defaults to today"),
+    days: int = Query(30, ge=1, le=366, description="Window for the average daily spend"),
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
+) -> TransactionSummary:
+    return await db.run(
+        crud.get_transaction_summary, current_user.id, as_of or date.today(), days
+    )
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_transactions(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = Query(False, description="Gzip-compress the stream"),
+    filters: TransactionFilter = Depends(),
+    current_user: UserPrincipal = Depends(get_current_principal),
+) -> StreamingResponse:
+    """Stream all matching transactions, newest first, as CSV or NDJSON."""
+    # Bulk import and export are only loaded by workers that serve them
+    from .. import bulk
+
+    filename = f"transactions-{date.today():%Y%m%d}.{format}"
+    media_type = bulk.EXPORT_MEDIA_TYPES[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    placement = await user_placement(current_user.id)
+    return StreamingResponse(
+        bulk.export_transactions(
+            current_user.id, format, filters, compress=gzip, shard=placement.shard
+        ),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 @router.post("/", response_model=TransactionRead, status_code=status.HTTP_201_CREATED)
-def create_transaction(
+async def create_transaction(
     payload: TransactionCreate,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
 ) -> TransactionRead:
-    transaction = crud.create_transaction(session, payload, current_user.id)
+    transaction = await db.run(crud.create_transaction, payload, current_user.id)
     return transaction
 
 
+@router.post("/import", response_model=ImportResult)
+async def import_transactions(
+    request: Request,
+    format: Optional[str] = Query(
+        None, description="csv or ndjson; inferred from Content-Type when omitted"
+    ),
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
+) -> ImportResult:
+    """Import transactions from a streamed CSV (with header row) or NDJSON body.
+
+    Valid rows are inserted in chunks; invalid rows are skipped and reported
+    by line number without aborting the rest of the upload.
+    """
+    from .. import bulk
+
+    fmt = format or bulk.format_from_content_type(request.headers.get("content-type"))
+    if fmt not in bulk.IMPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Upload text/csv or application/x-ndjson, or pass format=csv|ndjson",
+        )
+    return await bulk.import_transactions(db, current_user.id, request.stream(), fmt)
+
+
+@router.patch("/batch", response_model=TransactionBatchResult)
+async def update_transactions(
+    payload: TransactionBatchUpdate,
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
+) -> TransactionBatchResult:
+    """Apply one patch to every transaction picked by `ids` or `filter`.
+
+    Runs as a single UPDATE and commit. Ids that do not exist or belong to
+    someone else are skipped; `affected` counts the rows actually updated.
+    """
+    affected, rows = await db.run(
+        crud.update_transactions, current_user.id, payload.patch, payload.ids,
+        payload.filter, payload.return_rows,
+    )
+    return TransactionBatchResult(affected=affected, items=rows)
+
+
+@router.post("/batch/delete", response_model=BatchResult)
+async def delete_transactions(
+    payload: TransactionBatchDelete,
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
+) -> BatchResult:
+    """Delete every transaction picked by `ids` or `filter` in one statement."""
+    affected = await db.run(
+        crud.delete_transactions, current_user.id, payload.ids, payload.filter
+    )
+    return BatchResult(affected=affected)
+
+
 @router.put("/{transaction_id}", response_model=TransactionRead)
-def update_transaction(
+async def update_transaction(
     transaction_id: int,
     payload: TransactionUpdate,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
 ) -> TransactionRead:
-    transaction = crud.get_transaction(session, transaction_id, current_user.id)
+    transaction = await db.run(crud.get_transaction, transaction_id, current_user.id)
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
-    updated = crud.update_transaction(session, transaction, payload)
+    updated = await db.run(crud.update_transaction, transaction, payload)
     return updated
 
 
 @router.delete("/{transaction_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_transaction(
+async def delete_transaction(
     transaction_id: int,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user),
+    db: Database = Depends(get_user_db),
+    current_user: UserPrincipal = Depends(get_current_principal),
 ) -> None:
-    transaction = crud.get_transaction(session, transaction_id, current_user.id)
+    if recurring.parse_occurrence_id(transaction_id) is not None:
+        # Deleting an occurrence only records an exception on its rule
+        if not await db.run(crud.delete_transactions, current_user.id, [transaction_id]):
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        return
+    transaction = await db.run(crud.get_transaction, transaction_id, current_user.id)
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
-    crud.delete_transaction(session, transaction)
+    await db.run(crud.delete_transaction, transaction)
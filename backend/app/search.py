@@ -0,0 +1,176 @@
+"""Full-text search over transaction descriptions and categories.
+
+On SQLite a contentless FTS5 table, `transaction_fts`, indexes every
+transaction under its id. Index terms are scoped to the owner: user 7's
+"Uber ride" is indexed as ``u7wuber u7wride``. A query therefore only walks
+the postings of the caller's own terms, and the match alone restricts results
+to the caller, instead of intersecting every user's postings for a word with
+a per-user token.
+
+The `crud` helpers keep the index in step with their inserts, updates and
+deletes, including bulk imports and set-based batch statements, by calling
+`index_rows` after rows are written and `unindex_rows` before they change or
+go. Both are single INSERT ... SELECT statements that derive terms with the
+`spendshift_search_terms` SQL function, which `register_functions` installs
+on each of the app's connections. The schema itself only uses plain SQL, so
+other tools can still write to the database; the index misses their changes
+until `rebuild` (the rebuild-search-index command) runs.
+
+Other databases have no index and fall back to case-insensitive substring
+matching in `crud.search_transaction_rows`.
+"""
+import re
+from typing import List, Optional
+
+from sqlalchemy import column, insert, literal, select, table
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql.functions import Function
+
+from .models import Category, Transaction
+
+FTS_TABLE = "transaction_fts"
+TERMS_FUNCTION = "spendshift_search_terms"
+SORT_ORDERS = ("relevance", "date")
+# Transaction columns the index is derived from, besides the owner
+INDEXED_COLUMNS = frozenset({"description", "category_id"})
+# bm25 weights of the description and category columns
+RANK_WEIGHTS = (1.0, 0.5)
+
+# Letters and digits only: FTS5's unicode61 tokenizer also splits on "_"
+_WORD = re.compile(r"[^\W_]+")
+
+_TABLE_DDL = (
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    "description, category, content='', tokenize='unicode61 remove_diacritics 2')"
+)
+# Triggers that kept the index in step before the crud helpers did. They
+# called the terms function, so writers other than the app failed.
+_LEGACY_TRIGGERS = (f"{FTS_TABLE}_insert", f"{FTS_TABLE}_delete", f"{FTS_TABLE}_update")
+
+_fts = table(
+    FTS_TABLE, column(FTS_TABLE), column("rowid"), column("description"), column("category")
+)
+
+
+def words(text: Optional[str]) -> List[str]:
+    return _WORD.findall(text.lower()) if text else []
+
+
+def search_terms(user_id: int, text: Optional[str]) -> str:
+    """Owner-scoped index terms of one column value."""
+    return " ".join(f"u{user_id}w{word}" for word in words(text))
+
+
+def match_expression(user_id: int, query: str) -> Optional[str]:
+    """FTS5 query matching rows of `user_id` containing every word as a prefix.
+
+    None when the query has no searchable words. Words are letters and digits
+    only, so quoting them is enough to keep FTS5 syntax out of user input.
+    """
+    query_words = words(query)
+    if not query_words:
+        return None
+    return " AND ".join(f'"u{user_id}w{word}"*' for word in query_words)
+
+
+def register_functions(dbapi_connection) -> None:
+    """Install the SQL function that derives index terms on a new connection."""
+    dbapi_connection.create_function(TERMS_FUNCTION, 2, search_terms, deterministic=True)
+
+
+def schema_ddl() -> List[str]:
+    """DDL of the index, part of the schema fingerprint."""
+    return [_TABLE_DDL]
+
+
+def _index_statement(*clauses):
+    """INSERT adding the transactions matching `clauses` to the index."""
+    return insert(_fts).from_select(
+        ["rowid", "description", "category"],
+        select(
+            Transaction.id,
+            Function(TERMS_FUNCTION, Transaction.user_id, Transaction.description),
+            Function(TERMS_FUNCTION, Transaction.user_id, Category.name),
+        )
+        .outerjoin(Category, Category.id == Transaction.category_id)
+        .where(*clauses),
+    )
+
+
+def index_rows(session, *clauses) -> None:
+    """Index the transactions matching `clauses`, once they have been written.
+
+    Runs in the caller's transaction; a no-op on databases other than SQLite.
+    """
+    if session.get_bind().dialect.name == "sqlite":
+        session.execute(_index_statement(*clauses))
+
+
+def unindex_rows(session, *clauses) -> None:
+    """Remove the transactions matching `clauses` from the index.
+
+    Call before the rows are deleted, or before an update of their
+    description or category, while they still hold the values they were
+    indexed with: a contentless table needs those to find the terms to drop.
+    """
+    if session.get_bind().dialect.name == "sqlite":
+        added = _index_statement(*clauses).select
+        session.execute(insert(_fts).from_select(
+            [FTS_TABLE, "rowid", "description", "category"],
+            added.with_only_columns(literal("delete"), *added.selected_columns),
+        ))
+
+
+def _drop_legacy_triggers(connection: Connection) -> None:
+    for name in _LEGACY_TRIGGERS:
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def _install(connection: Connection) -> None:
+    _drop_legacy_triggers(connection)
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).first()
+    if not exists:
+        connection.exec_driver_sql(_TABLE_DDL)
+        connection.execute(_index_statement())
+
+
+def _drop(connection: Connection) -> None:
+    connection.exec_driver_sql(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def _run(bind, func) -> None:
+    if bind.dialect.name != "sqlite":
+        return
+    if isinstance(bind, Engine):
+        with bind.begin() as connection:
+            func(connection)
+    else:
+        func(bind)
+
+
+def install(bind) -> None:
+    """Create the index if missing, indexing existing rows.
+
+    `bind` is an engine or a connection inside a transaction; a no-op on
+    databases other than SQLite.
+    """
+    _run(bind, _install)
+
+
+def drop_legacy_triggers(bind) -> None:
+    """Drop the index triggers older versions installed.
+
+    A migration dropping a column they read has to run this first; `install`
+    drops them as well.
+    """
+    _run(bind, _drop_legacy_triggers)
+
+
+def rebuild(bind) -> None:
+    """Drop and re-create the index from the transaction table.
+
+    A contentless table cannot be emptied in place, so it is replaced.
+    """
+    _run(bind, lambda connection: (_drop(connection), _install(connection)))
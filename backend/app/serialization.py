@@ -0,0 +1,71 @@
+"""Fast JSON encoding for list responses.
+
+List endpoints select plain column tuples and encode them here in one pass,
+skipping per-row Pydantic model validation. The records format produces the
+same JSON as the `response_model` path; the columnar format sends each column
+name once:
+
+    {"columns": ["id", "description", ...], "rows": [[1, "Coffee", ...], ...]}
+
+orjson is used when installed, with the standard library as a fallback.
+"""
+import json
+from datetime import date, datetime
+from enum import Enum
+from typing import Dict, Optional, Sequence, Tuple
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+LIST_FORMATS = ("records", "columnar")
+JSON_MEDIA_TYPE = "application/json"
+
+
+def _default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(
+        payload, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def encode_rows(columns: Sequence[str], rows: Sequence[Sequence], fmt: str = "records") -> bytes:
+    """Encode row tuples as a list of objects, or as a columnar document."""
+    if fmt == "columnar":
+        return dumps({"columns": list(columns), "rows": [tuple(row) for row in rows]})
+    return dumps([dict(zip(columns, row)) for row in rows])
+
+
+def encode_sync_page(
+    transaction_columns: Sequence[str],
+    transactions: Sequence[Sequence],
+    goal_columns: Sequence[str],
+    goals: Sequence[Sequence],
+    deletions: Sequence[Tuple[str, int]],
+    cursor: str,
+    has_more: bool,
+) -> bytes:
+    """Encode one page of delta-sync changes in the `SyncPage` shape."""
+    return dumps({
+        "transactions": [dict(zip(transaction_columns, row)) for row in transactions],
+        "goals": [dict(zip(goal_columns, row)) for row in goals],
+        "deleted": [{"entity": entity, "id": entity_id} for entity, entity_id in deletions],
+        "cursor": cursor,
+        "has_more": has_more,
+    })
+
+
+def json_response(content: bytes, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(content=content, media_type=JSON_MEDIA_TYPE, headers=headers)
@@ -0,0 +1,362 @@
+"""Routing users to shard databases and moving them between shards.
+
+Users' data is spread over the databases in `settings.shard_database_urls`.
+The user directory (`settings.database_url`) records each user's shard in
+`UserShard`, and requests are routed by it through `shard_router`.
+`move_users` relocates users and `plan_rebalance` picks the moves that even
+out the number of users per shard; the CLI runs both (`move-user`,
+`rebalance-users`).
+
+Each shard allocates row ids on its own, so a user's transactions, goals and
+recurring rules get new ids on the shard they move to. Syncing clients see
+this as every old id being deleted and the rows reappearing under their new
+ids: the copy leaves tombstones for the old ids and stamps the rows with a
+later change sequence number (`crud.reissue_changes`). A new id may equal an
+old one; the row then follows its tombstone in the change stream, and a sync
+page holding both carries only the row. Archived
+transactions are moved back into the table first; the next archive run
+archives them on the new shard.
+
+A move takes three steps, separated by the placement cache TTL so that every
+process has seen one step before the next starts:
+
+1. the user is marked as moving: reads are still served from the old shard
+   and writes are refused with 503;
+2. the data is copied and the directory points at the new shard;
+3. the data is deleted from the old shard.
+
+An interrupted move can be rerun; step 2 first clears whatever an earlier
+attempt left on the new shard. The user's row and custom categories stay on
+the old shard: category ids are cached for good, and categories reference
+the user row.
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Collection, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import delete, insert
+from sqlalchemy.engine import Connection
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+
+from . import crud, search
+from .config import get_settings
+from .database import async_engine, engine, shard_database, shard_engines
+from .models import (
+    ArchiveSegment,
+    DataVersion,
+    Goal,
+    MonthlyRollup,
+    RecurringException,
+    RecurringRule,
+    Tombstone,
+    Transaction,
+    User,
+    UserInsights,
+    UserShard,
+)
+
+settings = get_settings()
+
+COPY_BATCH_SIZE = 1000
+
+# (user id, shard to move to)
+Move = Tuple[int, int]
+
+# Tables holding one user's rows in a `user_id` column, besides recurring rules
+_USER_TABLES = (
+    Transaction, Goal, Tombstone, MonthlyRollup, DataVersion, UserInsights, ArchiveSegment,
+)
+
+
+# Placement
+
+class Placement(NamedTuple):
+    shard: int
+    moving: bool = False
+
+
+class ShardRouter:
+    """Maps user ids to the shard holding their data.
+
+    The user directory's `UserShard` table is the authoritative map; users
+    without a row live on shard 0, where every user was before sharding was
+    configured. New users are spread over the shards by id. Placements are
+    cached per process for `ttl_seconds`, which bounds how long a process
+    keeps routing a user by an outdated placement.
+    """
+
+    def __init__(self, shards: int, ttl_seconds: float, max_size: int = 100_000) -> None:
+        self.shards = shards
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: Dict[int, Tuple[Placement, float]] = {}
+        self._lock = threading.Lock()
+
+    def new_user_shard(self, user_id: int) -> int:
+        return user_id % self.shards
+
+    def cached(self, user_id: int) -> Optional[Placement]:
+        if self.shards == 1:
+            return Placement(0)
+        entry = self._entries.get(user_id)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    def load(self, connection: Connection, user_id: int) -> Placement:
+        """Read a user's placement from the directory and cache it."""
+        if self.shards == 1:
+            return Placement(0)
+        row = connection.execute(
+            select(UserShard.shard, UserShard.moving).where(UserShard.user_id == user_id)
+        ).first()
+        placement = Placement(row.shard, row.moving) if row is not None else Placement(0)
+        with self._lock:
+            if len(self._entries) >= self.max_size:
+                self._entries.clear()
+            self._entries[user_id] = (placement, time.monotonic() + self.ttl_seconds)
+        return placement
+
+    def placed_on(self, connection: Connection, user_ids: Collection[int], shard: int) -> Set[int]:
+        """Those of `user_ids` that live on `shard`, read from the directory."""
+        if self.shards == 1:
+            return set(user_ids)
+        elsewhere = dict(connection.execute(
+            select(UserShard.user_id, UserShard.shard).where(UserShard.user_id.in_(user_ids))
+        ).all())
+        return {user_id for user_id in user_ids if elsewhere.get(user_id, 0) == shard}
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+shard_router = ShardRouter(len(shard_engines), settings.shard_cache_ttl_seconds)
+
+
+def user_placement_sync(user_id: int) -> Placement:
+    placement = shard_router.cached(user_id)
+    if placement is not None:
+        return placement
+    with engine.connect() as connection:
+        return shard_router.load(connection, user_id)
+
+
+async def user_placement(user_id: int) -> Placement:
+    """The shard holding a user's data and whether it is being moved."""
+    placement = shard_router.cached(user_id)
+    if placement is not None:
+        return placement
+    if async_engine is not None:
+        async with async_engine.connect() as connection:
+            return await connection.run_sync(shard_router.load, user_id)
+    return await run_in_threadpool(user_placement_sync, user_id)
+
+
+def users_on_shard(user_ids: Collection[int], shard: int) -> Set[int]:
+    with engine.connect() as connection:
+        return shard_router.placed_on(connection, user_ids, shard)
+
+
+def copy_user_row(session: Session, user: User) -> None:
+    """Give a shard the row of `user` its foreign keys point to, and commit.
+
+    The copy carries no password hash; credentials are only ever checked
+    against the directory.
+    """
+    if session.get(User, user.id) is not None:
+        return
+    session.add(User(
+        id=user.id, email=user.email, full_name=user.full_name, created_at=user.created_at,
+        hashed_password="",
+    ))
+    session.commit()
+
+
+async def ensure_user_on_shard(user: User, shard: int) -> None:
+    """Make sure the shard a user is placed on has the user's row."""
+    if shard_engines[shard] is engine:
+        return
+    async with shard_database(shard) as db:
+        await db.run(copy_user_row, user)
+
+
+# Moving users
+
+def _set_placement(user_id: int, shard: int, moving: bool) -> None:
+    with Session(engine) as directory:
+        row = directory.get(UserShard, user_id) or UserShard(user_id=user_id)
+        row.shard, row.moving, row.updated_at = shard, moving, datetime.utcnow()
+        directory.add(row)
+        directory.commit()
+    shard_router.invalidate(user_id)
+
+
+def purge_user(session: Session, user_id: int) -> None:
+    """Delete a user's data from a shard, without committing."""
+    search.unindex_rows(session, Transaction.user_id == user_id)
+    rules = select(RecurringRule.id).where(RecurringRule.user_id == user_id)
+    session.execute(delete(RecurringException).where(RecurringException.rule_id.in_(rules)))
+    session.execute(delete(RecurringRule).where(RecurringRule.user_id == user_id))
+    for model in _USER_TABLES:
+        session.execute(delete(model).where(model.user_id == user_id))
+
+
+def _copy_rows(source: Session, target: Session, model, user_id: int, seq: int) -> int:
+    """Copy a user's transactions or goals under new ids, stamped with `seq`."""
+    table = model.__table__
+    columns = [column for column in table.columns if column.name != "id"]
+    result = source.execute(
+        select(*columns).where(table.c.user_id == user_id).order_by(table.c.id)
+        .execution_options(yield_per=COPY_BATCH_SIZE)
+    )
+    copied = 0
+    for rows in result.partitions():
+        names = crud.category_names(source, (row.category_id for row in rows))
+        ids = crud.category_ids(target, user_id, set(names.values()))
+        values = []
+        for row in rows:
+            value = row._asdict()
+            category = value["category_id"]
+            value["category_id"] = None if category is None else ids[names[category]]
+            value["change_seq"] = seq
+            values.append(value)
+        target.execute(insert(table), values)
+        copied += len(values)
+    return copied
+
+
+def _copy_rules(source: Session, target: Session, user_id: int) -> None:
+    rules = source.exec(select(RecurringRule).where(RecurringRule.user_id == user_id)).all()
+    for rule in rules:
+        skipped = source.exec(
+            select(RecurringException.occurrence_date)
+            .where(RecurringException.rule_id == rule.id)
+        ).all()
+        copy = RecurringRule(**rule.model_dump(exclude={"id"}))
+        target.add(copy)
+        target.flush()
+        target.add_all(
+            RecurringException(rule_id=copy.id, occurrence_date=day) for day in skipped
+        )
+
+
+def copy_user(source: Session, target: Session, user: User) -> int:
+    """Copy a user's data from one shard to another and commit the copy.
+
+    Archived rows are first moved back into the source shard's table, in a
+    commit of their own. Returns the number of transactions copied. Stored
+    insights are not copied; they are recomputed on the new shard when read.
+    """
+    user_id = user.id
+    entries = crud.archived_segments(source, user_id)
+    if entries:
+        from . import archive
+
+        archive.rehydrate(source, user_id, entries)
+        source.commit()
+    copy_user_row(target, user)
+    purge_user(target, user_id)
+
+    versions = source.execute(
+        select(DataVersion.scope, DataVersion.version).where(DataVersion.user_id == user_id)
+    ).all()
+    if versions:
+        target.execute(insert(DataVersion.__table__), [
+            {"user_id": user_id, "scope": scope, "version": version}
+            for scope, version in versions
+        ])
+    tombstones = source.execute(
+        select(Tombstone.entity, Tombstone.entity_id, Tombstone.seq, Tombstone.deleted_at)
+        .where(Tombstone.user_id == user_id)
+    ).all()
+    if tombstones:
+        target.execute(insert(Tombstone.__table__), [
+            {"user_id": user_id, **row._asdict()} for row in tombstones
+        ])
+    replaced = {
+        crud.TRANSACTION_ENTITY: source.exec(
+            select(Transaction.id).where(Transaction.user_id == user_id)
+        ).all(),
+        crud.GOAL_ENTITY: source.exec(select(Goal.id).where(Goal.user_id == user_id)).all(),
+    }
+    seq = crud.reissue_changes(target, user_id, replaced)
+    copied = _copy_rows(source, target, Transaction, user_id, seq)
+    search.index_rows(target, Transaction.user_id == user_id, Transaction.change_seq == seq)
+    _copy_rows(source, target, Goal, user_id, seq)
+    _copy_rules(source, target, user_id)
+    # Also commits the copy
+    crud.rebuild_rollups(target, user_id)
+    return copied
+
+
+def move_users(
+    moves: Sequence[Move], settle_seconds: Optional[float] = None
+) -> List[Tuple[int, int, int, int]]:
+    """Move users to other shards, taking each step for the whole batch at once.
+
+    Waits `settle_seconds` (by default a little over the placement cache
+    TTL) between steps. Users already on their target shard are left alone.
+    Returns (user id, old shard, new shard, transactions copied) per move.
+    """
+    if settle_seconds is None:
+        settle_seconds = settings.shard_cache_ttl_seconds + 1
+    pending: List[Tuple[User, int, int]] = []
+    with Session(engine) as directory:
+        for user_id, shard in moves:
+            if not 0 <= shard < len(shard_engines):
+                raise ValueError(f"No shard {shard}; there are {len(shard_engines)}")
+            user = directory.get(User, user_id)
+            if user is None:
+                raise ValueError(f"No user {user_id}")
+            placement = directory.get(UserShard, user_id)
+            current = placement.shard if placement is not None else 0
+            if current != shard:
+                pending.append((user, current, shard))
+    if not pending:
+        return []
+
+    for user, current, _shard in pending:
+        _set_placement(user.id, current, moving=True)
+    time.sleep(settle_seconds)
+    moved = []
+    for user, current, shard in pending:
+        with Session(shard_engines[current]) as source, Session(shard_engines[shard]) as target:
+            copied = copy_user(source, target, user)
+        _set_placement(user.id, shard, moving=False)
+        moved.append((user.id, current, shard, copied))
+    time.sleep(settle_seconds)
+    for user, current, _shard in pending:
+        with Session(shard_engines[current]) as source:
+            purge_user(source, user.id)
+            source.commit()
+    return moved
+
+
+def plan_rebalance() -> List[Move]:
+    """Moves that leave every shard within one user of the others.
+
+    Users are taken from the fullest shard, newest first, and given to the
+    emptiest one.
+    """
+    with Session(engine) as directory:
+        placed: Dict[int, int] = dict(
+            directory.execute(select(UserShard.user_id, UserShard.shard)).all()
+        )
+        users = directory.exec(select(User.id).order_by(User.id)).all()
+    members: Dict[int, List[int]] = {shard: [] for shard in range(len(shard_engines))}
+    for user_id in users:
+        shard = placed.get(user_id, 0)
+        if shard in members:
+            members[shard].append(user_id)
+    moves: List[Move] = []
+    while True:
+        fullest = max(members, key=lambda shard: len(members[shard]))
+        emptiest = min(members, key=lambda shard: len(members[shard]))
+        if len(members[fullest]) - len(members[emptiest]) <= 1:
+            return moves
+        user_id = members[fullest].pop()
+        members[emptiest].append(user_id)
+        moves.append((user_id, emptiest))
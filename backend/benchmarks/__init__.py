@@ -0,0 +1,6 @@
+"""Performance benchmarks for the SpendShift backend.
+
+Run modules from the ``backend/`` directory, e.g.::
+
+    python -m benchmarks.bench_sqlite_profile
+"""
@@ -0,0 +1,161 @@
+"""Category-grouped aggregation with category names on every row vs. category ids.
+
+Builds two SQLite databases holding the same synthetic transactions (from
+`datagen`) in the two layouts the transaction table has had:
+
+* names: the category name repeated in a text column of every row;
+* ids: an integer `category_id` into a `category` table holding each name once.
+
+Both get the (user_id, date, id) index the app uses. For each layout it
+reports the size of the database file and the best time of:
+
+* per user: one user's expenses summed by category, the query behind
+  category breakdowns (names are joined back in for the ids layout);
+* all users: every row grouped by (user, month, category, type), the query a
+  rollup rebuild runs.
+
+    python -m benchmarks.bench_category_aggregation --users 200 --transactions 5000
+"""
+import argparse
+import json
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from app.categories import DEFAULT_CATEGORIES
+
+from .datagen import generate_transactions
+
+_TABLES = {
+    "names": """
+        CREATE TABLE "transaction" (
+            id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, date DATE NOT NULL,
+            description VARCHAR NOT NULL, amount FLOAT NOT NULL, category VARCHAR NOT NULL,
+            type VARCHAR(7) NOT NULL
+        )""",
+    "ids": """
+        CREATE TABLE "transaction" (
+            id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, date DATE NOT NULL,
+            description VARCHAR NOT NULL, amount FLOAT NOT NULL,
+            category_id INTEGER NOT NULL REFERENCES category (id), type VARCHAR(7) NOT NULL
+        )""",
+}
+
+_PER_USER = {
+    "names": """
+        SELECT category, sum(amount) FROM "transaction"
+        WHERE user_id = ? AND type = 'expense' GROUP BY category""",
+    "ids": """
+        SELECT c.name, t.total FROM (
+            SELECT category_id, sum(amount) AS total FROM "transaction"
+            WHERE user_id = ? AND type = 'expense' GROUP BY category_id
+        ) AS t JOIN category AS c ON c.id = t.category_id""",
+}
+
+_ALL_USERS = {
+    "names": """
+        SELECT user_id, substr(date, 1, 7), category, type, sum(amount), count(*)
+        FROM "transaction" GROUP BY user_id, substr(date, 1, 7), category, type""",
+    "ids": """
+        SELECT user_id, substr(date, 1, 7), category_id, type, sum(amount), count(*)
+        FROM "transaction" GROUP BY user_id, substr(date, 1, 7), category_id, type""",
+}
+
+
+def _build(path: Path, layout: str, users: int, per_user: int, seed: int) -> None:
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE category (id INTEGER PRIMARY KEY, user_id INTEGER, name VARCHAR NOT NULL)"
+    )
+    connection.executemany(
+        "INSERT INTO category (user_id, name) VALUES (NULL, ?)",
+        [(name,) for name in DEFAULT_CATEGORIES],
+    )
+    ids = {name: category_id for category_id, name in connection.execute(
+        "SELECT id, name FROM category"
+    )}
+    connection.execute(_TABLES[layout])
+    rng = random.Random(seed)
+    for user_id in range(1, users + 1):
+        rows = [
+            (user_id, row.date.isoformat(), row.description, row.amount,
+             row.category if layout == "names" else ids[row.category], row.type.value)
+            for row in generate_transactions(rng, per_user, date(2025, 6, 30))
+        ]
+        connection.executemany(
+            f'INSERT INTO "transaction" (user_id, date, description, amount, '
+            f'{"category" if layout == "names" else "category_id"}, type) '
+            f"VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+    connection.execute(
+        'CREATE INDEX ix_transaction_user_date_id ON "transaction" (user_id, date, id)'
+    )
+    connection.commit()
+    connection.execute("VACUUM")
+    connection.execute("ANALYZE")
+    connection.close()
+
+
+def _best(func: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def run(workdir: Path, layout: str, users: int, per_user: int, repeat: int, seed: int) -> dict:
+    path = workdir / f"{layout}.db"
+    _build(path, layout, users, per_user, seed)
+    connection = sqlite3.connect(path)
+    rng = random.Random(seed)
+    sample = [rng.randint(1, users) for _ in range(min(users, 50))]
+
+    def per_user_breakdowns() -> None:
+        for user_id in sample:
+            connection.execute(_PER_USER[layout], (user_id,)).fetchall()
+
+    result = {
+        "layout": layout,
+        "file_bytes": path.stat().st_size,
+        "per_user_ms": round(_best(per_user_breakdowns, repeat) / len(sample) * 1000, 3),
+        "all_users_ms": round(
+            _best(lambda: connection.execute(_ALL_USERS[layout]).fetchall(), repeat) * 1000, 1
+        ),
+    }
+    connection.close()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--transactions", type=int, default=5000, help="Per user")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench-categories-"))
+    results: List[Dict] = [
+        run(workdir, layout, args.users, args.transactions, args.repeat, args.seed)
+        for layout in ("names", "ids")
+    ]
+    before, after = results
+    summary = {
+        "rows": args.users * args.transactions,
+        "results": results,
+        "file_size_ratio": round(after["file_bytes"] / before["file_bytes"], 3),
+        "per_user_speedup": round(before["per_user_ms"] / after["per_user_ms"], 2),
+        "all_users_speedup": round(before["all_users_ms"] / after["all_users_ms"], 2),
+    }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Latency of transaction full-text search on a large SQLite database.
+
+Seeds ``--users`` users with ``--transactions`` each using `datagen` (one
+million rows by default), then times `crud.search_transaction_rows` for a
+mix of full-word, prefix, multi-word, category and filtered queries, by
+relevance and by date, cycling through users.
+
+    python -m benchmarks.bench_search --users 100 --transactions 10000
+"""
+import argparse
+import statistics
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+from typing import List
+
+from sqlmodel import Session, SQLModel
+
+from app import crud, search
+from app.database import create_db_engine
+from app.models import TransactionFilter, TransactionType
+
+from .datagen import populate
+
+QUERIES = [
+    ("uber", None),
+    ("ub", None),
+    ("corner caf", None),
+    ("transp", None),
+    ("salary", None),
+    ("amazon", TransactionFilter(start_date=date(2025, 1, 1), type=TransactionType.EXPENSE)),
+    ("zzzz", None),
+]
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, round(fraction * (len(sorted_values) - 1)))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--transactions", type=int, default=10_000, help="Per user")
+    parser.add_argument("--repeat", type=int, default=50, help="Runs per query and sort order")
+    parser.add_argument("--limit", type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench-search-"))
+    engine = create_db_engine(f"sqlite:///{workdir / 'bench.db'}")
+    SQLModel.metadata.create_all(engine)
+    search.install(engine)
+    started = time.perf_counter()
+    with Session(engine) as session:
+        users = populate(session, args.users, args.transactions, 0)
+    print(f"Seeded {args.users * args.transactions} transactions in {time.perf_counter() - started:.1f}s")
+
+    print(f"{'query':<14} {'filters':<8} {'sort':<10} {'hits':>5} {'p50 ms':>8} {'p95 ms':>8}")
+    with Session(engine) as session:
+        for query, filters in QUERIES:
+            for sort in search.SORT_ORDERS:
+                timings, hits = [], []
+                for run in range(args.repeat):
+                    user = users[run % len(users)]
+                    before = time.perf_counter()
+                    rows, _ = crud.search_transaction_rows(
+                        session, user.id, query, filters, args.limit, 0, sort
+                    )
+                    timings.append(time.perf_counter() - before)
+                    hits.append(len(rows))
+                timings.sort()
+                print(
+                    f"{query:<14} {'yes' if filters else 'no':<8} {sort:<10} "
+                    f"{statistics.mean(hits):>5.0f} {_percentile(timings, 0.5) * 1000:>8.2f} "
+                    f"{_percentile(timings, 0.95) * 1000:>8.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Microbenchmark of the list-response serialization paths.
+
+Compares, for 10k and 100k transactions, the generic FastAPI path (load ORM
+objects, validate them through ``List[TransactionRead]``, encode with the
+standard JSON encoder) against the fast path used by the list endpoints
+(select column tuples, encode directly). Also checks that both produce the
+same JSON document.
+
+    python -m benchmarks.bench_serialization --sizes 10000 100000
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlmodel import Session, SQLModel
+
+from app import crud, serialization
+from app.database import create_db_engine
+from app.models import TransactionCreate, TransactionRead, TransactionType, User
+
+READ_ADAPTER = TypeAdapter(List[TransactionRead])
+
+
+def _seed(session: Session, rows: int) -> int:
+    rng = random.Random(rows)
+    user = User(email="bench@example.com", hashed_password="x")
+    session.add(user)
+    session.commit()
+    payloads = [
+        TransactionCreate(
+            description=f"Purchase #{i} ☕",
+            amount=round(rng.uniform(1, 500), 2),
+            category=rng.choice(["Food & Dining", "Shopping", "Travel"]),
+            type=rng.choice(list(TransactionType)),
+            date=date(2020, 1, 1) + timedelta(days=rng.randrange(1500)),
+        )
+        for i in range(rows)
+    ]
+    for start in range(0, rows, 5000):
+        crud.bulk_create_transactions(session, payloads[start : start + 5000], user.id)
+    return user.id
+
+
+def _timed(func, repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def run(rows: int, repeat: int) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix="bench-serialization-"))
+    engine = create_db_engine(f"sqlite:///{workdir / 'bench.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        user_id = _seed(session, rows)
+
+    def model_path() -> bytes:
+        with Session(engine) as session:
+            transactions = crud.list_transactions(session, user_id)
+            # Rows hold a category id; the read model carries the name
+            names = crud.category_names(session, (row.category_id for row in transactions))
+            validated = READ_ADAPTER.validate_python([
+                dict(row.model_dump(), category=names[row.category_id]) for row in transactions
+            ])
+            return JSONResponse(jsonable_encoder(validated)).body
+
+    def fast_path(fmt: str = "records") -> bytes:
+        with Session(engine) as session:
+            result, _ = crud.list_transaction_rows(session, user_id)
+            return serialization.encode_rows(crud.TRANSACTION_READ_COLUMNS, result, fmt)
+
+    model_seconds, model_body = _timed(model_path, repeat)
+    fast_seconds, fast_body = _timed(fast_path, repeat)
+    columnar_seconds, columnar_body = _timed(lambda: fast_path("columnar"), repeat)
+    engine.dispose()
+    return {
+        "rows": rows,
+        "model_path_ms": round(model_seconds * 1000, 1),
+        "fast_path_ms": round(fast_seconds * 1000, 1),
+        "columnar_ms": round(columnar_seconds * 1000, 1),
+        "speedup": round(model_seconds / fast_seconds, 2),
+        "records_bytes": len(fast_body),
+        "columnar_bytes": len(columnar_body),
+        "same_document": json.loads(model_body) == json.loads(fast_body),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps([run(rows, args.repeat) for rows in args.sizes], indent=2))
+
+
+if __name__ == "__main__":
+    main()
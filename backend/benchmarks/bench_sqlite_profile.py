@@ -0,0 +1,112 @@
+"""Mixed read/write throughput of SQLite with the default and tuned profiles.
+
+Each profile gets a fresh database file seeded with transactions. Worker
+threads then run a mix of page reads (the keyset list query) and single-row
+inserts for a fixed duration. The benchmark reports completed operations per
+second and how many operations failed with "database is locked".
+
+    python -m benchmarks.bench_sqlite_profile --threads 8 --seconds 5
+"""
+import argparse
+import json
+import random
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel
+
+from app import crud
+from app.config import Settings
+from app.database import create_db_engine
+from app.models import TransactionCreate, TransactionType, User
+
+CATEGORIES = ["Food & Dining", "Transportation", "Shopping", "Bills & Utilities", "Other"]
+
+
+def _payload(rng: random.Random) -> TransactionCreate:
+    return TransactionCreate(
+        description="bench",
+        amount=round(rng.uniform(1, 200), 2),
+        category=rng.choice(CATEGORIES),
+        type=TransactionType.EXPENSE,
+        date=date(2024, 1, 1) + timedelta(days=rng.randrange(365)),
+    )
+
+
+def run_profile(profile: str, threads: int, seconds: float, write_ratio: float, seed_rows: int) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix=f"bench-{profile}-"))
+    config = Settings(database_profile=profile)
+    engine = create_db_engine(f"sqlite:///{workdir / 'bench.db'}", config)
+    SQLModel.metadata.create_all(engine)
+    rng = random.Random(0)
+    with Session(engine) as session:
+        user = User(email="bench@example.com", hashed_password="x")
+        session.add(user)
+        session.commit()
+        user_id = user.id
+        crud.bulk_create_transactions(session, [_payload(rng) for _ in range(seed_rows)], user_id)
+
+    counts = {"reads": 0, "writes": 0, "locked": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(index: int) -> None:
+        local_rng = random.Random(index)
+        done = {"reads": 0, "writes": 0, "locked": 0}
+        with Session(engine) as session:
+            while time.perf_counter() < deadline:
+                try:
+                    if local_rng.random() < write_ratio:
+                        crud.create_transaction(session, _payload(local_rng), user_id)
+                        done["writes"] += 1
+                    else:
+                        crud.list_transaction_page(session, user_id, 50)
+                        session.rollback()  # end the read transaction
+                        done["reads"] += 1
+                except OperationalError as exc:
+                    session.rollback()
+                    if "locked" not in str(exc):
+                        raise
+                    done["locked"] += 1
+        with lock:
+            for key, value in done.items():
+                counts[key] += value
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    return {
+        "profile": profile,
+        "threads": threads,
+        "seconds": round(elapsed, 3),
+        "reads_per_second": round(counts["reads"] / elapsed, 1),
+        "writes_per_second": round(counts["writes"] / elapsed, 1),
+        "locked_errors": counts["locked"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--seed-rows", type=int, default=20_000)
+    args = parser.parse_args()
+    results = [
+        run_profile(profile, args.threads, args.seconds, args.write_ratio, args.seed_rows)
+        for profile in ("default", "tuned")
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
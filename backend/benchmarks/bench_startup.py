@@ -0,0 +1,109 @@
+"""Cold-start cost of an API worker: import time and time to first /health.
+
+Every measurement runs in a fresh interpreter, as a new uvicorn worker would:
+
+* import: ``import app.main`` alone;
+* import CLI: ``import app.cli``, which CLI commands and the insights
+  precompute pool's processes pay without building the web app;
+* first health, new database: launch uvicorn against an empty SQLite file
+  and poll ``/health`` until it answers 200, so the schema is created;
+* first health, existing database: the same against a database whose schema
+  is already current, the common case when workers restart or scale out.
+
+    python -m benchmarks.bench_startup --repeat 10
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def _environment(database: Path) -> Dict[str, str]:
+    return {**os.environ, "SPENDSHIFT_DATABASE_URL": f"sqlite:///{database}"}
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def time_import(database: Path, module: str = "app.main") -> float:
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=_environment(database), check=True,
+    )
+    return time.perf_counter() - started
+
+
+def time_first_health(database: Path, timeout: float) -> float:
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/health"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=_environment(database),
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with status {server.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        raise RuntimeError(f"No successful /health within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def _stats(samples: List[float]) -> dict:
+    return {
+        "min_ms": round(min(samples) * 1000, 1),
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for /health")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench-startup-"))
+    existing = workdir / "existing.db"
+    # Create the schema once so the "existing database" runs find it current
+    time_first_health(existing, args.timeout)
+
+    results = {
+        "import": [], "import_cli": [], "first_health_new_db": [], "first_health_existing_db": [],
+    }
+    for run in range(args.repeat):
+        results["import"].append(time_import(existing))
+        results["import_cli"].append(time_import(existing, "app.cli"))
+        results["first_health_new_db"].append(
+            time_first_health(workdir / f"new-{run}.db", args.timeout)
+        )
+        results["first_health_existing_db"].append(time_first_health(existing, args.timeout))
+    print(json.dumps({name: _stats(samples) for name, samples in results.items()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Seeded synthetic dataset generator.
+
+Fills the SQLModel tables with users, transactions and goals whose categories
+and amounts follow the shape of real spending: many small food and transport
+purchases, a few large bills and trips, and income arriving as a twice-monthly
+salary with the occasional extra payment. The same seed always produces the
+same dataset.
+
+To fill the database configured in ``SPENDSHIFT_DATABASE_URL``::
+
+    python -m benchmarks.datagen --users 10 --transactions 5000 --goals 5
+"""
+import argparse
+import math
+import random
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import List
+
+from sqlmodel import Session
+
+from app import crud
+from app.auth import get_password_hash
+from app.models import GoalCreate, TransactionCreate, TransactionType, User
+
+DEFAULT_PASSWORD = "benchmark-password"
+
+# name: (share of expenses, median amount, log-normal sigma, merchants)
+EXPENSE_PROFILE = {
+    "Food & Dining": (0.30, 18.0, 0.6, ["Corner Cafe", "Burger Barn", "Sushi Go", "Grocery Mart"]),
+    "Transportation": (0.15, 22.0, 0.7, ["Uber", "Metro Card", "Shell", "City Parking"]),
+    "Entertainment": (0.08, 30.0, 0.8, ["Cinema City", "Netflix", "Spotify", "Bowling Lanes"]),
+    "Bills & Utilities": (0.08, 120.0, 0.5, ["Electric Co", "Water Works", "ISP Fiber", "Mobile Plan"]),
+    "Shopping": (0.15, 45.0, 0.9, ["Amazon", "Target", "Shoe Shack", "Book Nook"]),
+    "Healthcare": (0.05, 80.0, 0.9, ["Pharmacy", "Dental Care", "Clinic Co-pay"]),
+    "Education": (0.03, 150.0, 0.8, ["Online Course", "Textbooks", "Workshop"]),
+    "Travel": (0.04, 300.0, 0.9, ["Airline", "Hotel", "Car Rental"]),
+    "Other": (0.07, 40.0, 1.0, ["Gift", "Donation", "Misc"]),
+}
+GOAL_NAMES = ["Emergency fund", "Vacation", "New laptop", "Car down payment", "Wedding", "Course fees"]
+
+
+@dataclass
+class SeededUser:
+    id: int
+    email: str
+    password: str
+
+
+def _expense(rng: random.Random, day: date) -> TransactionCreate:
+    categories = list(EXPENSE_PROFILE)
+    weights = [EXPENSE_PROFILE[name][0] for name in categories]
+    category = rng.choices(categories, weights)[0]
+    _, median, sigma, merchants = EXPENSE_PROFILE[category]
+    amount = round(max(0.5, rng.lognormvariate(math.log(median), sigma)), 2)
+    return TransactionCreate(
+        description=rng.choice(merchants),
+        amount=amount,
+        category=category,
+        type=TransactionType.EXPENSE,
+        date=day,
+    )
+
+
+def _income(rng: random.Random, day: date, salary: float) -> TransactionCreate:
+    if rng.random() < 0.85:
+        return TransactionCreate(
+            description="Salary", amount=salary, category="Income",
+            type=TransactionType.INCOME, date=day,
+        )
+    return TransactionCreate(
+        description=rng.choice(["Freelance", "Refund", "Interest"]),
+        amount=round(rng.lognormvariate(math.log(150), 0.8), 2),
+        category="Income",
+        type=TransactionType.INCOME,
+        date=day,
+    )
+
+
+def generate_transactions(
+    rng: random.Random, count: int, end: date, days: int = 730
+) -> List[TransactionCreate]:
+    """`count` transactions spread over the `days` before `end`; ~8% income."""
+    salary = round(rng.uniform(1500, 4500), 2)
+    transactions = []
+    for _ in range(count):
+        day = end - timedelta(days=rng.randrange(days))
+        if rng.random() < 0.08:
+            transactions.append(_income(rng, day, salary))
+        else:
+            transactions.append(_expense(rng, day))
+    return transactions
+
+
+def generate_goals(rng: random.Random, count: int, today: date) -> List[GoalCreate]:
+    goals = []
+    for _ in range(count):
+        target = round(rng.choice([500, 1000, 2500, 5000, 10000]) * rng.uniform(0.8, 1.5), 2)
+        goals.append(
+            GoalCreate(
+                name=rng.choice(GOAL_NAMES),
+                target_amount=target,
+                current_amount=round(target * rng.random(), 2),
+                deadline=today + timedelta(days=rng.randrange(30, 1000)),
+                category=rng.choice([None, "Travel", "Shopping", "Education"]),
+            )
+        )
+    return goals
+
+
+def populate(
+    session: Session,
+    users: int,
+    transactions_per_user: int,
+    goals_per_user: int,
+    seed: int = 0,
+    password: str = DEFAULT_PASSWORD,
+    today: date = date(2025, 6, 30),
+    chunk_size: int = 5000,
+) -> List[SeededUser]:
+    """Insert a deterministic dataset and return the users created.
+
+    Every user shares one password hash, derived once, so seeding cost does
+    not include a key derivation per user.
+    """
+    rng = random.Random(seed)
+    hashed_password = get_password_hash(password)
+    seeded = []
+    for index in range(users):
+        user = User(
+            email=f"user{seed}-{index}@bench.example",
+            full_name=f"Bench User {index}",
+            hashed_password=hashed_password,
+        )
+        session.add(user)
+        session.commit()
+        transactions = generate_transactions(rng, transactions_per_user, today)
+        for start in range(0, len(transactions), chunk_size):
+            crud.bulk_create_transactions(session, transactions[start : start + chunk_size], user.id)
+        for goal in generate_goals(rng, goals_per_user, today):
+            crud.create_goal(session, goal, user.id)
+        seeded.append(SeededUser(id=user.id, email=user.email, password=password))
+    return seeded
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--transactions", type=int, default=1000, help="Per user")
+    parser.add_argument("--goals", type=int, default=5, help="Per user")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from app.database import engine, init_db
+
+    init_db()
+    with Session(engine) as session:
+        seeded = populate(session, args.users, args.transactions, args.goals, args.seed)
+    print(f"Created {len(seeded)} users; password for all: {DEFAULT_PASSWORD}")
+    for user in seeded[:5]:
+        print(f"  {user.email}")
+
+
+if __name__ == "__main__":
+    main()
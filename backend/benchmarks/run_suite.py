@@ -0,0 +1,328 @@
+"""End-to-end API benchmark suite.
+
+For each dataset size the suite seeds a fresh database with `datagen`, then
+drives every API route in-process through the ASGI app with httpx: login,
+me, list (full and paged), summary, create, update, delete, and the goal
+routes. It reports p50/p95/p99 latency, throughput and SQL statements per
+request, and writes everything as JSON so runs can be compared::
+
+    python -m benchmarks.run_suite --users 5 --transactions 100 1000 10000 \\
+        --output results.json
+    python -m benchmarks.run_suite ... --baseline results.json
+
+Each dataset drops and recreates every table, so the suite never touches
+SPENDSHIFT_DATABASE_URL: it uses SPENDSHIFT_BENCH_DATABASE_URL if set, and a
+temporary SQLite file otherwise.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Must happen before the app (and its engine) is imported
+os.environ["SPENDSHIFT_DATABASE_URL"] = os.environ.get("SPENDSHIFT_BENCH_DATABASE_URL") or (
+    f"sqlite:///{Path(tempfile.mkdtemp(prefix='spendshift-bench-')) / 'bench.db'}"
+)
+# Every login comes from one client; measure the hashing path, not the limiter
+os.environ.setdefault("SPENDSHIFT_AUTH_RATE_LIMIT_ENABLED", "false")
+
+import httpx  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlmodel import Session, SQLModel  # noqa: E402
+
+from app import database  # noqa: E402
+from app.auth import principal_cache  # noqa: E402
+from app.main import app  # noqa: E402
+
+from .datagen import populate  # noqa: E402
+
+
+class QueryCounter:
+    def __init__(self) -> None:
+        self.count = 0
+        engines = [database.engine]
+        if database.async_engine is not None:
+            engines.append(database.async_engine.sync_engine)
+        for db_engine in engines:
+            event.listen(db_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *_args) -> None:
+        self.count += 1
+
+
+class Context:
+    """State shared by scenarios: clients' tokens and ids created on the way."""
+
+    def __init__(self, users) -> None:
+        self.users = users
+        self.tokens: List[str] = []
+        self.created_transactions: List[tuple] = []
+        self.created_goals: List[tuple] = []
+        self._user_cycle = itertools.cycle(range(len(users)))
+
+    def next_user(self) -> int:
+        return next(self._user_cycle)
+
+    def auth(self, index: int) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.tokens[index]}"}
+
+
+Scenario = Callable[[httpx.AsyncClient, Context, int], Awaitable[httpx.Response]]
+
+
+async def login(client, ctx, i):
+    user = ctx.users[i % len(ctx.users)]
+    response = await client.post(
+        "/api/auth/login", data={"username": user.email, "password": user.password}
+    )
+    if len(ctx.tokens) < len(ctx.users) and response.status_code == 200:
+        ctx.tokens.append(response.json()["access_token"])
+    return response
+
+
+async def me(client, ctx, i):
+    return await client.get("/api/auth/me", headers=ctx.auth(ctx.next_user()))
+
+
+async def list_all(client, ctx, i):
+    return await client.get("/api/transactions/", headers=ctx.auth(ctx.next_user()))
+
+
+async def list_page(client, ctx, i):
+    return await client.get(
+        "/api/transactions/", params={"limit": 50}, headers=ctx.auth(ctx.next_user())
+    )
+
+
+async def summary(client, ctx, i):
+    return await client.get(
+        "/api/transactions/summary", params={"as_of": "2025-06-30"},
+        headers=ctx.auth(ctx.next_user()),
+    )
+
+
+async def create(client, ctx, i):
+    user = ctx.next_user()
+    response = await client.post(
+        "/api/transactions/",
+        json={"description": f"bench {i}", "amount": 12.5 + i % 50, "category": "Shopping",
+              "type": "expense", "date": "2025-06-15"},
+        headers=ctx.auth(user),
+    )
+    if response.status_code == 201:
+        ctx.created_transactions.append((user, response.json()["id"]))
+    return response
+
+
+async def update(client, ctx, i):
+    user, transaction_id = ctx.created_transactions[i % len(ctx.created_transactions)]
+    return await client.put(
+        f"/api/transactions/{transaction_id}", json={"amount": 20 + i % 7, "category": "Other"},
+        headers=ctx.auth(user),
+    )
+
+
+async def delete(client, ctx, i):
+    user, transaction_id = ctx.created_transactions.pop()
+    return await client.delete(f"/api/transactions/{transaction_id}", headers=ctx.auth(user))
+
+
+async def goals_list(client, ctx, i):
+    return await client.get("/api/goals/", headers=ctx.auth(ctx.next_user()))
+
+
+async def goals_create(client, ctx, i):
+    user = ctx.next_user()
+    response = await client.post(
+        "/api/goals/", json={"name": f"goal {i}", "target_amount": 1000, "deadline": "2026-01-01"},
+        headers=ctx.auth(user),
+    )
+    if response.status_code == 201:
+        ctx.created_goals.append((user, response.json()["id"]))
+    return response
+
+
+async def goals_update(client, ctx, i):
+    user, goal_id = ctx.created_goals[i % len(ctx.created_goals)]
+    return await client.put(
+        f"/api/goals/{goal_id}", json={"current_amount": i % 1000}, headers=ctx.auth(user)
+    )
+
+
+async def goals_delete(client, ctx, i):
+    user, goal_id = ctx.created_goals.pop()
+    return await client.delete(f"/api/goals/{goal_id}", headers=ctx.auth(user))
+
+
+# Order matters: later scenarios use tokens and ids produced by earlier ones
+SCENARIOS: Dict[str, Scenario] = {
+    "auth_login": login,
+    "auth_me": me,
+    "transactions_list_all": list_all,
+    "transactions_list_page": list_page,
+    "transactions_summary": summary,
+    "transactions_create": create,
+    "transactions_update": update,
+    "transactions_delete": delete,
+    "goals_list": goals_list,
+    "goals_create": goals_create,
+    "goals_update": goals_update,
+    "goals_delete": goals_delete,
+}
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, ctx: Context, scenario: Scenario, requests: int,
+    concurrency: int, counter: QueryCounter,
+) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    indexes = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for i in indexes:
+            started = time.perf_counter()
+            response = await scenario(client, ctx, i)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    queries_before = counter.count
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "queries_per_request": round((counter.count - queries_before) / requests, 2),
+    }
+
+
+def _reset_database() -> None:
+    SQLModel.metadata.drop_all(database.engine)
+    database.init_db()
+    principal_cache.clear()
+
+
+async def run_dataset(
+    users: int, transactions: int, goals: int, requests: int, login_requests: int,
+    concurrency: int, counter: QueryCounter, seed: int,
+) -> dict:
+    _reset_database()
+    started = time.perf_counter()
+    with Session(database.engine) as session:
+        seeded = populate(session, users, transactions, goals, seed=seed)
+    seed_seconds = time.perf_counter() - started
+
+    ctx = Context(seeded)
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, scenario in SCENARIOS.items():
+            count = max(login_requests, users) if name == "auth_login" else requests
+            if name.endswith("_delete"):
+                pool = ctx.created_transactions if name.startswith("transactions") else ctx.created_goals
+                count = min(count, len(pool))
+            if count == 0:
+                continue
+            results[name] = await run_scenario(client, ctx, scenario, count, concurrency, counter)
+    return {
+        "users": users,
+        "transactions_per_user": transactions,
+        "goals_per_user": goals,
+        "seed_seconds": round(seed_seconds, 2),
+        "scenarios": results,
+    }
+
+
+def compare(current: dict, baseline: dict) -> None:
+    """Print the p95 change of every scenario present in both runs."""
+    def key(dataset):
+        return dataset["users"], dataset["transactions_per_user"]
+
+    previous = {key(dataset): dataset for dataset in baseline["datasets"]}
+    print(f"{'dataset':>14} {'scenario':<26} {'p95 before':>11} {'p95 now':>9} {'change':>8}")
+    for dataset in current["datasets"]:
+        old = previous.get(key(dataset))
+        if old is None:
+            continue
+        for name, stats in dataset["scenarios"].items():
+            before = old["scenarios"].get(name)
+            if not before or not before["p95_ms"]:
+                continue
+            change = stats["p95_ms"] / before["p95_ms"] - 1
+            label = f"{dataset['users']}x{dataset['transactions_per_user']}"
+            print(f"{label:>14} {name:<26} {before['p95_ms']:>11.2f} {stats['p95_ms']:>9.2f} {change:>+8.1%}")
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    counter = QueryCounter()
+    datasets = []
+    for transactions in args.transactions:
+        datasets.append(
+            await run_dataset(
+                args.users, transactions, args.goals, args.requests, args.login_requests,
+                args.concurrency, counter, args.seed,
+            )
+        )
+    return {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database_url": database.engine.url.render_as_string(hide_password=True),
+            "async_database": database.async_engine is not None,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+        },
+        "datasets": datasets,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--transactions", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="Transactions per user; one dataset per value")
+    parser.add_argument("--goals", type=int, default=5, help="Goals per user")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--login-requests", type=int, default=20,
+                        help="Logins are PBKDF2-bound, so they get their own count")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write results JSON here")
+    parser.add_argument("--baseline", type=Path, help="Earlier results JSON to compare with")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(main_async(args))
+    text = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    else:
+        print(text)
+    if args.baseline:
+        compare(results, json.loads(args.baseline.read_text()))
+
+
+if __name__ == "__main__":
+    main()
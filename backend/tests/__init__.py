@@ -0,0 +1,6 @@
+"""Tests for the SpendShift backend.
+
+Run from the ``backend/`` directory::
+
+    python -m pytest tests
+"""
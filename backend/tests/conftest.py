@@ -0,0 +1,69 @@
+"""Shared fixtures: one app instance over two SQLite shards in a temporary directory.
+
+Settings are read when `app` is first imported, so the environment is set
+here before anything imports it. Users are placed on shard `id % 2`, so
+tests exercise both the directory database and a second shard.
+"""
+import json
+import os
+import tempfile
+from itertools import count
+
+import pytest
+
+_data_dir = tempfile.mkdtemp(prefix="spendshift-tests-")
+os.environ["SPENDSHIFT_DATABASE_URL"] = f"sqlite:///{_data_dir}/directory.db"
+os.environ["SPENDSHIFT_SHARD_DATABASE_URLS"] = json.dumps(
+    [f"sqlite:///{_data_dir}/directory.db", f"sqlite:///{_data_dir}/shard1.db"]
+)
+os.environ["SPENDSHIFT_ARCHIVE_DIR"] = f"{_data_dir}/archive"
+os.environ["SPENDSHIFT_AUTH_RATE_LIMIT_ENABLED"] = "false"
+os.environ["SPENDSHIFT_WORK_QUEUE_WORKERS"] = "0"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+
+_emails = count(1)
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def user(client):
+    """A newly registered user, as (user id, auth headers)."""
+    email = f"user{next(_emails)}@example.com"
+    registered = client.post("/api/auth/register", json={"email": email, "password": "secret1"})
+    response = client.post("/api/auth/login", data={"username": email, "password": "secret1"})
+    return registered.json()["id"], {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def add_transaction(client, headers, day, amount=10, category="Food & Dining", **fields):
+    """Create a transaction through the API and return its JSON."""
+    payload = {
+        "description": f"Purchase {amount}",
+        "amount": amount,
+        "category": category,
+        "type": "expense",
+        "date": str(day),
+        **fields,
+    }
+    response = client.post("/api/transactions/", json=payload, headers=headers)
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def sync_all(client, headers, since=None, limit=500):
+    """Follow /api/sync pages from `since`; returns the pages and the last cursor."""
+    pages = []
+    while True:
+        params = {"limit": limit, **({"since": since} if since else {})}
+        page = client.get("/api/sync/", params=params, headers=headers).json()
+        pages.append(page)
+        since = page["cursor"]
+        if not page["has_more"]:
+            return pages, since
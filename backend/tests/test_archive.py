@@ -0,0 +1,261 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+from sqlmodel import Session, select
+
+from app import archive, crud
+from app.database import shard_engines
+from app.sharding import user_placement_sync
+from app.models import ArchiveSegment, Transaction
+from app.response_cache import response_cache
+
+from .conftest import add_transaction
+
+CATEGORIES = ("Food & Dining", "Travel", "Rent")
+HORIZON = date(2022, 1, 1)
+
+
+def _session(user_id: int) -> Session:
+    return Session(shard_engines[user_placement_sync(user_id).shard])
+
+
+def _archive(user_id: int, before: date = HORIZON) -> int:
+    with _session(user_id) as session:
+        return archive.archive_user(session, user_id, before)
+
+
+def _hot_ids(user_id: int) -> set:
+    with _session(user_id) as session:
+        return set(session.exec(select(Transaction.id).where(Transaction.user_id == user_id)))
+
+
+def _segments(user_id: int) -> list:
+    with _session(user_id) as session:
+        return list(session.exec(select(ArchiveSegment).where(ArchiveSegment.user_id == user_id)))
+
+
+def _pages(client, headers, limit, **params):
+    rows, cursor = [], None
+    while True:
+        response = client.get(
+            "/api/transactions/",
+            params={"limit": limit, **params, **({"cursor": cursor} if cursor else {})},
+            headers=headers,
+        )
+        assert response.status_code == 200, response.text
+        rows.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return rows
+
+
+def _snapshot(client, headers):
+    response_cache.clear()
+    return {
+        "all": client.get("/api/transactions/", headers=headers).json(),
+        "pages": _pages(client, headers, 4),
+        "filtered": _pages(client, headers, 3, category="Travel", min_amount=15),
+        "export": client.get(
+            "/api/transactions/export", params={"format": "ndjson"}, headers=headers
+        ).text,
+        "summary": client.get(
+            "/api/transactions/summary", params={"as_of": "2021-03-10", "days": 400},
+            headers=headers,
+        ).json(),
+    }
+
+
+@pytest.fixture
+def history(client, user):
+    """A user with transactions every ~7 weeks from 2019, archived up to 2022."""
+    user_id, headers = user
+    created = [
+        add_transaction(
+            client, headers, date(2019, 1, 3) + timedelta(days=47 * number),
+            amount=10 + number, category=CATEGORIES[number % 3],
+            type="income" if number % 4 == 0 else "expense",
+        )
+        for number in range(30)
+    ]
+    return user_id, headers, created
+
+
+def test_archive_keeps_lists_exports_and_summaries(client, history):
+    user_id, headers, created = history
+    before = _snapshot(client, headers)
+
+    moved = _archive(user_id)
+    old = {row["id"] for row in created if row["date"] < str(HORIZON)}
+    assert moved == len(old)
+    assert _hot_ids(user_id) == {row["id"] for row in created} - old
+    assert sorted(entry.year for entry in _segments(user_id)) == [2019, 2020, 2021]
+
+    after = _snapshot(client, headers)
+    for key in before:
+        assert after[key] == before[key], key
+
+
+def test_keyset_pages_cross_from_hot_rows_into_the_archive(client, history):
+    user_id, headers, created = history
+    _archive(user_id)
+    newest_first = sorted(created, key=lambda row: (row["date"], row["id"]), reverse=True)
+    hot = sum(row["date"] >= str(HORIZON) for row in created)
+
+    for limit in (1, 3, hot, hot + 1):
+        pages = _pages(client, headers, limit)
+        assert [row["id"] for page in pages for row in page] == [
+            row["id"] for row in newest_first
+        ]
+        assert all(len(page) == limit for page in pages[:-1])
+
+
+def test_edit_and_batch_delete_rehydrate_archived_rows(client, history):
+    user_id, headers, created = history
+    _archive(user_id)
+    archived = [row for row in created if row["date"] < str(HORIZON)]
+
+    edited = archived[0]
+    response = client.put(
+        f"/api/transactions/{edited['id']}", json={"amount": 999}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["amount"] == 999
+    assert edited["id"] in _hot_ids(user_id)
+
+    response = client.post(
+        "/api/transactions/batch/delete", json={"filter": {"end_date": "2019-12-31"}},
+        headers=headers,
+    )
+    deleted = {row["id"] for row in created if row["date"] <= "2019-12-31"}
+    assert response.json()["affected"] == len(deleted)
+    assert sorted(entry.year for entry in _segments(user_id)) == [2020, 2021]
+
+    response_cache.clear()
+    listed = client.get("/api/transactions/", headers=headers).json()
+    assert {row["id"] for row in listed} == {row["id"] for row in created} - deleted
+    summary = client.get("/api/transactions/summary", headers=headers).json()
+    with _session(user_id) as session:
+        crud.rebuild_rollups(session, user_id)
+    assert client.get("/api/transactions/summary", headers=headers).json() == summary
+
+
+def test_collect_garbage_keeps_referenced_segments(client, history):
+    user_id, headers, created = history
+    _archive(user_id)
+    # Rewrites the 2020 segment, leaving the previous generation unreferenced
+    row_2020 = next(row for row in created if row["date"].startswith("2020"))
+    client.delete(f"/api/transactions/{row_2020['id']}", headers=headers)
+    referenced = {archive.segment_path(entry) for entry in _segments(user_id)}
+    directory = next(iter(referenced)).parent
+    stray = directory / "orphan.seg"
+    stray.write_bytes(b"")
+    superseded = set(directory.iterdir()) - referenced - {stray}
+    assert superseded
+
+    sessions = [Session(shard_engine) for shard_engine in shard_engines]
+    try:
+        removed = archive.collect_garbage(sessions, grace_seconds=0)
+    finally:
+        for session in sessions:
+            session.close()
+    assert removed >= len(superseded) + 1
+    assert set(directory.iterdir()) == referenced
+
+    response_cache.clear()
+    listed = client.get("/api/transactions/", headers=headers).json()
+    assert {row["id"] for row in listed} == {row["id"] for row in created} - {row_2020["id"]}
+
+
+def test_lookups_by_id_only_open_segments_that_can_hold_it(client, history, monkeypatch):
+    user_id, headers, created = history
+    _archive(user_id)
+    for entry in _segments(user_id):
+        ids = [row["id"] for row in created if row["date"].startswith(str(entry.year))]
+        assert (entry.min_id, entry.max_id) == (min(ids), max(ids))
+    opened = []
+    open_segment = archive.open_segment
+
+    def counting_open(entry):
+        opened.append(entry.year)
+        return open_segment(entry)
+
+    monkeypatch.setattr(archive, "open_segment", counting_open)
+    for missing in (10**9, created[-1]["id"] + 1):
+        response = client.put(f"/api/transactions/{missing}", json={"amount": 1}, headers=headers)
+        assert response.status_code == 404
+    assert opened == []
+
+    row_2020 = next(row for row in created if row["date"].startswith("2020"))
+    response = client.put(
+        f"/api/transactions/{row_2020['id']}", json={"amount": 1}, headers=headers
+    )
+    assert response.status_code == 200
+    assert opened == [2020]
+
+
+def test_the_newest_row_is_archived_too(client, user):
+    user_id, headers = user
+    created = [add_transaction(client, headers, date(2020, 1, day)) for day in (1, 2, 3)]
+    assert _archive(user_id) == 3
+    assert _hot_ids(user_id) == set()
+
+    added = add_transaction(client, headers, date(2020, 1, 4))
+    assert added["id"] > max(row["id"] for row in created)
+    response_cache.clear()
+    listed = client.get("/api/transactions/", headers=headers).json()
+    assert [row["id"] for row in listed] == [added["id"], *[row["id"] for row in created[::-1]]]
+
+
+def test_segments_pack_timestamps_and_read_version_1(tmp_path, monkeypatch):
+    rows = 50
+    created = 1_700_000_000_000_000 + np.arange(rows, dtype=np.int64) * 7
+    columns = {
+        "id": np.arange(rows, dtype=np.int64),
+        "date": np.full(rows, 19_000, dtype=np.int32),
+        "amount": np.linspace(1, 50, rows),
+        "type": np.zeros(rows, dtype=np.uint8),
+        "category": np.array(["Rent"] * rows, dtype=object),
+        "description": np.array([f"Item {number % 3}" for number in range(rows)], dtype=object),
+        "created_at": created,
+        "updated_at": created + (np.arange(rows) % 10 == 0) * 1_000_000,
+        "change_seq": np.arange(rows, dtype=np.int64),
+    }
+    size = archive.write_segment(tmp_path / "packed.seg", columns)
+    segment = archive.Segment(tmp_path / "packed.seg")
+    assert "created_at" not in segment.columns and "updated_at" not in segment.columns
+    decoded = segment.decode()
+    order = np.argsort(decoded["id"])
+    for name in ("created_at", "updated_at", "amount", "description"):
+        assert (decoded[name][order] == columns[name]).all(), name
+
+    # Version 1 mapped every column; such files are still read
+    unpacked = tmp_path / "unpacked.seg"
+    monkeypatch.setattr(archive, "_PACKED_COLUMNS", ())
+    archive.write_segment(unpacked, columns)
+    monkeypatch.undo()
+    raw = bytearray(unpacked.read_bytes())
+    raw[:8] = b"SSSEG001"
+    unpacked.write_bytes(bytes(raw))
+    assert len(raw) > size + rows * 8
+    old = archive.Segment(unpacked).decode()
+    for name in columns:
+        assert (old[name] == decoded[name]).all(), name
+
+
+def test_segments_keep_missing_categories_as_null(tmp_path):
+    columns = {
+        "id": np.arange(3, dtype=np.int64),
+        "date": np.full(3, 19_000, dtype=np.int32),
+        "amount": np.ones(3),
+        "type": np.zeros(3, dtype=np.uint8),
+        "category": np.array(["Rent", None, "None"], dtype=object),
+        "description": np.array(["a", "b", "c"], dtype=object),
+        "created_at": np.zeros(3, dtype=np.int64),
+        "updated_at": np.zeros(3, dtype=np.int64),
+        "change_seq": np.zeros(3, dtype=np.int64),
+    }
+    archive.write_segment(tmp_path / "nulls.seg", columns)
+    decoded = archive.Segment(tmp_path / "nulls.seg").decode()
+    order = np.argsort(decoded["id"])
+    assert decoded["category"][order].tolist() == ["Rent", None, "None"]
@@ -0,0 +1,95 @@
+import pytest
+from sqlmodel import Session
+
+from app import auth
+from app.auth import PrincipalCache, principal_cache
+from app.database import engine
+from app.models import User, UserPrincipal
+
+
+class _Clock:
+    def __init__(self, now: float = 1_000_000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(auth.time, "time", clock)
+    return clock
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = PrincipalCache(max_size=10, ttl_seconds=60)
+    cache.put("token", UserPrincipal(id=1, email="a@example.com"), None)
+    clock.now += 59
+    assert cache.get("token").id == 1
+    clock.now += 1
+    assert cache.get("token") is None
+
+
+def test_entries_expire_with_their_token(clock):
+    cache = PrincipalCache(max_size=10, ttl_seconds=60)
+    cache.put("token", UserPrincipal(id=1, email="a@example.com"), clock.now + 5)
+    clock.now += 5
+    assert cache.get("token") is None
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = PrincipalCache(max_size=2, ttl_seconds=60)
+    for user_id in (1, 2):
+        cache.put(f"token{user_id}", UserPrincipal(id=user_id, email="a@example.com"), None)
+    cache.get("token1")
+    cache.put("token3", UserPrincipal(id=3, email="a@example.com"), None)
+    assert cache.get("token2") is None
+    assert cache.get("token1").id == 1 and cache.get("token3").id == 3
+
+
+def test_invalidating_a_user_drops_all_of_their_tokens(clock):
+    cache = PrincipalCache(max_size=10, ttl_seconds=60)
+    for token, user_id in (("a", 1), ("b", 1), ("c", 2)):
+        cache.put(token, UserPrincipal(id=user_id, email="a@example.com"), None)
+    cache.invalidate_user(1)
+    assert cache.get("a") is None and cache.get("b") is None
+    assert cache.get("c").id == 2
+
+
+def test_cached_tokens_skip_the_user_lookup(client, user, monkeypatch):
+    _user_id, headers = user
+    lookups, lookup = [], auth.get_user_by_id
+
+    def counting_lookup(session, user_id):
+        lookups.append(user_id)
+        return lookup(session, user_id)
+
+    principal_cache.clear()
+    monkeypatch.setattr(auth, "get_user_by_id", counting_lookup)
+    for _ in range(3):
+        assert client.get("/api/goals/", headers=headers).status_code == 200
+    assert len(lookups) == 1
+
+
+def test_updating_the_user_revokes_cached_tokens(client, user):
+    user_id, headers = user
+    assert client.get("/api/goals/", headers=headers).status_code == 200
+    token = headers["Authorization"].split()[1]
+    assert principal_cache.get(token) is not None
+
+    with Session(engine) as session:
+        row = session.get(User, user_id)
+        row.full_name = "Renamed"
+        session.add(row)
+        session.commit()
+    assert principal_cache.get(token) is None
+    assert client.get("/api/goals/", headers=headers).status_code == 200
+    assert principal_cache.get(token) is not None
+
+
+@pytest.mark.parametrize("token", ["not-a-jwt", auth.create_access_token({"sub": "x"})])
+def test_bad_tokens_are_rejected(client, token):
+    response = client.get("/api/goals/", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Bearer"
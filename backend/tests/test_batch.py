@@ -0,0 +1,41 @@
+from datetime import date
+
+import pytest
+
+from .conftest import add_transaction
+
+
+@pytest.mark.parametrize("filter_", [{}, {"category": None, "start_date": None}])
+def test_batch_delete_rejects_an_empty_filter(client, user, filter_):
+    _user_id, headers = user
+    for day in range(1, 4):
+        add_transaction(client, headers, date(2024, 3, day))
+
+    response = client.post(
+        "/api/transactions/batch/delete", json={"filter": filter_}, headers=headers
+    )
+    assert response.status_code == 422, response.text
+    response = client.patch(
+        "/api/transactions/batch", json={"filter": filter_, "patch": {"amount": 1}},
+        headers=headers,
+    )
+    assert response.status_code == 422, response.text
+    response = client.post("/api/goals/batch/delete", json={"filter": filter_}, headers=headers)
+    assert response.status_code == 422, response.text
+    assert len(client.get("/api/transactions/", headers=headers).json()) == 3
+
+
+def test_batch_patch_rows_match_the_read_contract(client, user):
+    _user_id, headers = user
+    created = add_transaction(client, headers, date(2024, 3, 1), amount=5)
+
+    response = client.patch(
+        "/api/transactions/batch",
+        json={"ids": [created["id"]], "patch": {"amount": 11}, "return_rows": True},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    [row] = response.json()["items"]
+    assert row == client.get("/api/transactions/", headers=headers).json()[0]
+    assert row["amount"] == 11.0 and isinstance(row["amount"], float)
+    assert row["category"] == "Food & Dining" and row["date"] == "2024-03-01"
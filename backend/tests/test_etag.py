@@ -0,0 +1,79 @@
+from datetime import date
+
+import pytest
+
+from app.etag import etag_matches
+
+from .conftest import add_transaction
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, False),
+        ('W/"t-1-2-ab"', True),
+        ('"t-1-2-ab"', True),
+        ('W/"t-1-1-ab", W/"t-1-2-ab"', True),
+        ('W/"t-1-3-ab"', False),
+        ("*", True),
+    ],
+)
+def test_weak_comparison(header, expected):
+    assert etag_matches(header, 'W/"t-1-2-ab"') is expected
+
+
+def _get(client, headers, path, etag=None, **params):
+    extra = {"If-None-Match": etag} if etag else {}
+    return client.get(path, params=params, headers={**headers, **extra})
+
+
+@pytest.mark.parametrize("path", ["/api/transactions/", "/api/goals/"])
+def test_unchanged_lists_answer_304(client, user, path):
+    _user_id, headers = user
+    add_transaction(client, headers, date(2024, 1, 1))
+    first = _get(client, headers, path)
+    tag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    again = _get(client, headers, path, tag)
+    assert again.status_code == 304
+    assert again.headers["ETag"] == tag and not again.content
+
+
+def test_writes_change_the_etag(client, user):
+    _user_id, headers = user
+    created = add_transaction(client, headers, date(2024, 1, 1))
+    tag = _get(client, headers, "/api/transactions/").headers["ETag"]
+
+    client.put(f"/api/transactions/{created['id']}", json={"amount": 3}, headers=headers)
+    response = _get(client, headers, "/api/transactions/", tag)
+    assert response.status_code == 200
+    assert response.json()[0]["amount"] == 3.0
+    assert response.headers["ETag"] != tag
+
+
+def test_the_etag_depends_on_the_query_and_the_user(client, user):
+    _user_id, headers = user
+    add_transaction(client, headers, date(2024, 1, 1))
+    tag = _get(client, headers, "/api/transactions/").headers["ETag"]
+    assert _get(client, headers, "/api/transactions/", tag, limit=1).status_code == 200
+
+    other = client.post(
+        "/api/auth/register", json={"email": "etag-other@example.com", "password": "secret1"}
+    )
+    assert other.status_code == 201
+    token = client.post(
+        "/api/auth/login", data={"username": "etag-other@example.com", "password": "secret1"}
+    ).json()["access_token"]
+    other_headers = {"Authorization": f"Bearer {token}"}
+    assert _get(client, other_headers, "/api/transactions/", tag).status_code == 200
+
+
+def test_goal_writes_leave_the_transaction_etag(client, user):
+    _user_id, headers = user
+    tag = _get(client, headers, "/api/transactions/").headers["ETag"]
+    client.post(
+        "/api/goals/", json={"name": "Bike", "target_amount": 300, "deadline": "2025-01-01"},
+        headers=headers,
+    )
+    assert _get(client, headers, "/api/transactions/", tag).status_code == 304
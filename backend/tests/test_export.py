@@ -0,0 +1,80 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+from datetime import date, timedelta
+
+import pytest
+
+from app import bulk, crud
+from app.sharding import user_placement_sync
+
+from .conftest import add_transaction
+
+
+@pytest.fixture
+def ledger(client, user):
+    user_id, headers = user
+    for number in range(12):
+        add_transaction(
+            client, headers, date(2024, 5, 1) - timedelta(days=number // 2),
+            amount=number + 1, category="Rent" if number % 3 else "Travel",
+            description=f'Item "{number}", with a comma',
+        )
+    return user_id, headers
+
+
+def _expected(client, headers, **params):
+    rows = client.get("/api/transactions/", params=params, headers=headers).json()
+    return [{name: row[name] for name in crud.EXPORT_COLUMNS} for row in rows]
+
+
+def _export(client, headers, **params):
+    response = client.get("/api/transactions/export", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response
+
+
+def test_ndjson_export_matches_the_list(client, ledger):
+    _user_id, headers = ledger
+    response = _export(client, headers, format="ndjson")
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "attachment" in response.headers["content-disposition"]
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == _expected(client, headers)
+
+
+def test_csv_export_matches_the_list(client, ledger):
+    _user_id, headers = ledger
+    records = list(csv.DictReader(io.StringIO(_export(client, headers, format="csv").text)))
+    expected = _expected(client, headers)
+    assert [record["description"] for record in records] == [
+        row["description"] for row in expected
+    ]
+    assert [int(record["id"]) for record in records] == [row["id"] for row in expected]
+
+
+def test_gzip_export_with_filters(client, ledger):
+    _user_id, headers = ledger
+    response = _export(client, headers, format="ndjson", gzip=True, category="Travel")
+    assert response.headers["content-type"] == "application/gzip"
+    assert response.headers["content-disposition"].endswith('.ndjson.gz"')
+    lines = gzip.decompress(response.content).decode().splitlines()
+    assert [json.loads(line) for line in lines] == _expected(client, headers, category="Travel")
+
+
+def test_small_batches_give_the_same_stream(client, ledger):
+    user_id, headers = ledger
+
+    def collect(stream):
+        if hasattr(stream, "__aiter__"):
+            async def drain():
+                return [chunk async for chunk in stream]
+            return asyncio.run(drain())
+        return list(stream)
+
+    shard = user_placement_sync(user_id).shard
+    chunks = collect(bulk.export_transactions(user_id, "ndjson", batch_size=5, shard=shard))
+    assert len([chunk for chunk in chunks if chunk]) > 2
+    assert b"".join(chunks) == _export(client, headers, format="ndjson").content
@@ -0,0 +1,37 @@
+import pytest
+
+
+def _create_goal(client, headers):
+    payload = {
+        "name": "Holiday", "target_amount": 1000, "deadline": "2025-06-01", "category": "Travel",
+    }
+    response = client.post("/api/goals/", json=payload, headers=headers)
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+@pytest.mark.parametrize("field", ["name", "target_amount", "current_amount", "deadline"])
+def test_patches_cannot_null_required_fields(client, user, field):
+    _user_id, headers = user
+    goal = _create_goal(client, headers)
+
+    single = client.put(f"/api/goals/{goal['id']}", json={field: None}, headers=headers)
+    assert single.status_code == 422, single.text
+    batch = client.patch(
+        "/api/goals/batch", json={"ids": [goal["id"]], "patch": {field: None}}, headers=headers
+    )
+    assert batch.status_code == 422, batch.text
+    assert client.get("/api/goals/", headers=headers).json() == [goal]
+
+
+def test_patches_can_clear_the_category(client, user):
+    _user_id, headers = user
+    goal = _create_goal(client, headers)
+
+    response = client.patch(
+        "/api/goals/batch",
+        json={"ids": [goal["id"]], "patch": {"category": None}, "return_rows": True},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["items"][0]["category"] is None
@@ -0,0 +1,73 @@
+import json
+
+import pytest
+
+CSV_UPLOAD = (
+    "description,amount,category,type,date\r\n"
+    "Coffee,3.5,Food & Dining,expense,2024-01-02\r\n"
+    '"Rent, January",900,Rent,expense,2024-01-01\r\n'
+    "Refund,-4,Shopping,income,2024-01-03\r\n"
+    '"Two\nlines",12,Travel,expense,2024-01-04\r\n'
+    "Short,1,Travel\r\n"
+    "Salary,2500,Income,income,2024-01-31\r\n"
+)
+
+
+def _import(client, headers, body, content_type, **params):
+    response = client.post(
+        "/api/transactions/import", content=body, params=params,
+        headers={**headers, "Content-Type": content_type},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_csv_import_inserts_valid_rows_and_reports_the_rest(client, user):
+    _user_id, headers = user
+    result = _import(client, headers, CSV_UPLOAD.encode(), "text/csv")
+
+    assert (result["inserted"], result["failed"]) == (4, 2)
+    assert [error["line"] for error in result["errors"]] == [4, 7]
+    assert result["errors"][0]["error"].startswith("amount:")
+    assert result["errors"][1]["error"] == "Expected 5 fields, got 3"
+    rows = client.get("/api/transactions/", headers=headers).json()
+    assert {row["description"] for row in rows} == {
+        "Coffee", "Rent, January", "Two\nlines", "Salary",
+    }
+
+
+def test_ndjson_import_in_chunks(client, user):
+    _user_id, headers = user
+    records = [
+        {"description": f"Item {number}", "amount": number + 1, "category": "Shopping",
+         "type": "expense", "date": f"2024-02-{number % 28 + 1:02d}"}
+        for number in range(2500)
+    ]
+    lines = [json.dumps(record) for record in records]
+    lines[10] = "[1, 2]"
+    lines[20] = "{not json"
+    body = "\n".join(lines).encode()
+    # Split the body mid-line, the way a streamed upload arrives
+    chunks = (body[start:start + 777] for start in range(0, len(body), 777))
+    result = _import(client, headers, chunks, "application/x-ndjson")
+
+    assert (result["inserted"], result["failed"]) == (2498, 2)
+    assert [error["line"] for error in result["errors"]] == [11, 21]
+    assert result["errors"][0]["error"] == "Expected a JSON object"
+    assert len(client.get("/api/transactions/", headers=headers).json()) == 2498
+
+
+def test_format_query_overrides_the_content_type(client, user):
+    _user_id, headers = user
+    result = _import(client, headers, CSV_UPLOAD.encode(), "text/plain", format="csv")
+    assert result["inserted"] == 4
+
+
+@pytest.mark.parametrize("content_type", ["text/plain", "application/json"])
+def test_unknown_formats_are_refused(client, user, content_type):
+    _user_id, headers = user
+    response = client.post(
+        "/api/transactions/import", content=b"{}",
+        headers={**headers, "Content-Type": content_type},
+    )
+    assert response.status_code == 415
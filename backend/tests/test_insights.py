@@ -0,0 +1,166 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+from sqlmodel import Session
+
+from app import analytics, archive, crud
+from app.analytics import insights_cache
+from app.database import shard_engines
+from app.sharding import user_placement_sync
+
+from .conftest import add_transaction
+
+AS_OF = date(2024, 6, 15)
+
+
+def _insights(client, headers, as_of=AS_OF):
+    response = client.get("/api/insights/", params={"as_of": str(as_of)}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.fixture
+def spender(client, user):
+    """Monthly rent, a weekly gym charge, daily groceries and one huge grocery bill."""
+    _user_id, headers = user
+    for month in range(1, 7):
+        add_transaction(
+            client, headers, date(2024, month, 1), amount=1000, category="Rent",
+            description="Landlord Ltd",
+        )
+    for week in range(12):
+        add_transaction(
+            client, headers, AS_OF - timedelta(days=7 * week + 2), amount=20,
+            category="Health", description=f"Gym #{week}",
+        )
+    for day in range(40):
+        add_transaction(
+            client, headers, AS_OF - timedelta(days=day), amount=10 + day % 3,
+            category="Groceries", description=f"Market {day}",
+        )
+    add_transaction(
+        client, headers, date(2024, 5, 20), amount=500, category="Salary", type="income",
+        description="Employer",
+    )
+    huge = add_transaction(
+        client, headers, AS_OF - timedelta(days=1), amount=900, category="Groceries",
+        description="Catering",
+    )
+    return headers, huge
+
+
+def test_rolling_spend_and_category_changes(client, spender):
+    headers, _huge = spender
+    insights = _insights(client, headers)
+    rows = client.get(
+        "/api/transactions/", params={"end_date": str(AS_OF)}, headers=headers
+    ).json()
+    expenses = [row for row in rows if row["type"] == "expense"]
+
+    for window in insights["rolling_spend"]:
+        days = window["days"]
+        start = AS_OF - timedelta(days=days - 1)
+        before = start - timedelta(days=days)
+        assert window["total"] == round(
+            sum(row["amount"] for row in expenses if row["date"] >= str(start)), 2
+        )
+        assert window["previous_total"] == round(sum(
+            row["amount"] for row in expenses if str(before) <= row["date"] < str(start)
+        ), 2)
+
+    changes = {change["category"]: change for change in insights["category_changes"]}
+    for category, change in changes.items():
+        current = sum(
+            row["amount"] for row in expenses
+            if row["category"] == category and row["date"] >= "2024-06-01"
+        )
+        previous = sum(
+            row["amount"] for row in expenses
+            if row["category"] == category and "2024-05-01" <= row["date"] < "2024-06-01"
+        )
+        assert (change["current"], change["previous"]) == (round(current, 2), round(previous, 2))
+    assert "Salary" not in changes
+    assert [abs(change["change"]) for change in insights["category_changes"]] == sorted(
+        (abs(change["change"]) for change in insights["category_changes"]), reverse=True
+    )
+
+
+def test_recurring_merchants_and_anomalies(client, spender):
+    headers, huge = spender
+    insights = _insights(client, headers)
+
+    merchants = {merchant["merchant"]: merchant for merchant in insights["recurring_merchants"]}
+    assert merchants["landlord ltd"]["category"] == "Rent"
+    assert merchants["landlord ltd"]["occurrences"] == 6
+    assert merchants["gym"]["cadence_days"] == 7.0
+    assert merchants["gym"]["next_expected_date"] == str(AS_OF + timedelta(days=5))
+    assert not any(name.startswith("market") for name in merchants)
+
+    [anomaly] = insights["anomalies"]
+    assert anomaly["transaction_id"] == huge["id"]
+    assert anomaly["category"] == "Groceries" and anomaly["amount"] == 900.0
+
+
+def test_writes_invalidate_cached_insights(client, spender):
+    headers, huge = spender
+    insights_cache.clear()
+    assert _insights(client, headers)["anomalies"]
+
+    client.delete(f"/api/transactions/{huge['id']}", headers=headers)
+    assert _insights(client, headers)["anomalies"] == []
+
+
+def test_precompute_only_recomputes_users_whose_data_changed(client, user, spender):
+    user_id, _headers = user
+    headers, huge = spender
+    shard = user_placement_sync(user_id).shard
+
+    def stored_for():
+        with Session(shard_engines[shard]) as session:
+            return crud.get_user_insights(session, user_id).as_of
+
+    analytics.precompute_insights(AS_OF, 0, 100, False, shard)
+    assert stored_for() == AS_OF
+    next_day = AS_OF + timedelta(days=1)
+    analytics.precompute_insights(next_day, 0, 100, False, shard)
+    assert stored_for() == AS_OF
+
+    # The stored result is for another day, so the read computes that day's figures
+    insights_cache.clear()
+    lazily = _insights(client, headers, next_day)
+    assert lazily["as_of"] == str(next_day)
+    with Session(shard_engines[shard]) as session:
+        data = analytics.load_transactions(session, user_id)
+    expected = analytics.compute_insights(data, next_day).model_dump(mode="json")
+    assert lazily == expected
+
+    client.delete(f"/api/transactions/{huge['id']}", headers=headers)
+    analytics.precompute_insights(next_day, 0, 100, False, shard)
+    assert stored_for() == next_day
+
+
+def test_a_user_without_transactions(client, user):
+    _user_id, headers = user
+    insights = _insights(client, headers)
+    assert [window["total"] for window in insights["rolling_spend"]] == [0.0, 0.0]
+    assert insights["category_changes"] == insights["recurring_merchants"] == []
+    assert insights["anomalies"] == []
+
+
+def test_archived_rows_without_a_category_are_uncategorized(client, user, monkeypatch):
+    user_id, headers = user
+    add_transaction(client, headers, date(2024, 1, 5), category="Rent")
+    archived = {
+        "id": np.array([1, 2], dtype=np.int64),
+        "date": np.array([19_000, 19_001], dtype=np.int32),
+        "amount": np.array([5.0, 6.0]),
+        "type": np.full(2, archive.EXPENSE_CODE, dtype=np.uint8),
+        "category": np.array([None, "Travel"], dtype=object),
+        "description": np.array(["Old", "Older"], dtype=object),
+    }
+    monkeypatch.setattr(crud, "archived_segments", lambda session, user_id: ["segment"])
+    monkeypatch.setattr(archive, "analytics_columns", lambda entries: archived)
+    with Session(shard_engines[user_placement_sync(user_id).shard]) as session:
+        data = analytics.load_transactions(session, user_id)
+    assert sorted(data.categories.tolist()) == ["Rent", "Travel", analytics.UNCATEGORIZED]
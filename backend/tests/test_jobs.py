@@ -0,0 +1,118 @@
+import asyncio
+from datetime import date
+
+from app import jobs
+from app.jobs import WorkQueue
+
+from .conftest import add_transaction
+
+
+def _queue(**options) -> WorkQueue:
+    settings = dict(
+        workers=1, max_size=10, coalesce_seconds=0.05, submit_timeout_seconds=0.01,
+        drain_timeout_seconds=1,
+    )
+    return WorkQueue(**{**settings, **options})
+
+
+def _recorder(runs: list, delay: float = 0):
+    async def job(user_id, shard):
+        runs.append((user_id, shard))
+        await asyncio.sleep(delay)
+    return job
+
+
+def test_a_burst_of_writes_runs_once():
+    async def scenario():
+        runs = []
+        queue = _queue()
+        queue.start()
+        results = [await queue.enqueue("job", _recorder(runs), 7, 1) for _ in range(5)]
+        await queue.enqueue("job", _recorder(runs), 8)
+        await asyncio.sleep(0.2)
+        await queue.stop()
+        return results, runs
+
+    results, runs = asyncio.run(scenario())
+    assert results == [True] * 5
+    assert runs == [(7, 1), (8, 0)]
+
+
+def test_writes_after_a_job_started_queue_another_run():
+    async def scenario():
+        runs = []
+        queue = _queue(coalesce_seconds=0)
+        queue.start()
+        await queue.enqueue("job", _recorder(runs, delay=0.05), 7)
+        await asyncio.sleep(0.02)
+        await queue.enqueue("job", _recorder(runs), 7)
+        await asyncio.sleep(0.2)
+        await queue.stop()
+        return runs
+
+    assert asyncio.run(scenario()) == [(7, 0), (7, 0)]
+
+
+def test_a_full_queue_drops_jobs():
+    async def scenario():
+        runs = []
+        queue = _queue(max_size=1, coalesce_seconds=10)
+        queue.start()
+        # The worker takes the first job and waits out its delay; one more fits
+        accepted = [await queue.enqueue("job", _recorder(runs), user_id) for user_id in range(3)]
+        await queue.stop()
+        return accepted, runs
+
+    accepted, runs = asyncio.run(scenario())
+    assert accepted == [True, True, False]
+    assert runs == [(0, 0), (1, 0)]
+
+
+def test_stopping_runs_waiting_jobs_without_their_delay():
+    async def scenario():
+        runs = []
+        queue = _queue(coalesce_seconds=60)
+        queue.start()
+        await queue.enqueue("job", _recorder(runs), 1)
+        await asyncio.wait_for(queue.stop(), 1)
+        return runs, await queue.enqueue("job", _recorder(runs), 2)
+
+    runs, accepted = asyncio.run(scenario())
+    assert runs == [(1, 0)] and accepted is False
+
+
+def test_a_failing_job_leaves_the_worker_running():
+    async def scenario():
+        runs = []
+
+        async def broken(user_id, shard):
+            raise RuntimeError("boom")
+
+        queue = _queue(coalesce_seconds=0)
+        queue.start()
+        await queue.enqueue("broken", broken, 1)
+        await queue.enqueue("job", _recorder(runs), 2)
+        await asyncio.sleep(0.1)
+        await queue.stop()
+        return runs
+
+    assert asyncio.run(scenario()) == [(2, 0)]
+
+
+def test_transaction_writes_queue_an_insights_refresh(client, user, monkeypatch):
+    user_id, headers = user
+    queued = []
+
+    async def enqueue(name, job, user_id, shard=0):
+        queued.append((name, user_id))
+        return True
+
+    monkeypatch.setattr(jobs.work_queue, "enqueue", enqueue)
+    client.get("/api/transactions/", headers=headers)
+    client.post(
+        "/api/goals/", json={"name": "Bike", "target_amount": 300, "deadline": "2025-01-01"},
+        headers=headers,
+    )
+    assert queued == []
+    add_transaction(client, headers, date(2024, 1, 1))
+    assert queued == [(jobs.REFRESH_INSIGHTS, user_id)]
@@ -0,0 +1,69 @@
+import re
+from datetime import date
+
+import pytest
+
+from app import metrics
+from app.metrics import Counter, Histogram, Registry
+
+from .conftest import add_transaction
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("h", "Latency.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.labels("/a").observe(value)
+    assert histogram.render() == [
+        "# HELP h Latency.",
+        "# TYPE h histogram",
+        'h_bucket{route="/a",le="0.1"} 2',
+        'h_bucket{route="/a",le="1.0"} 3',
+        'h_bucket{route="/a",le="+Inf"} 4',
+        'h_sum{route="/a"} 3.65',
+        'h_count{route="/a"} 4',
+    ]
+
+
+def test_label_values_are_escaped():
+    counter = Counter("c", "Things.", ("name",))
+    counter.labels('a"b\\c\nd').inc(2)
+    assert counter.render()[-1] == 'c{name="a\\"b\\\\c\\nd"} 2.0'
+
+
+def test_names_register_once():
+    registry = Registry()
+    registry.register(Counter("c", "Things."))
+    with pytest.raises(ValueError):
+        registry.register(Counter("c", "Other things."))
+
+
+@pytest.mark.parametrize(
+    "statement, operation",
+    [("select 1", "SELECT"), ("  INSERT INTO t VALUES (1)", "INSERT"), ("VACUUM", "OTHER")],
+)
+def test_statements_are_grouped_by_kind(statement, operation):
+    assert metrics._operation(statement) == operation
+
+
+def _sample(text: str, name: str, **labels) -> float:
+    label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf"^{re.escape(name)}\{{{re.escape(label_text)}\}} (\S+)$", text, re.M)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_requests_are_recorded_by_route_template(client, user):
+    _user_id, headers = user
+    created = add_transaction(client, headers, date(2024, 1, 1))
+    route = {"method": "PUT", "route": "/api/transactions/{transaction_id}"}
+    before = client.get("/metrics").text
+
+    client.put(f"/api/transactions/{created['id']}", json={"amount": 2}, headers=headers)
+    after = client.get("/metrics")
+    assert after.headers["content-type"] == metrics.CONTENT_TYPE
+    name = "spendshift_http_request_duration_seconds_count"
+    assert _sample(after.text, name, **route, status="200") == (
+        _sample(before, name, **route, status="200") + 1
+    )
+    queries = "spendshift_http_request_db_queries_sum"
+    assert _sample(after.text, queries, **route) > _sample(before, queries, **route)
+    assert f"/api/transactions/{created['id']}" not in after.text
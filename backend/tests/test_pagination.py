@@ -0,0 +1,70 @@
+from datetime import date, timedelta
+
+import pytest
+
+from .conftest import add_transaction
+
+
+def _pages(client, headers, limit, **params):
+    rows, cursor = [], None
+    while True:
+        response = client.get(
+            "/api/transactions/",
+            params={"limit": limit, **params, **({"cursor": cursor} if cursor else {})},
+            headers=headers,
+        )
+        assert response.status_code == 200, response.text
+        page = response.json()
+        assert len(page) <= limit
+        rows.extend(page)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return rows
+
+
+@pytest.fixture
+def ledger(client, user):
+    """A user with several transactions per day, so pages split ties on date."""
+    _user_id, headers = user
+    for number in range(17):
+        add_transaction(
+            client, headers, date(2024, 1, 1) + timedelta(days=number // 3),
+            amount=5 + number, category="Travel" if number % 2 else "Rent",
+        )
+    return headers
+
+
+@pytest.mark.parametrize("limit", [1, 3, 5, 100])
+def test_keyset_pages_cover_the_list_once(client, ledger, limit):
+    everything = client.get("/api/transactions/", headers=ledger).json()
+    assert [(row["date"], row["id"]) for row in everything] == sorted(
+        ((row["date"], row["id"]) for row in everything), reverse=True
+    )
+    assert _pages(client, ledger, limit) == everything
+
+
+def test_keyset_pages_apply_the_filters(client, ledger):
+    params = {"category": "Travel", "min_amount": 8, "end_date": "2024-01-05"}
+    expected = client.get("/api/transactions/", params=params, headers=ledger).json()
+    assert expected and all(
+        row["category"] == "Travel" and row["amount"] >= 8 and row["date"] <= "2024-01-05"
+        for row in expected
+    )
+    assert _pages(client, ledger, 2, **params) == expected
+
+
+@pytest.mark.parametrize(
+    "params", [{"limit": 2, "cursor": "not-a-cursor"}, {"limit": 2, "cursor": "Zm9v"}]
+)
+def test_bad_cursors_are_rejected(client, ledger, params):
+    response = client.get("/api/transactions/", params=params, headers=ledger)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_cursor_requires_a_limit(client, ledger):
+    cursor = client.get(
+        "/api/transactions/", params={"limit": 2}, headers=ledger
+    ).headers["X-Next-Cursor"]
+    response = client.get("/api/transactions/", params={"cursor": cursor}, headers=ledger)
+    assert response.status_code == 400
@@ -0,0 +1,60 @@
+import threading
+
+from sqlmodel import Session
+
+from app import auth
+from app.database import engine
+from app.models import User
+
+
+def _stored_hash(user_id: int) -> str:
+    with Session(engine) as session:
+        return session.get(User, user_id).hashed_password
+
+
+def _login(client, email, password="secret1"):
+    return client.post("/api/auth/login", data={"username": email, "password": password})
+
+
+def test_hashes_round_trip():
+    hashed = auth.get_password_hash("secret1")
+    assert hashed.startswith(f"{auth.PBKDF2_ITERATIONS}$")
+    assert auth.verify_password("secret1", hashed)
+    assert not auth.verify_password("secret2", hashed)
+    assert not auth.verify_password("secret1", "not$a-hash")
+    assert not auth.needs_rehash(hashed)
+
+
+def test_outdated_hashes_are_upgraded_on_login(client, user, monkeypatch):
+    user_id, _headers = user
+    monkeypatch.setattr(auth, "PBKDF2_ITERATIONS", 1000)
+    old_hash = auth.get_password_hash("secret1")
+    monkeypatch.undo()
+    with Session(engine) as session:
+        row = session.get(User, user_id)
+        row.hashed_password = old_hash
+        email = row.email
+        session.add(row)
+        session.commit()
+
+    assert _login(client, email, "wrong").status_code == 401
+    assert _stored_hash(user_id) == old_hash
+    assert _login(client, email).status_code == 200
+    new_hash = _stored_hash(user_id)
+    assert new_hash.startswith(f"{auth.PBKDF2_ITERATIONS}$")
+    assert auth.verify_password("secret1", new_hash)
+
+
+def test_a_full_pool_sheds_with_503(client, user, monkeypatch):
+    user_id, _headers = user
+    with Session(engine) as session:
+        email = session.get(User, user_id).email
+    monkeypatch.setattr(auth, "_kdf_slots", threading.BoundedSemaphore(1))
+    auth._kdf_slots.acquire()
+
+    response = _login(client, email)
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+    auth._kdf_slots.release()
+    assert _login(client, email).status_code == 200
@@ -0,0 +1,93 @@
+import pytest
+
+from app import auth
+from app.ratelimit import AuthRateLimiter, MemoryBackend, SlidingWindowLimiter, SQLiteBackend
+from app.routes import auth as auth_routes
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend(max_keys=100)
+    return SQLiteBackend(str(tmp_path / "ratelimit.db"), sweep_seconds=60)
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 6000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_limits_apply_per_key(backend):
+    clock = _Clock()
+    limiter = SlidingWindowLimiter(backend, limit=3, window_seconds=60, clock=clock)
+    assert [limiter.hit("a") for _ in range(3)] == [None] * 3
+    assert limiter.hit("a") == 60.0
+    assert limiter.hit("b") is None
+
+
+def test_the_previous_window_is_weighted_by_its_overlap(backend):
+    clock = _Clock()
+    limiter = SlidingWindowLimiter(backend, limit=4, window_seconds=60, clock=clock)
+    for _ in range(4):
+        limiter.hit("a")
+    # Half of the previous window still overlaps: 4 * 0.5 + 3 hits = 5 > 4
+    clock.now += 90
+    assert [limiter.hit("a") for _ in range(3)] == [None, None, 30.0]
+    # Two windows later the old counts no longer matter
+    clock.now += 120
+    assert limiter.hit("a") is None
+
+
+def test_memory_backend_stays_within_max_keys():
+    backend = MemoryBackend(max_keys=3)
+    for number in range(10):
+        backend.hit(f"key{number}", 100)
+    assert len(backend) == 3
+    backend.hit("key0", 103)
+    assert len(backend) == 1
+
+
+def _login(client, email):
+    return client.post("/api/auth/login", data={"username": email, "password": "wrong"})
+
+
+def test_login_is_refused_with_429_before_hashing(client, backend, monkeypatch):
+    limiter = AuthRateLimiter(backend, per_ip=100, per_email=2, window_seconds=60)
+    monkeypatch.setattr(auth_routes, "auth_limiter", limiter)
+    derivations = []
+    run_password_kdf = auth.run_password_kdf
+
+    async def counting_kdf(func, *args):
+        derivations.append(func)
+        return await run_password_kdf(func, *args)
+
+    monkeypatch.setattr(auth, "run_password_kdf", counting_kdf)
+    client.post(
+        "/api/auth/register", json={"email": "limited@example.com", "password": "secret1"}
+    )
+    derivations.clear()
+
+    # The email key is normalized, so both spellings share one budget
+    assert _login(client, " Limited@example.com").status_code == 401
+    assert _login(client, "limited@example.com").status_code == 401
+    refused = _login(client, "limited@example.com")
+    assert refused.status_code == 429
+    assert 1 <= int(refused.headers["Retry-After"]) <= 60
+    assert len(derivations) == 1
+    assert _login(client, "someone-else@example.com").status_code == 401
+
+
+def test_register_is_limited_per_ip(client, backend, monkeypatch):
+    limiter = AuthRateLimiter(backend, per_ip=2, per_email=100, window_seconds=60)
+    monkeypatch.setattr(auth_routes, "auth_limiter", limiter)
+    emails = [f"burst{number}-{type(backend).__name__}@example.com" for number in range(3)]
+    statuses = [
+        client.post(
+            "/api/auth/register", json={"email": email, "password": "secret1"}
+        ).status_code
+        for email in emails
+    ]
+    assert statuses == [201, 201, 429]
@@ -0,0 +1,68 @@
+from datetime import date, timedelta
+from itertools import islice
+
+import pytest
+
+from app import recurring
+from app.models import RecurrenceFrequency, RecurringRule
+
+RULES = [
+    dict(frequency=RecurrenceFrequency.DAILY, interval=3, start_date=date(2023, 12, 30)),
+    dict(frequency=RecurrenceFrequency.WEEKLY, interval=2, start_date=date(2024, 1, 3), count=9),
+    dict(frequency=RecurrenceFrequency.MONTHLY, interval=1, start_date=date(2024, 1, 31)),
+    dict(
+        frequency=RecurrenceFrequency.MONTHLY, interval=5, start_date=date(2023, 8, 30),
+        until=date(2026, 2, 1),
+    ),
+    dict(frequency=RecurrenceFrequency.YEARLY, interval=1, start_date=date(2020, 2, 29)),
+]
+WINDOWS = [
+    (None, date(2025, 6, 30)),
+    (date(2024, 2, 28), date(2024, 3, 31)),
+    (date(2024, 3, 1), date(2024, 2, 29)),
+    (date(2027, 1, 1), date(2028, 12, 31)),
+    (date(2019, 1, 1), date(2023, 12, 31)),
+]
+
+
+def _rule(**fields) -> RecurringRule:
+    return RecurringRule(
+        id=1, user_id=1, description="Rent", amount=10, category="Rent", type="expense", **fields
+    )
+
+
+def _enumerate(rule, start, end, skipped):
+    """Every occurrence, stepping forward from the first one."""
+    found, index = [], 0
+    while (day := recurring.occurrence_date(rule, index)) is not None and day <= end:
+        if (start is None or day >= start) and day not in skipped:
+            found.append((index, day))
+        index += 1
+    return found
+
+
+@pytest.mark.parametrize("fields", RULES)
+@pytest.mark.parametrize("start, end", WINDOWS)
+def test_expansion_matches_stepping_through_every_occurrence(fields, start, end):
+    rule = _rule(**fields)
+    every = _enumerate(rule, None, date(2030, 1, 1), ())
+    skipped = {day for _index, day in every[1::4]} | {date(2024, 2, 1)}
+    expected = _enumerate(rule, start, end, skipped)
+
+    assert recurring.occurrences(rule, start, end, skipped) == expected
+    assert list(recurring.occurrences_newest_first(rule, start, end, skipped)) == expected[::-1]
+    assert recurring.count_occurrences(rule, start, end, skipped) == len(expected)
+
+
+def test_rows_page_newest_first_from_the_window_end():
+    rule = _rule(frequency=RecurrenceFrequency.DAILY, interval=1, start_date=date(1990, 1, 1))
+    end = date(2026, 1, 1)
+    rows = recurring.iter_rows([rule], {}, ("id", "date"), None, end, before=None)
+    page = list(islice(rows, 3))
+    assert [row.date for row in page] == [end - timedelta(days=days) for days in range(3)]
+
+    resumed = recurring.iter_rows([rule], {}, ("id", "date"), None, end, before=(
+        page[-1].date, page[-1].id
+    ))
+    assert next(resumed).date == end - timedelta(days=3)
+    assert recurring.count_occurrences(rule, None, end) == (end - rule.start_date).days + 1
@@ -0,0 +1,93 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from app import crud
+from app.database import shard_engines
+from app.sharding import user_placement_sync
+from app.response_cache import ENTRY_OVERHEAD_BYTES, VARIANTS_PER_USER, ResponseCache
+
+from .conftest import add_transaction
+
+
+def test_entries_are_served_only_at_their_version():
+    cache = ResponseCache(max_bytes=10_000, max_entry_bytes=1_000)
+    cache.put("transactions", 1, 5, "limit=2", b"[1]", {"X-Next-Cursor": "c"})
+    assert cache.get("transactions", 1, 5, "limit=2") == (b"[1]", {"X-Next-Cursor": "c"})
+    assert cache.get("transactions", 1, 6, "limit=2") is None
+    assert cache.get("goals", 1, 5, "limit=2") is None
+
+    cache.put("transactions", 1, 6, "", b"[2]")
+    assert cache.get("transactions", 1, 5, "limit=2") is None
+    # A response computed from an older version never replaces newer ones
+    cache.put("transactions", 1, 5, "limit=2", b"[1]")
+    assert cache.get("transactions", 1, 6, "") == (b"[2]", {})
+    assert cache.get("transactions", 1, 5, "limit=2") is None
+
+
+def test_size_limits():
+    body = b"x" * 100
+    entry_size = len(body) + 1 + ENTRY_OVERHEAD_BYTES
+    cache = ResponseCache(max_bytes=3 * entry_size, max_entry_bytes=entry_size)
+    cache.put("goals", 1, 1, "big", body + b"x")
+    assert cache.get("goals", 1, 1, "big") is None
+
+    for user_id in (1, 2, 3):
+        cache.put("goals", user_id, 1, "a", body)
+    cache.get("goals", 1, 1, "a")
+    cache.put("goals", 4, 1, "a", body)
+    assert cache.size_bytes == 3 * entry_size
+    assert cache.get("goals", 2, 1, "a") is None
+    assert cache.get("goals", 1, 1, "a") is not None
+
+
+def test_variants_per_user_are_bounded():
+    cache = ResponseCache(max_bytes=1_000_000, max_entry_bytes=1_000)
+    for number in range(VARIANTS_PER_USER + 1):
+        cache.put("goals", 1, 1, f"v{number}", b"[]")
+    assert cache.get("goals", 1, 1, "v0") is None
+    assert cache.get("goals", 1, 1, f"v{VARIANTS_PER_USER}") is not None
+
+
+@pytest.fixture
+def cached_list(client, user):
+    """A user whose transaction list has been fetched once, filling the cache."""
+    user_id, headers = user
+    created = add_transaction(client, headers, date(2024, 1, 1), amount=4)
+    assert client.get("/api/transactions/", headers=headers).json()[0]["amount"] == 4.0
+    return user_id, headers, created
+
+
+def test_repeated_lists_skip_the_query(client, cached_list, monkeypatch):
+    _user_id, headers, _created = cached_list
+    expected = client.get("/api/transactions/", headers=headers).json()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the list should have been served from the cache")
+
+    monkeypatch.setattr(crud, "list_transaction_rows", fail)
+    assert client.get("/api/transactions/", headers=headers).json() == expected
+
+
+def test_api_writes_invalidate_the_cache(client, cached_list):
+    _user_id, headers, created = cached_list
+    client.put(f"/api/transactions/{created['id']}", json={"amount": 6}, headers=headers)
+    assert client.get("/api/transactions/", headers=headers).json()[0]["amount"] == 6.0
+
+
+def test_versions_bumped_by_another_process_are_seen(client, cached_list):
+    user_id, headers, created = cached_list
+    # Another worker's write: same database, but this process's cache is untouched
+    with shard_engines[user_placement_sync(user_id).shard].begin() as connection:
+        connection.execute(
+            text("UPDATE \"transaction\" SET amount = 8 WHERE id = :id"), {"id": created["id"]}
+        )
+        connection.execute(
+            text(
+                "UPDATE dataversion SET version = version + 1 "
+                "WHERE user_id = :user AND scope = :scope"
+            ),
+            {"user": user_id, "scope": crud.TRANSACTIONS_SCOPE},
+        )
+    assert client.get("/api/transactions/", headers=headers).json()[0]["amount"] == 8.0
@@ -0,0 +1,80 @@
+from collections import defaultdict
+from datetime import date
+
+from sqlmodel import Session, select
+
+from app.database import shard_engines
+from app.sharding import user_placement_sync
+from app.models import MonthlyRollup, Transaction
+
+from .conftest import add_transaction
+
+
+def _rollup(user_id: int) -> dict:
+    with Session(shard_engines[user_placement_sync(user_id).shard]) as session:
+        rows = session.exec(select(MonthlyRollup).where(MonthlyRollup.user_id == user_id))
+        return {
+            (row.month, row.category_id, row.type): (round(row.total, 6), row.count)
+            for row in rows if row.count
+        }
+
+
+def _recomputed(user_id: int) -> dict:
+    totals = defaultdict(lambda: [0.0, 0])
+    with Session(shard_engines[user_placement_sync(user_id).shard]) as session:
+        for row in session.exec(select(Transaction).where(Transaction.user_id == user_id)):
+            entry = totals[(row.date.replace(day=1), row.category_id, row.type)]
+            entry[0] += row.amount
+            entry[1] += 1
+    return {key: (round(total, 6), count) for key, (total, count) in totals.items()}
+
+
+def test_rollup_follows_every_kind_of_write(client, user):
+    user_id, headers = user
+    created = [
+        add_transaction(client, headers, date(2024, month, 10), amount=month * 3, category=category)
+        for month in (1, 2, 3) for category in ("Rent", "Travel")
+    ]
+    assert _rollup(user_id) == _recomputed(user_id)
+
+    first, second, third = created[:3]
+    client.put(
+        f"/api/transactions/{first['id']}",
+        json={"date": "2023-12-31", "category": "Groceries", "type": "income", "amount": 7},
+        headers=headers,
+    )
+    assert _rollup(user_id) == _recomputed(user_id)
+
+    client.delete(f"/api/transactions/{second['id']}", headers=headers)
+    assert _rollup(user_id) == _recomputed(user_id)
+
+    client.patch(
+        "/api/transactions/batch",
+        json={"filter": {"category": "Travel"}, "patch": {"date": "2024-02-01"}},
+        headers=headers,
+    )
+    assert _rollup(user_id) == _recomputed(user_id)
+
+    client.post("/api/transactions/batch/delete", json={"ids": [third["id"]]}, headers=headers)
+    assert _rollup(user_id) == _recomputed(user_id)
+
+
+def test_summary_reads_the_rollup(client, user):
+    _user_id, headers = user
+    add_transaction(client, headers, date(2024, 3, 2), amount=100, type="income")
+    add_transaction(client, headers, date(2024, 3, 5), amount=30, category="Rent")
+    add_transaction(client, headers, date(2024, 2, 20), amount=20, category="Travel")
+    rent = add_transaction(client, headers, date(2024, 1, 7), amount=25, category="Rent")
+    client.put(f"/api/transactions/{rent['id']}", json={"amount": 5}, headers=headers)
+
+    summary = client.get(
+        "/api/transactions/summary", params={"as_of": "2024-03-10", "days": 10}, headers=headers
+    ).json()
+    assert summary == {
+        "total_income": 100.0,
+        "total_expenses": 55.0,
+        "monthly_income": 100.0,
+        "monthly_expenses": 30.0,
+        "top_spending_category": {"category": "Rent", "amount": 35.0},
+        "average_daily_spend": 3.0,
+    }
@@ -0,0 +1,91 @@
+import sqlite3
+from datetime import date
+
+from sqlalchemy import text
+
+from app import search
+from app.database import shard_engines
+from app.sharding import user_placement_sync
+
+from .conftest import add_transaction
+
+
+def _search(client, headers, query):
+    response = client.get("/api/transactions/search", params={"q": query}, headers=headers)
+    assert response.status_code == 200, response.text
+    return sorted(row["id"] for row in response.json())
+
+
+def _shard_path(user_id: int) -> str:
+    return shard_engines[user_placement_sync(user_id).shard].url.database
+
+
+def test_index_follows_writes(client, user):
+    _user_id, headers = user
+    ride = add_transaction(client, headers, date(2024, 7, 1), description="Uber ride")
+    rent = add_transaction(client, headers, date(2024, 7, 2), description="Rent July")
+    assert _search(client, headers, "ub") == [ride["id"]]
+
+    client.put(f"/api/transactions/{ride['id']}", json={"description": "Taxi"}, headers=headers)
+    assert _search(client, headers, "uber") == []
+    assert _search(client, headers, "taxi") == [ride["id"]]
+    client.put(f"/api/transactions/{ride['id']}", json={"amount": 5}, headers=headers)
+    assert _search(client, headers, "taxi") == [ride["id"]]
+
+    response = client.patch(
+        "/api/transactions/batch",
+        json={"ids": [ride["id"], rent["id"]], "patch": {"category": "Travel"}},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    assert _search(client, headers, "travel") == [ride["id"], rent["id"]]
+    assert _search(client, headers, "food") == []
+
+    client.delete(f"/api/transactions/{ride['id']}", headers=headers)
+    assert _search(client, headers, "taxi") == []
+    client.post("/api/transactions/batch/delete", json={"ids": [rent["id"]]}, headers=headers)
+    assert _search(client, headers, "rent") == []
+
+
+def test_other_writers_need_no_app_functions(client, user):
+    user_id, headers = user
+    kept = add_transaction(client, headers, date(2024, 8, 1), description="Coffee beans")
+    edited = add_transaction(client, headers, date(2024, 8, 2), description="Old name")
+    removed = add_transaction(client, headers, date(2024, 8, 3), description="Bakery")
+
+    connection = sqlite3.connect(_shard_path(user_id))
+    with connection:
+        connection.execute(
+            'UPDATE "transaction" SET description = ? WHERE id = ?',
+            ("Coffee grinder", edited["id"]),
+        )
+        connection.execute('DELETE FROM "transaction" WHERE id = ?', (removed["id"],))
+        columns = "amount, category_id, type, date, user_id, created_at, updated_at, change_seq"
+        connection.execute(
+            f'INSERT INTO "transaction" (description, {columns})'
+            f' SELECT ?, {columns} FROM "transaction" WHERE id = ?',
+            ("Coffee filters", kept["id"]),
+        )
+    connection.close()
+    assert _search(client, headers, "bakery") == []
+
+    search.rebuild(shard_engines[user_placement_sync(user_id).shard])
+    found = _search(client, headers, "coffee")
+    assert len(found) == 3 and kept["id"] in found and edited["id"] in found
+    assert _search(client, headers, "old") == []
+
+
+def test_install_drops_legacy_triggers(client, user):
+    user_id, _headers = user
+    engine = shard_engines[user_placement_sync(user_id).shard]
+    with engine.begin() as connection:
+        connection.execute(text(
+            f'CREATE TRIGGER {search.FTS_TABLE}_insert AFTER INSERT ON "transaction" BEGIN '
+            f"SELECT {search.TERMS_FUNCTION}(new.user_id, new.description); END"
+        ))
+    search.install(engine)
+    with engine.connect() as connection:
+        triggers = connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        ).all()
+    assert triggers == []
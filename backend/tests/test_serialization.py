@@ -0,0 +1,48 @@
+from datetime import date, datetime
+
+import pytest
+
+from app import serialization
+from app.models import GoalRead, TransactionRead, TransactionType
+
+from .conftest import add_transaction
+
+
+def test_stdlib_fallback_matches_orjson(monkeypatch):
+    pytest.importorskip("orjson")
+    payload = [{
+        "id": 1, "amount": 2.5, "description": "Café", "type": TransactionType.EXPENSE,
+        "date": date(2024, 1, 2), "created_at": datetime(2024, 1, 2, 3, 4, 5, 678),
+    }]
+    fast = serialization.dumps(payload)
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert serialization.dumps(payload) == fast
+
+
+def test_records_match_the_read_model(client, user):
+    _user_id, headers = user
+    add_transaction(client, headers, date(2024, 1, 2), amount=4)
+    client.post(
+        "/api/goals/", json={"name": "Bike", "target_amount": 300, "deadline": "2025-01-01"},
+        headers=headers,
+    )
+    transactions = client.get("/api/transactions/", headers=headers).json()
+    goals = client.get("/api/goals/", headers=headers).json()
+    assert transactions == [
+        TransactionRead.model_validate(row).model_dump(mode="json") for row in transactions
+    ]
+    assert goals == [GoalRead.model_validate(row).model_dump(mode="json") for row in goals]
+
+
+@pytest.mark.parametrize("path", ["/api/transactions/", "/api/goals/"])
+def test_columnar_format_carries_the_same_rows(client, user, path):
+    _user_id, headers = user
+    add_transaction(client, headers, date(2024, 1, 2))
+    add_transaction(client, headers, date(2024, 1, 3))
+    client.post(
+        "/api/goals/", json={"name": "Bike", "target_amount": 300, "deadline": "2025-01-01"},
+        headers=headers,
+    )
+    records = client.get(path, headers=headers).json()
+    columnar = client.get(path, params={"format": "columnar"}, headers=headers).json()
+    assert [dict(zip(columnar["columns"], row)) for row in columnar["rows"]] == records
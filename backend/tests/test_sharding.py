@@ -0,0 +1,88 @@
+from datetime import date
+
+from sqlalchemy import text
+
+from app import sharding
+from app.database import shard_engines
+
+from .conftest import add_transaction, sync_all
+
+
+def _set_next_transaction_id(shard: int, next_id: int) -> None:
+    with shard_engines[shard].begin() as connection:
+        connection.execute(text("DELETE FROM sqlite_sequence WHERE name = 'transaction'"))
+        connection.execute(
+            text("INSERT INTO sqlite_sequence (name, seq) VALUES ('transaction', :seq)"),
+            {"seq": next_id - 1},
+        )
+
+
+def _next_transaction_id(shard: int) -> int:
+    with shard_engines[shard].connect() as connection:
+        seq = connection.execute(
+            text("SELECT seq FROM sqlite_sequence WHERE name = 'transaction'")
+        ).scalar()
+    return (seq or 0) + 1
+
+
+def _apply(pages, rows=None, deletions_last=True):
+    """Replay sync pages like a client; by default deletions are applied after rows."""
+    rows = dict(rows or {})
+    for page in pages:
+        deleted = [entry["id"] for entry in page["deleted"] if entry["entity"] == "transaction"]
+        if not deletions_last:
+            for row_id in deleted:
+                rows.pop(row_id, None)
+        rows.update((row["id"], row) for row in page["transactions"])
+        if deletions_last:
+            for row_id in deleted:
+                rows.pop(row_id, None)
+    return rows
+
+
+def test_move_then_sync_keeps_rows_that_get_their_old_ids_back(client, user):
+    user_id, headers = user
+    source = sharding.user_placement_sync(user_id).shard
+    target = 1 - source
+    # Start past every id either shard has used, then have the target hand
+    # the same ids out again, as a shard without rows does
+    first_id = max(_next_transaction_id(shard) for shard in (0, 1)) + 1000
+    _set_next_transaction_id(source, first_id)
+    created = [add_transaction(client, headers, date(2024, 5, day)) for day in (1, 2, 3)]
+    synced_pages, cursor = sync_all(client, headers)
+    synced = _apply(synced_pages)
+    _set_next_transaction_id(target, first_id)
+
+    moved = sharding.move_users([(user_id, target)], settle_seconds=0)
+    assert moved == [(user_id, source, target, 3)]
+    listed = client.get("/api/transactions/", headers=headers).json()
+    assert sorted(row["id"] for row in listed) == [row["id"] for row in created]
+
+    expected = {row["id"]: row for row in listed}
+    for since, known in ((None, {}), (cursor, synced)):
+        for limit in (500, 1):
+            pages, _cursor = sync_all(client, headers, since=since, limit=limit)
+            for page in pages:
+                deleted = {entry["id"] for entry in page["deleted"]}
+                assert not deleted & {row["id"] for row in page["transactions"]}
+            for deletions_last in (True, False):
+                assert _apply(pages, known, deletions_last) == expected
+
+
+def test_move_renumbers_rows_taken_on_the_target(client, user):
+    user_id, headers = user
+    source = sharding.user_placement_sync(user_id).shard
+    target = 1 - source
+    created = [add_transaction(client, headers, date(2024, 6, day)) for day in (1, 2)]
+    _pages, cursor = sync_all(client, headers)
+
+    sharding.move_users([(user_id, target)], settle_seconds=0)
+    listed = client.get("/api/transactions/", headers=headers).json()
+    assert sorted(row["date"] for row in listed) == [row["date"] for row in created]
+
+    pages, _cursor = sync_all(client, headers, since=cursor)
+    old_ids = {row["id"] for row in created} - {row["id"] for row in listed}
+    assert {entry["id"] for page in pages for entry in page["deleted"]} == old_ids
+    assert _apply(pages, {row["id"]: row for row in created}) == {
+        row["id"]: row for row in listed
+    }
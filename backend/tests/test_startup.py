@@ -0,0 +1,36 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Loaded on first use only: by the routes that need them, or by deployments
+# that turn the feature on
+DEFERRED = (
+    "numpy", "jose", "app.analytics", "app.archive", "app.bulk",
+    "sqlalchemy.ext.asyncio", "sqlalchemy.dialects.postgresql",
+)
+
+
+def _imported(module: str, candidates) -> list:
+    """Those of `candidates` that a fresh interpreter has loaded after importing `module`."""
+    code = (
+        f"import json, sys; import {module}; "
+        f"print(json.dumps([name for name in {list(candidates)!r} if name in sys.modules]))"
+    )
+    environment = {**os.environ, "SPENDSHIFT_ASYNC_DATABASE": "false"}
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=environment,
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def test_a_worker_start_defers_optional_modules():
+    assert _imported("app.main", DEFERRED) == []
+
+
+def test_the_cli_does_not_build_the_web_app():
+    assert _imported("app.cli", ("app.main", "app.routes", "fastapi.routing")) == []
@@ -0,0 +1,88 @@
+from datetime import date
+
+from sqlalchemy import text
+
+from app.database import shard_engines
+from app.sharding import user_placement_sync
+
+from .conftest import add_transaction, sync_all
+
+
+def test_sync_reports_changes_and_deletions(client, user):
+    _user_id, headers = user
+    first = add_transaction(client, headers, date(2024, 3, 1))
+    second = add_transaction(client, headers, date(2024, 3, 2))
+    pages, cursor = sync_all(client, headers)
+    assert {row["id"] for page in pages for row in page["transactions"]} == {
+        first["id"], second["id"]
+    }
+
+    client.put(f"/api/transactions/{first['id']}", json={"amount": 99}, headers=headers)
+    client.delete(f"/api/transactions/{second['id']}", headers=headers)
+    [page], _cursor = sync_all(client, headers, since=cursor)
+    assert [row["amount"] for row in page["transactions"]] == [99]
+    assert page["deleted"] == [{"entity": "transaction", "id": second["id"]}]
+
+
+def test_sync_drops_tombstone_of_reused_id(client, user):
+    user_id, headers = user
+    add_transaction(client, headers, date(2024, 4, 1))
+    newest = add_transaction(client, headers, date(2024, 4, 2))
+    _pages, cursor = sync_all(client, headers)
+
+    client.delete(f"/api/transactions/{newest['id']}", headers=headers)
+    # Tables created before ids became AUTOINCREMENT hand the largest rowid
+    # out again once it is deleted
+    with shard_engines[user_placement_sync(user_id).shard].begin() as connection:
+        connection.execute(
+            text("UPDATE sqlite_sequence SET seq = :seq WHERE name = 'transaction'"),
+            {"seq": newest["id"] - 1},
+        )
+    reused = add_transaction(client, headers, date(2024, 4, 3), amount=42)
+    assert reused["id"] == newest["id"]
+
+    [page], _cursor = sync_all(client, headers, since=cursor)
+    assert [row["id"] for row in page["transactions"]] == [reused["id"]]
+    assert page["deleted"] == []
+
+    # Across pages the tombstone comes first and the row after it
+    pages, _cursor = sync_all(client, headers, since=cursor, limit=1)
+    assert pages[0]["deleted"] == [{"entity": "transaction", "id": newest["id"]}]
+    assert pages[1]["transactions"][0]["amount"] == 42
+
+
+def test_sync_clients_can_list_without_recurring_occurrences(client, user):
+    _user_id, headers = user
+    stored = add_transaction(client, headers, date(2024, 5, 2))
+    rule = client.post(
+        "/api/recurring/",
+        json={
+            "description": "Rent", "amount": 900, "category": "Rent", "type": "expense",
+            "frequency": "monthly", "start_date": "2024-01-01", "count": 3,
+        },
+        headers=headers,
+    ).json()
+    listed = client.get("/api/transactions/", headers=headers).json()
+    assert len([row for row in listed if row["id"] < 0]) == 3
+    listed = client.get(
+        "/api/transactions/", params={"occurrences": "false"}, headers=headers
+    ).json()
+    assert [row["id"] for row in listed] == [stored["id"]]
+    pages, cursor = sync_all(client, headers)
+    assert [row["id"] for page in pages for row in page["transactions"]] == [stored["id"]]
+
+    # An edited occurrence is stored, then listed and synced like any row
+    occurrence = min(row["id"] for row in client.get("/api/transactions/", headers=headers).json())
+    edited = client.put(
+        f"/api/transactions/{occurrence}", json={"amount": 950}, headers=headers
+    ).json()
+    assert edited["id"] > 0
+    [page], cursor = sync_all(client, headers, since=cursor)
+    assert [row["id"] for row in page["transactions"]] == [edited["id"]]
+    client.delete(f"/api/recurring/{rule['id']}", headers=headers)
+    listed = client.get(
+        "/api/transactions/", params={"occurrences": "false"}, headers=headers
+    ).json()
+    assert {row["id"] for row in listed} == {stored["id"], edited["id"]}
+    [page], _cursor = sync_all(client, headers, since=cursor)
+    assert page["transactions"] == [] and page["deleted"] == []
@@ -1,19 +1,24 @@
 import { useState, useEffect } from 'react';
 import { transactionsAPI } from '../../utils/api';
-import {
-  formatCurrency,
-  calculateTotalByType,
-  calculateMonthlyTotals,
-  calculateSavingsRate,
-  getTopSpendingCategory,
-  calculateAverageDailySpend,
-} from '../../utils/helpers';
+import { formatCurrency, calculateSavingsRate } from '../../utils/helpers';
 import TransactionList from '../TransactionList/TransactionList';
 import TransactionModal from '../TransactionModal/TransactionModal';
 import './Dashboard.css';
 
+const RECENT_TRANSACTIONS_LIMIT = 10;
+
+const EMPTY_SUMMARY = {
+  total_income: 0,
+  total_expenses: 0,
+  monthly_income: 0,
+  monthly_expenses: 0,
+  top_spending_category: null,
+  average_daily_spend: 0,
+};
+
 export default function Dashboard() {
   const [transactions, setTransactions] = useState([]);
+  const [summary, setSummary] = useState(EMPTY_SUMMARY);
   const [loading, setLoading] = useState(true);
   const [isModalOpen, setIsModalOpen] = useState(false);
   const [editingTransaction, setEditingTransaction] = useState(null);
@@ -25,8 +30,15 @@ export default function Dashboard() {
   const loadTransactions = async () => {
     try {
       setLoading(true);
-      const response = await transactionsAPI.list();
-      setTransactions(response.data);
+      // Figures are computed server-side; only the rows shown are downloaded
+      const now = new Date();
+      const asOf = `${now.getFullYear()}-${String(now.getMonth() + 1).padStart(2, '0')}-${String(now.getDate()).padStart(2, '0')}`;
+      const [listResponse, summaryResponse] = await Promise.all([
+        transactionsAPI.list({ limit: RECENT_TRANSACTIONS_LIMIT }),
+        transactionsAPI.summary({ as_of: asOf }),
+      ]);
+      setTransactions(listResponse.data);
+      setSummary(summaryResponse.data);
     } catch (error) {
       console.error('Failed to load transactions:', error);
     } finally {
@@ -78,15 +90,16 @@ export default function Dashboard() {
     }
   };
 
-  const monthlyTotals = calculateMonthlyTotals(transactions);
-  const totalIncome = calculateTotalByType(transactions, 'income');
-  const totalExpenses = calculateTotalByType(transactions, 'expense');
-  const balance = totalIncome - totalExpenses;
+  const monthlyTotals = {
+    income: summary.monthly_income,
+    expenses: summary.monthly_expenses,
+  };
+  const balance = summary.total_income - summary.total_expenses;
   const savingsRate = calculateSavingsRate(monthlyTotals.income, monthlyTotals.expenses);
-  const topCategory = getTopSpendingCategory(transactions);
-  const avgDailySpend = calculateAverageDailySpend(transactions);
+  const topCategory = summary.top_spending_category;
+  const avgDailySpend = summary.average_daily_spend;
 
-  const recentTransactions = transactions.slice(0, 10);
+  const recentTransactions = transactions;
 
   if (loading) {
     return (
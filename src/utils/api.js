@@ -61,10 +61,15 @@ export const authAPI = {
 
 // Transactions API
 export const transactionsAPI = {
-  list: () => api.get('/transactions'),
+  list: (params) => api.get('/transactions', { params }),
+  summary: (params) => api.get('/transactions/summary', { params }),
+  search: (params) => api.get('/transactions/search', { params }),
   create: (transaction) => api.post('/transactions', transaction),
   update: (id, transaction) => api.put(`/transactions/${id}`, transaction),
   delete: (id) => api.delete(`/transactions/${id}`),
+  // body: { ids: [...] } or { filter: {...} }, plus { patch: {...} } for updates
+  batchUpdate: (body) => api.patch('/transactions/batch', body),
+  batchDelete: (body) => api.post('/transactions/batch/delete', body),
 };
 
 // Goals API
@@ -73,6 +78,26 @@ export const goalsAPI = {
   create: (goal) => api.post('/goals', goal),
   update: (id, goal) => api.put(`/goals/${id}`, goal),
   delete: (id) => api.delete(`/goals/${id}`),
+  batchUpdate: (body) => api.patch('/goals/batch', body),
+  batchDelete: (body) => api.post('/goals/batch/delete', body),
+};
+
+// Recurring rules API: occurrences are listed as transactions with negative ids
+export const recurringAPI = {
+  list: () => api.get('/recurring'),
+  create: (rule) => api.post('/recurring', rule),
+  update: (id, rule) => api.put(`/recurring/${id}`, rule),
+  delete: (id) => api.delete(`/recurring/${id}`),
+};
+
+// Insights API
+export const insightsAPI = {
+  get: (params) => api.get('/insights', { params }),
+};
+
+// Delta sync API: pass the cursor of the previous page as `since`
+export const syncAPI = {
+  changes: (since, limit) => api.get('/sync', { params: { since, limit } }),
 };
 
 export default api;